@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+#  -*- coding: utf-8 -*-
+
+"""
+Script benchmarking the Near Earth Object database on synthetic data files.
+
+You can run from the commandline with: benchmark.py [args]
+Example: benchmark.py --sizes 10k 1M --repeat 5 --output bench.json
+
+The data files are generated by generate_data.py into --data_dir on first use and reused afterwards. Every case
+is run --repeat times and reported in seconds as the minimum, the median and all runs:
+- load_data of the csv file, of the csv file writing its snapshot, and of the snapshot
+- get_objects on a single date and on a date range, with the result cache disabled
+- get_objects on the date range with each combination of the diameter, distance and is_hazardous filters
+- NEOWriter output of the date range results in the display, csv_file and ndjson formats
+
+Results are written as JSON. With --baseline, cases slower than the baseline results by more than --tolerance
+are reported as regressions and the script exits with status 1.
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from database import NEODatabase
+from generate_data import generate, parse_size
+from search import Query, NEOSearcher
+from snapshot import snapshot_path
+from writer import NEOWriter
+
+# Filters combined by the filter cases
+Filters = {
+    'diameter': 'diameter:>:0.042',
+    'distance': 'distance:<:10000000',
+    'is_hazardous': 'is_hazardous:=:True',
+}
+
+SearchDate = '2020-01-01'
+SearchRange = ('2020-01-01', '2020-12-31')
+
+
+def timed(function, repeat):
+    """
+    :param function: function without arguments to time
+    :param repeat: int number of runs
+    :return: dict with the 'min', 'median' and all 'runs' times in seconds
+    """
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - start)
+    return {'min': min(runs), 'median': statistics.median(runs), 'runs': runs}
+
+
+def dataset(data_dir, size, seed):
+    """
+    :param data_dir: str directory of the generated data files
+    :param size: str preset size name or number of rows
+    :param seed: int seed of the generator
+    :return: str representing the pathway of the data file, generated when missing
+    """
+    filename = os.path.join(data_dir, f'neo_data_{size}_{seed}.csv')
+    if not os.path.exists(filename):
+        os.makedirs(data_dir, exist_ok=True)
+        generate(filename, parse_size(size), seed)
+    return filename
+
+
+def benchmark(filename, repeat=3):
+    """
+    Runs all benchmark cases on a data file.
+
+    :param filename: str representing the pathway of the csv data file
+    :param repeat: int number of runs of each case
+    :return: dict with the 'rows' and 'neos' of the data and the timings of each of its 'cases'
+    """
+    cases = {}
+    db = NEODatabase(filename)
+
+    cases['load_data csv'] = timed(lambda: db.load_data(snapshot=False), repeat)
+
+    def load_writing_snapshot():
+        if os.path.exists(snapshot_path(filename)):
+            os.remove(snapshot_path(filename))
+        db.load_data()
+
+    cases['load_data csv writing snapshot'] = timed(load_writing_snapshot, repeat)
+    cases['load_data snapshot'] = timed(db.load_data, repeat)
+
+    searcher = NEOSearcher(db, cache_size=0)
+
+    def search(**options):
+        query_selectors = Query(**options).build_query()
+        return lambda: searcher.get_objects(query_selectors)
+
+    cases['get_objects date'] = timed(search(date=SearchDate), repeat)
+    cases['get_objects range'] = timed(search(start_date=SearchRange[0], end_date=SearchRange[1]), repeat)
+    for count in range(1, len(Filters) + 1):
+        for names in itertools.combinations(Filters, count):
+            cases[f'get_objects range {"+".join(names)}'] = timed(search(
+                start_date=SearchRange[0], end_date=SearchRange[1], filter=[Filters[name] for name in names]
+            ), repeat)
+
+    results = search(start_date=SearchRange[0], end_date=SearchRange[1])()
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, 'w') as devnull:
+        for format in ('display', 'csv_file', 'ndjson'):
+            writer = NEOWriter(stream=devnull)
+            output = os.path.join(directory, f'results.{format}')
+            with contextlib.redirect_stdout(io.StringIO()):
+                cases[f'NEOWriter {format}'] = timed(
+                    lambda: writer.write(format, results, filename=output), repeat
+                )
+
+    return {'rows': len(db), 'neos': len(db.neo_names), 'cases': cases}
+
+
+def regressions(report, baseline, tolerance):
+    """
+    :param report: dict benchmark report
+    :param baseline: dict benchmark report to compare with
+    :param tolerance: float relative slowdown of the median time allowed
+    :return: list of str descriptions of the cases slower than the baseline
+    """
+    slower = []
+    for size, result in report['results'].items():
+        baseline_cases = baseline['results'].get(size, {}).get('cases', {})
+        for case, timing in result['cases'].items():
+            if case in baseline_cases:
+                ratio = timing['median'] / baseline_cases[case]['median']
+                if ratio > 1 + tolerance:
+                    slower.append(f'{size} {case}: {ratio:.2f}x the baseline median')
+    return slower
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Near Earth Objects (NEOs) Database benchmarks')
+    parser.add_argument('--sizes', nargs='+', default=['10k'],
+                        help='Sizes of the data files to benchmark, numbers of rows or preset sizes 10k, 1M, 10M')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the generated data files')
+    parser.add_argument('--repeat', type=int, default=3, help='Int representing the number of runs of each case')
+    parser.add_argument('--data_dir', type=str, default=os.path.join(tempfile.gettempdir(), 'neo_benchmark'),
+                        help='Directory the generated data files are kept in')
+    parser.add_argument('--output', type=str, default='benchmark.json', help='Name of the JSON results file')
+    parser.add_argument('--baseline', type=str, help='Name of a JSON results file to compare the results with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Relative slowdown of a median time reported as a regression')
+    args = parser.parse_args()
+
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'results': {},
+    }
+    for size in args.sizes:
+        print(f'Benchmarking {size} rows')
+        report['results'][size] = benchmark(dataset(args.data_dir, size, args.seed), args.repeat)
+        for case, timing in report['results'][size]['cases'].items():
+            print(f'  {case:<50} {timing["median"] * 1000:>12.3f} ms')
+
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
+    print(f'Results written to {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            slower = regressions(report, json.load(baseline_file), args.tolerance)
+        for regression in slower:
+            print(f'Regression: {regression}')
+        if slower:
+            sys.exit(1)
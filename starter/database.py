@@ -1,63 +1,1049 @@
-from models import OrbitPath, NearEarthObject
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter, namedtuple
+from itertools import accumulate, islice
+from operator import itemgetter
 import csv
+import datetime
+import io
+import os
+
+from exceptions import SnapshotError
+from instrumentation import METRICS
+from models import OrbitPath, NearEarthObject, date_to_ordinal, period_bounds
+from partitions import Granularities, orbit_partitions, partition_key, prune_partitions, read_manifest, write_manifest
+from planner import Statistics
+from snapshot import append_snapshot, appended_data, read_snapshot, snapshot_path, source_signature, write_snapshot
+
+
+# Per-orbit columns of a set of results, see NEODatabase.take_orbits. neo_ids and neo_names are indexed by the
+# 'neo' column, so names are not repeated per orbit.
+OrbitColumns = namedtuple('OrbitColumns', ['columns', 'neo_ids', 'neo_names'])
+
+
+class ValueIndex(object):
+    """
+    Object indexing a numeric column by value: the column values in sorted order, with the rows they belong to.
+    Threshold and equality lookups resolve to a contiguous slice of rows with binary searches.
+    """
+
+    def __init__(self, column):
+        """
+        :param column: array or memoryview of the values to index
+        """
+        self.rows = array('i', sorted(range(len(column)), key=column.__getitem__))
+        self.values = array('d', map(column.__getitem__, self.rows))
+
+    def search(self, operation, value):
+        """
+        Finds the rows whose value satisfies a comparison
+
+        :param operation: str one of '=', '>', '<', '>=', '<='
+        :param value: float value compared against
+        :return: array of the matching row ids, in value order
+        """
+        bounds = {
+            '=': (bisect_left(self.values, value), bisect_right(self.values, value)),
+            '>': (bisect_right(self.values, value), len(self.values)),
+            '>=': (bisect_left(self.values, value), len(self.values)),
+            '<': (0, bisect_left(self.values, value)),
+            '<=': (0, bisect_right(self.values, value)),
+        }
+        start, end = bounds[operation]
+        return self.rows[start:end]
+
+    def count(self, operation, value):
+        """
+        :return: int number of rows whose value satisfies the comparison, see search
+        """
+        return len(self.search(operation, value))
+
+    def extend(self, column, start):
+        """
+        Indexes the rows appended to the column from row start onwards: they are sorted by value on their own and
+        merged with the indexed values in one pass, copying the runs of indexed values between them as slices.
+
+        :param column: array or memoryview of the indexed values, including the appended rows
+        :param start: int first appended row
+        :return: None
+        """
+        values, rows = array('d'), array('i')
+        position = 0
+        for row in sorted(range(start, len(column)), key=column.__getitem__):
+            value = column[row]
+            # Appended rows come after the indexed rows of the same value, as in a stable sort of the column
+            end = bisect_right(self.values, value, position)
+            values.extend(self.values[position:end])
+            rows.extend(self.rows[position:end])
+            values.append(value)
+            rows.append(row)
+            position = end
+        values.extend(self.values[position:])
+        rows.extend(self.rows[position:])
+        self.values, self.rows = values, rows
+        return None
+
+
+class BitmapIndex(object):
+    """
+    Object indexing the hazardous flag of the date sorted rows as a packed bitmap, a Python int with bit i set
+    when row i is hazardous, so predicates combine with bitwise AND/OR before any row is touched.
+
+    Rows are bucketed per month of their close approach date, each bucket holding its first row and its number of
+    hazardous rows, so counts over whole months need no bitmap scan at all.
+    """
+
+    # Maps the 0/1 bytes of the hazard column to '0'/'1' characters
+    BitTable = bytes.maketrans(b'\x00\x01', b'01')
+
+    def __init__(self, hazards, dates):
+        """
+        :param hazards: array or memoryview of 0/1 hazard flags
+        :param dates: array or memoryview of date ordinals, sorted
+        """
+        self.size = 0
+        self.hazardous = 0
+        self.month_rows = array('i')
+        self.month_hazardous = array('i')
+        self.extend(hazards, dates, 0)
+
+    def extend(self, hazards, dates, start):
+        """
+        Indexes the rows appended from row start onwards, which must be dated on or after the indexed rows.
+
+        :param hazards: array or memoryview of 0/1 hazard flags, including the appended rows
+        :param dates: array or memoryview of date ordinals, sorted, including the appended rows
+        :param start: int first appended row, the number of rows already indexed
+        :return: None
+        """
+        self.size = len(hazards)
+        bits = bytes(hazards[start:]).translate(BitmapIndex.BitTable)[::-1]
+        if bits:
+            self.hazardous |= int(bits, 2) << start
+
+        # The last month bucket may grow, rebuild the buckets from its first row onwards
+        if len(self.month_rows) > 1:
+            start = self.month_rows[-2]
+            del self.month_rows[-2:]
+            del self.month_hazardous[-1:]
+        else:
+            start = 0
+            del self.month_rows[:]
+            del self.month_hazardous[:]
+
+        month = None
+        for ordinal in sorted(set(dates[start:])):
+            date = datetime.date.fromordinal(ordinal)
+            if (date.year, date.month) != month:
+                month = (date.year, date.month)
+                self.month_rows.append(bisect_left(dates, ordinal, start))
+        self.month_rows.append(self.size)
+        for bucket in range(len(self.month_hazardous), len(self.month_rows) - 1):
+            self.month_hazardous.append(
+                self.popcount(self.hazardous, self.month_rows[bucket], self.month_rows[bucket + 1])
+            )
+        return None
+
+    @staticmethod
+    def mask(start, end):
+        """
+        :return: int bitmap with the bits of rows start to end (exclusive) set
+        """
+        return ((1 << (end - start)) - 1) << start if end > start else 0
+
+    @staticmethod
+    def popcount(bitmap, start, end):
+        """
+        :return: int number of set bits of the bitmap in rows start to end (exclusive)
+        """
+        return bin((bitmap >> start) & ((1 << max(end - start, 0)) - 1)).count('1')
+
+    def bitmap(self, hazardous):
+        """
+        :param hazardous: bool flag value to select
+        :return: int bitmap of the rows with the flag value
+        """
+        if hazardous:
+            return self.hazardous
+        return self.hazardous ^ BitmapIndex.mask(0, self.size)
+
+    def count(self, hazardous, start, end):
+        """
+        Counts the rows with a flag value between two rows, from the month buckets and the partial months at the
+        edges.
+
+        :param hazardous: bool flag value to count
+        :param start: int first row
+        :param end: int row after the last row
+        :return: int number of rows
+        """
+        first = bisect_left(self.month_rows, start)
+        last = bisect_right(self.month_rows, end) - 1
+        if first >= last:
+            count = self.popcount(self.hazardous, start, end)
+        else:
+            count = sum(self.month_hazardous[first:last])
+            count += self.popcount(self.hazardous, start, self.month_rows[first])
+            count += self.popcount(self.hazardous, self.month_rows[last], end)
+        return count if hazardous else (end - start) - count
+
+    @staticmethod
+    def iter_rows(bitmap, start, end):
+        """
+        Lazily yields the rows whose bit is set between two rows, in row order
+
+        :param bitmap: int bitmap
+        :param start: int first row
+        :param end: int row after the last row
+        :return: generator of row ids
+        """
+        bits = bin((bitmap >> start) & ((1 << max(end - start, 0)) - 1))[:1:-1]
+        position = bits.find('1')
+        while position >= 0:
+            yield start + position
+            position = bits.find('1', position + 1)
 
 
 class NEODatabase(object):
     """
     Object to hold Near Earth Objects and their orbits.
 
-    To support optimized date searching, a dict mapping of all orbit date paths to the Near Earth Objects
-    recorded on a given day is maintained. Additionally, all unique instances of a Near Earth Object
-    are contained in a dict mapping the Near Earth Object name to the NearEarthObject instance.
+    Orbits are stored column-wise: every close approach (csv row) is one row across a set of typed arrays
+    in `columns`, keyed by the NearEarthObject/OrbitPath property each column holds. Names and ids of the
+    Near Earth Objects are interned once in the `neo_names`/`neo_ids` tables and rows refer to them through
+    the integer 'neo' column. NearEarthObject and OrbitPath instances are only created as lightweight views
+    over these columns, once results are handed out of the database.
+
+    To support optimized date searching, rows are kept sorted by their close approach date, encoded as an
+    ordinal, so any date range resolves to a contiguous slice of rows with two binary searches.
+
+    Each Near Earth Object is interned once by name, however many orbits it has. An index from each Near Earth
+    Object to the rows of all its orbits, in date order, is built the first time orbits are requested.
+
+    Secondary ValueIndexes on the IndexedColumns can optionally be built on load, to answer value threshold
+    filters without scanning a date range. A BitmapIndex of the hazardous flag is built when first needed.
+
+    After parsing a csv file, a binary snapshot of the columns is written next to it. Later loads memory-map
+    that snapshot instead of parsing the csv again, for as long as the csv file is unchanged. Columns loaded
+    from a snapshot are read-only memoryviews rather than arrays, until data is appended.
+
+    Further csv files, such as daily feed updates, can be appended to the loaded data with append_data, which
+    extends the columns, indexes and snapshot incrementally.
+
+    The loaded data can also be written as a partitioned dataset, one snapshot per year or month, see
+    partitions.py. load_partitions then only maps the partitions a search can find rows in, the database holding
+    no rows of the other partitions.
     """
 
+    # The csv columns decoded on load, all other attributes of a row are skipped
+    Fields = (
+        'id', 'name', 'close_approach_date', 'miss_distance_kilometers',
+        'estimated_diameter_min_kilometers', 'is_potentially_hazardous_asteroid',
+    )
+
+    # Number of csv rows parsed per chunk on load
+    ChunkSize = 64 * 1024
+
+    Columns = {
+        # Column name to array typecode
+        'neo': 'i',
+        'close_approach_date': 'i',
+        'miss_distance_kilometers': 'd',
+        'diameter_min_km': 'd',
+        'is_potentially_hazardous_asteroid': 'b',
+    }
+
+    # Columns that can be indexed by value
+    IndexedColumns = ('diameter_min_km', 'miss_distance_kilometers')
+
     def __init__(self, filename):
         """
         :param filename: str representing the pathway of the filename containing the Near Earth Object data
         """
-        # TODO: What data structures will be needed to store the NearEarthObjects and OrbitPaths?
-        # TODO: Add relevant instance variables for this.
         self.filename = filename
-        self.date_to_NEOs = {}
-        self.NEOs = {}
+        # Incremented whenever the data changes, so searchers can drop results cached on older data
+        self.generation = 0
+        self.reset()
 
-    def load_data(self, filename=None):
+    def reset(self):
         """
-        Loads data from a .csv file, instantiating Near Earth Objects and their OrbitPaths by:
-           - Storing a dict of orbit date to list of NearEarthObject instances
-           - Storing a dict of the Near Earth Object name to the single instance of NearEarthObject
+        Empties the database, dropping all columns, interned tables and indexes.
 
-        :param filename:
-        :return:
+        :return: None
+        """
+        self.columns = {name: array(typecode) for name, typecode in NEODatabase.Columns.items()}
+        self.neo_ids = []
+        self.neo_names = []
+        # Built on demand for data mapped from a snapshot, see get_name_index
+        self.name_to_index = {}
+        self.orbit_offsets = None
+        self.orbit_rows = None
+        self.value_indexes = {}
+        self.bitmap_index = None
+        self.statistics = None
+        # Tuple of (path, source signature) of the snapshot holding the same data, if any
+        self.snapshot = None
+        # Keys of the loaded partitions of a partitioned dataset, None when all data was loaded
+        self.partitions = None
+        # Tuple of (directory, manifest) of the partitioned dataset the partitions were loaded from
+        self.partitioned = None
+        # Names of the Near Earth Objects completed with their orbits from the other partitions, see fetch_orbits
+        self.fetched_neos = set()
+        self.generation += 1
+
+    def __len__(self):
+        return len(self.columns['neo'])
+
+    @METRICS.timed('database.load_data')
+    def load_data(self, filename=None, snapshot=True, workers=1, value_indexes=False):
+        """
+        Loads data from a .csv file into the database columns by:
+           - Streaming the file in chunks, appending every orbit as a row to the typed column arrays
+           - Interning each unique Near Earth Object name and id once, indexed by the name
+           - Sorting the rows by orbit date ordinal
+
+        Loading again replaces any previously loaded data. When snapshot is enabled, an up to date snapshot
+        of the csv file is used instead of parsing it, and a new snapshot is written otherwise.
+
+        :param filename: str representing the pathway of the csv file, defaults to the database filename
+        :param snapshot: bool whether to read and write the binary snapshot of the csv file
+        :param workers: int number of processes parsing the csv file, see load_csv
+        :param value_indexes: bool whether to build the ValueIndexes of the IndexedColumns
+        :return: None
         """
         if not (filename or self.filename):
             raise Exception('Cannot load data, no filename provided')
 
         filename = filename or self.filename
+        self.reset()
+
+        if not snapshot:
+            self.load_csv(filename, workers)
+        else:
+            self.load_cached(filename, workers)
+
+        if value_indexes:
+            self.index_values()
+        return None
+
+    def load_cached(self, filename, workers=1):
+        """
+        Loads the up to date snapshot of a .csv file, or parses the file and writes its snapshot.
+
+        A snapshot holding rows appended to the data, see append_data, is never replaced: when it no longer
+        matches the csv file, the load fails instead of dropping the appended rows.
+
+        :param filename: str representing the pathway of the csv file
+        :param workers: int number of processes parsing the csv file, see load_csv
+        :return: None
+        :raises SnapshotError: when the snapshot cannot be used and holds appended rows
+        """
+        signature = source_signature(filename)
+        path = snapshot_path(filename)
+        try:
+            self.map_snapshot(path, signature)
+            self.snapshot = (path, signature)
+            return None
+        except SnapshotError as e:
+            appended = appended_data(path)
+            if appended:
+                raise SnapshotError(
+                    f'{e}, but it holds the rows appended from {", ".join(appended)}, which are not in {filename}. '
+                    f'Move the snapshot away to load {filename} alone'
+                )
+
+        self.load_csv(filename, workers)
+        try:
+            self.index_orbits()
+            with METRICS.timer('database.write_snapshot'):
+                write_snapshot(
+                    path, signature, self.columns, self.neo_ids, self.neo_names, self.get_statistics().to_dict(),
+                    self.orbit_index()
+                )
+            self.snapshot = (path, signature)
+        except OSError:
+            # The snapshot is only a cache, a read-only data directory must not fail the load
+            pass
+
+        return None
+
+    def load_dataset(self, path, value_indexes=False):
+        """
+        Opens a snapshot as a read-only dataset, without its source csv file, e.g. a snapshot shared by several
+        searcher processes. Nothing is read until queries touch it, the pages of the mapping are shared with
+        every other process mapping the same file. Appending rows copies the data into the process first.
+
+        :param path: str representing the pathway of the snapshot
+        :param value_indexes: bool whether to build the ValueIndexes of the IndexedColumns
+        :return: None
+        """
+        self.reset()
+        self.map_snapshot(path)
+        if value_indexes:
+            self.index_values()
+        return None
+
+    @METRICS.timed('database.load_partitions')
+    def load_partitions(self, directory, date_range=None, filters=(), value_indexes=False):
+        """
+        Loads the partitions of a partitioned dataset that a search can find rows in, see write_partitions. A
+        single partition is memory-mapped like load_dataset, several partitions are copied into the columns in
+        date order.
+
+        Near Earth Objects only carry the orbits of the loaded partitions, searches returning NEOs with all of
+        their orbits complete their results with fetch_orbits.
+
+        :param directory: str representing the pathway of the partitioned dataset
+        :param date_range: tuple of (start, end) date ordinals searched, either bound may be None, None for all dates
+        :param filters: list of Filters of the search, partitions with no row matching all of them are skipped
+        :param value_indexes: bool whether to build the ValueIndexes of the IndexedColumns
+        :return: list of str keys of the loaded partitions
+        :raises SnapshotError: when the manifest or a partition cannot be used
+        """
+        self.reset()
+        manifest = read_manifest(directory)
+        partitions = prune_partitions(manifest, date_range, filters)
+        METRICS.count('database.partitions_loaded', len(partitions))
+        METRICS.count('database.partitions_pruned', len(manifest['partitions']) - len(partitions))
+
+        if len(partitions) == 1:
+            self.map_snapshot(os.path.join(directory, partitions[0]['file']))
+        else:
+            for partition in partitions:
+                snapshot = read_snapshot(os.path.join(directory, partition['file']))
+                self.merge(snapshot.columns, snapshot.neo_ids, snapshot.neo_names)
+
+        self.partitions = [partition['key'] for partition in partitions]
+        self.partitioned = (directory, manifest)
+        if value_indexes:
+            self.index_values()
+        return self.partitions
+
+    @METRICS.timed('database.fetch_orbits')
+    def fetch_orbits(self, rows):
+        """
+        Completes the Near Earth Objects of search results on a partitioned dataset with their orbits from the
+        partitions that were not loaded, see load_partitions. Only the orbit rows of these NEOs are read, through
+        the orbit index of each partition listed for them in the manifest, and merged into the columns in date
+        order, which renumbers the rows.
+
+        :param rows: iterable of int result rows
+        :return: list of int the result rows, renumbered in the completed data
+        """
+        rows = list(rows)
+        if self.partitions is None:
+            return rows
+
+        neo_column = self.columns['neo']
+        names = {self.neo_names[neo_column[row]] for row in rows} - self.fetched_neos
+        directory, manifest = self.partitioned
+        missing = orbit_partitions(manifest, names, self.partitions)
+        self.fetched_neos.update(names)
+        if not missing:
+            return rows
+
+        self.make_writable()
+        for partition, partition_names in missing:
+            source = NEODatabase(self.filename)
+            source.map_snapshot(os.path.join(directory, partition['file']))
+            name_to_index = source.get_name_index()
+            orbit_rows = sorted(
+                row for name in partition_names for row in source.get_orbit_rows(name_to_index[name])
+            )
+            METRICS.count('database.orbits_fetched', len(orbit_rows))
+            orbits = source.take_orbits(orbit_rows, all_orbits=False)
+            self.merge(orbits.columns, orbits.neo_ids, orbits.neo_names)
+
+        value_indexes = bool(self.value_indexes)
+        order = self.sort_by_date()
+        self.orbit_offsets = self.orbit_rows = None
+        self.statistics = None
+        self.generation += 1
+        if value_indexes:
+            self.index_values()
+        if order is None:
+            return rows
+        renumbered = array('i', [0]) * len(order)
+        for new_row, row in enumerate(order):
+            renumbered[row] = new_row
+        return [renumbered[row] for row in rows]
+
+    @METRICS.timed('database.write_partitions')
+    def write_partitions(self, directory, granularity='year'):
+        """
+        Writes the loaded data as a partitioned dataset: one snapshot per calendar year or month of close approach
+        dates, holding only the Near Earth Objects of its rows, and a manifest with the Statistics of each
+        partition. The rows of each partition are contiguous, as the rows are kept in date order. The manifest
+        also lists the partitions holding the orbits of each Near Earth Object found in several, see fetch_orbits.
+
+        :param directory: str representing the pathway of the partitioned dataset, created when missing
+        :param granularity: str one of partitions.Granularities
+        :return: list of dict partition descriptions written to the manifest
+        """
+        if granularity not in Granularities:
+            raise ValueError(f'Unsupported partition granularity: {granularity}')
+        os.makedirs(directory, exist_ok=True)
+
+        dates = self.columns['close_approach_date']
+        neos = self.columns['neo']
+        partitions = []
+        # Keys of the partitions holding orbits of each Near Earth Object
+        holders = {}
+        start = 0
+        while start < len(self):
+            period, next_period = period_bounds(dates[start], granularity)
+            stop = bisect_left(dates, next_period, start)
+            key = partition_key(period, granularity)
+            partition = self.partition(start, stop)
+            partition.index_orbits()
+            statistics = partition.get_statistics().to_dict()
+            write_snapshot(
+                os.path.join(directory, f'neo_{key}.snapshot'), None, partition.columns, partition.neo_ids,
+                partition.neo_names, statistics, partition.orbit_index()
+            )
+            partitions.append({
+                'key': key, 'file': f'neo_{key}.snapshot', 'start': dates[start], 'end': dates[stop - 1],
+                'rows': stop - start, 'statistics': statistics,
+            })
+            for neo in set(neos[start:stop]):
+                holders.setdefault(neo, []).append(key)
+            start = stop
+
+        orbits = {self.neo_names[neo]: keys for neo, keys in holders.items() if len(keys) > 1}
+        source = source_signature(self.filename) if self.filename and os.path.exists(self.filename) else None
+        write_manifest(directory, granularity, source, partitions, orbits)
+        return partitions
+
+    def partition(self, start, stop):
+        """
+        Copies a slice of rows into a database of their own, interning only the Near Earth Objects they refer to.
+
+        :param start: int first row
+        :param stop: int row after the last row
+        :return: NEODatabase
+        """
+        partition = NEODatabase(self.filename)
+        local = {}
+        partition.columns['neo'].extend(local.setdefault(neo, len(local)) for neo in self.columns['neo'][start:stop])
+        for name, column in self.columns.items():
+            if name != 'neo':
+                partition.columns[name].extend(column[start:stop])
+        partition.neo_ids = [self.neo_ids[neo] for neo in local]
+        partition.neo_names = [self.neo_names[neo] for neo in local]
+        partition.name_to_index = dict(zip(partition.neo_names, range(len(partition.neo_names))))
+        return partition
+
+    @METRICS.timed('database.map_snapshot')
+    def map_snapshot(self, path, signature=None):
+        """
+        Maps the columns, string tables, orbit index and statistics of a snapshot.
+
+        :param path: str representing the pathway of the snapshot
+        :param signature: dict source signature the snapshot must match, None to use it as is
+        :return: None
+        :raises SnapshotError: when the snapshot cannot be used
+        """
+        snapshot = read_snapshot(path, signature)
+        self.columns, self.neo_ids, self.neo_names = snapshot.columns, snapshot.neo_ids, snapshot.neo_names
+        self.name_to_index = None
+        self.statistics = snapshot.statistics and Statistics.from_dict(snapshot.statistics)
+        if 'orbit_offsets' in snapshot.indexes and 'orbit_rows' in snapshot.indexes:
+            self.orbit_offsets = snapshot.indexes['orbit_offsets']
+            self.orbit_rows = snapshot.indexes['orbit_rows']
+        return None
 
-        # TODO: Load data from csv file.
-        # TODO: Where will the data be stored?
-        with open(filename) as csv_file:
-            reader = csv.DictReader(csv_file)
-            for row in reader:
-                # List version of the row
-                attributes_list = list(row.items())
-                # Dict version of the row
-                attributes_dict = dict(attributes_list)
-                NEO = NearEarthObject(**attributes_dict)
-                orbit = OrbitPath(**attributes_dict)
-                NEO.update_orbits(orbit)
-                # Getting the close approach date of this orbit
-                orbit_date = orbit.close_approach_date
-                if self.date_to_NEOs.get(orbit_date) is None:
-                    self.date_to_NEOs[f'{orbit_date}'] = [NEO]
-                else:
-                    self.date_to_NEOs[f'{orbit_date}'].append(NEO)
-
-                # Making sure only unique objects are contained 
-                if self.NEOs.get(NEO.name) is None:
-                    self.NEOs[NEO.name] = NEO
-                else:
-                    pass
+    @METRICS.timed('database.append_data')
+    def append_data(self, filename, snapshot=True):
+        """
+        Appends the orbits of a .csv file, e.g. a daily feed update, to the loaded data:
+           - Rows of orbits already in the database, with the same NEO name and date, are skipped
+           - Orbits of known Near Earth Objects are merged into them by name, new ones are interned
+           - When all new rows are dated on or after the last loaded row, the columns, the value and bitmap
+             indexes, the statistics and the snapshot the data was loaded from are extended in place.
+             Otherwise the rows are sorted again and the indexes and snapshot rebuilt.
+
+        Appended rows are never written to the csv file the data was loaded from, they are only kept by its
+        snapshot, see load_cached. Data loaded without the snapshot, from a dataset or from partitions, only holds
+        them in memory, and loads that skip the snapshot do not see them. A snapshot holding appended rows is not
+        rebuilt once its csv file changes, the load fails until the snapshot is moved away.
+
+        :param filename: str representing the pathway of the csv file to append
+        :param snapshot: bool whether to update the snapshot the data was loaded from
+        :return: int number of appended rows
+        """
+        delta = NEODatabase(filename)
+        delta.load_csv(filename)
+        delta_neos = delta.columns['neo']
+        delta_dates = delta.columns['close_approach_date']
+        keep = [
+            row for row in range(len(delta))
+            if not self.has_orbit(delta.neo_names[delta_neos[row]], delta_dates[row])
+        ]
+        if not keep:
+            return 0
+
+        # Only pass on the Near Earth Objects of the kept rows, so no NEO is interned without orbits
+        used = sorted(set(map(delta_neos.__getitem__, keep)))
+        compact = dict(zip(used, range(len(used))))
+        columns = {
+            name: array(column.typecode, map(column.__getitem__, keep)) for name, column in delta.columns.items()
+        }
+        columns['neo'] = array('i', map(compact.__getitem__, columns['neo']))
+
+        start, neo_start = len(self), len(self.neo_names)
+        in_order = not start or delta_dates[keep[0]] >= self.columns['close_approach_date'][start - 1]
+        self.make_writable()
+        self.merge(columns, [delta.neo_ids[neo] for neo in used], [delta.neo_names[neo] for neo in used])
+        self.generation += 1
+
+        if in_order:
+            self.extend_orbits(start)
+            for name, index in self.value_indexes.items():
+                index.extend(self.columns[name], start)
+            if self.bitmap_index is not None:
+                self.bitmap_index.extend(
+                    self.columns['is_potentially_hazardous_asteroid'], self.columns['close_approach_date'], start
+                )
+            if self.statistics is not None:
+                self.statistics.extend(self, start)
+        else:
+            value_indexes = bool(self.value_indexes)
+            self.sort_by_date()
+            self.orbit_offsets = self.orbit_rows = None
+            self.statistics = None
+            if value_indexes:
+                self.index_values()
+
+        if snapshot and self.snapshot is not None:
+            self.update_snapshot(start if in_order else None, neo_start, filename)
+        return len(keep)
+
+    def has_orbit(self, name, date):
+        """
+        :param name: str Near Earth Object name
+        :param date: int close approach date ordinal
+        :return: bool whether an orbit of the Near Earth Object on the date is loaded
+        """
+        neo = self.get_name_index().get(name)
+        if neo is None:
+            return False
+        neos = self.columns['neo']
+        return any(neos[row] == neo for row in self.search_dates(date, date))
+
+    def make_writable(self):
+        """
+        Copies any read-only memoryview columns and string tables mapped from a snapshot into arrays and lists.
+
+        :return: None
+        """
+        for name, column in self.columns.items():
+            if isinstance(column, memoryview):
+                self.columns[name] = array(column.format)
+                self.columns[name].frombytes(column.cast('B'))
+        self.get_name_index()
+        self.neo_ids = list(self.neo_ids)
+        self.neo_names = list(self.neo_names)
+        return None
+
+    @METRICS.timed('database.update_snapshot')
+    def update_snapshot(self, start, neo_start, appended):
+        """
+        Brings the snapshot the data was loaded from up to date with appended rows, together with the orbit index
+        of all rows. The snapshot is written again once appends left it with more unused than used space.
+
+        :param start: int first appended row when rows were appended in place, None to rewrite the snapshot
+        :param neo_start: int first Near Earth Object interned by the appended rows
+        :param appended: str description of the appended data
+        :return: None
+        """
+        path, signature = self.snapshot
+        statistics = self.get_statistics().to_dict()
+        if self.orbit_offsets is None:
+            self.index_orbits()
+        try:
+            rewrite = start is None
+            if not rewrite:
+                columns = {name: column[start:] for name, column in self.columns.items()}
+                rewrite = append_snapshot(
+                    path, signature, columns, self.neo_ids[neo_start:], self.neo_names[neo_start:],
+                    statistics, appended, self.orbit_index()
+                )
+            if rewrite:
+                # The rewritten snapshot still lists all appended data, see load_cached
+                history = appended_data(path) + ([appended] if start is None else [])
+                write_snapshot(
+                    path, signature, self.columns, self.neo_ids, self.neo_names, statistics, self.orbit_index(),
+                    history
+                )
+        except (OSError, SnapshotError):
+            # The snapshot no longer matches the data, it is rebuilt by the next load
+            self.snapshot = None
+        return None
+
+    def get_statistics(self):
+        """
+        :return: Statistics of the columns, collected when first needed after the data changed
+        """
+        if self.statistics is None:
+            self.statistics = Statistics.collect(self)
+        return self.statistics
+
+    def get_name_index(self):
+        """
+        :return: dict of Near Earth Object name to its interned index, built when first needed
+        """
+        if self.name_to_index is None:
+            self.name_to_index = dict(zip(self.neo_names, range(len(self.neo_names))))
+        return self.name_to_index
+
+    def get_bitmap_index(self):
+        """
+        :return: BitmapIndex of the hazardous flag, built when first needed after the data changed
+        """
+        if self.bitmap_index is None:
+            with METRICS.timer('database.index_bitmap'):
+                self.bitmap_index = BitmapIndex(
+                    self.columns['is_potentially_hazardous_asteroid'], self.columns['close_approach_date']
+                )
+        return self.bitmap_index
+
+    @METRICS.timed('database.index_values')
+    def index_values(self):
+        """
+        Builds a ValueIndex for each of the IndexedColumns.
+
+        :return: None
+        """
+        self.value_indexes = {name: ValueIndex(self.columns[name]) for name in NEODatabase.IndexedColumns}
+        return None
+
+    @METRICS.timed('database.load_csv')
+    def load_csv(self, filename, workers=1):
+        """
+        Parses a .csv file into the (empty) database columns, sorts them by date and collects their Statistics.
+
+        The file is streamed in chunks of ChunkSize rows. Only the Fields columns of each row are decoded and
+        appended straight into the typed columns, so memory use stays near the size of the loaded columns.
+
+        With more than one worker, the file is split at newline boundaries into one byte range per worker and
+        the ranges are parsed in parallel processes, then merged in file order, deduplicating the Near Earth
+        Objects by name. Rows must not contain quoted newlines for the split to be valid.
+
+        :param filename: str representing the pathway of the csv file
+        :param workers: int number of processes parsing the csv file
+        :return: None
+        """
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                ranges = split_ranges(filename, workers)
+                parts = executor.map(parse_range, [filename] * len(ranges), ranges)
+                for columns, neo_ids, neo_names in parts:
+                    self.merge(columns, neo_ids, neo_names)
+        else:
+            with open(filename, newline='') as csv_file:
+                self.read_rows(csv.reader(csv_file))
+
+        METRICS.count('database.rows_parsed', len(self))
+        self.sort_by_date()
+        with METRICS.timer('database.collect_statistics'):
+            self.statistics = Statistics.collect(self)
+        return None
+
+    @METRICS.timed('database.read_rows')
+    def read_rows(self, reader):
+        """
+        Appends the rows of a csv reader to the columns, in chunks of ChunkSize rows
+
+        :param reader: csv.reader positioned at the header row
+        :return: None
+        """
+        get_fields = NEODatabase.field_getter(next(reader, []))
+        while True:
+            chunk = list(map(get_fields, islice(reader, NEODatabase.ChunkSize)))
+            if not chunk:
+                break
+            self.append_chunk(*zip(*chunk))
+        return None
+
+    def merge(self, columns, neo_ids, neo_names):
+        """
+        Appends the rows of another set of columns, remapping its Near Earth Objects onto the interned ones
+
+        :param columns: dict of column name to array, with the 'neo' column indexing neo_names
+        :param neo_ids: list of str Near Earth Object ids of the other columns
+        :param neo_names: list of str Near Earth Object names of the other columns
+        :return: None
+        """
+        remap = array('i')
+        name_to_index = self.get_name_index()
+        for name, neo_id in zip(neo_names, neo_ids):
+            neo = name_to_index.get(name)
+            if neo is None:
+                neo = name_to_index[name] = len(self.neo_names)
+                self.neo_names.append(name)
+                self.neo_ids.append(neo_id)
+            remap.append(neo)
+
+        for name, column in columns.items():
+            if name == 'neo':
+                column = map(remap.__getitem__, column)
+            self.columns[name].extend(column)
+        return None
+
+    @staticmethod
+    def field_getter(header):
+        """
+        Builds a getter picking the Fields columns out of a csv row, in Fields order
+
+        :param header: list of str csv column names
+        :return: operator.itemgetter over a csv row
+        """
+        missing = [field for field in NEODatabase.Fields if field not in header]
+        if missing:
+            raise Exception(f'Cannot load data, missing columns: {", ".join(missing)}')
+        return itemgetter(*(header.index(field) for field in NEODatabase.Fields))
 
+    def append_chunk(self, ids, names, dates, distances, diameters, hazards):
+        """
+        Appends a chunk of raw csv values to the columns, interning the names and ids of new Near Earth Objects
+
+        :param ids: sequence of str Near Earth Object ids
+        :param names: sequence of str Near Earth Object names
+        :param dates: sequence of str close approach dates in %Y-%m-%d format
+        :param distances: sequence of str miss distances in kilometers
+        :param diameters: sequence of str minimum diameters in kilometers
+        :param hazards: sequence of str 'True'/'False' hazard flags
+        :return: None
+        """
+        name_to_index = self.name_to_index
+        neos = self.columns['neo']
+        for name, neo_id in zip(names, ids):
+            neo = name_to_index.get(name)
+            if neo is None:
+                # First time this Near Earth Object is seen, intern its name and id
+                neo = name_to_index[name] = len(self.neo_names)
+                self.neo_names.append(name)
+                self.neo_ids.append(neo_id)
+            neos.append(neo)
+
+        # Approach dates repeat heavily, decode each distinct date once
+        ordinals = {date: date_to_ordinal(date) for date in set(dates)}
+        self.columns['close_approach_date'].extend(map(ordinals.__getitem__, dates))
+        self.columns['miss_distance_kilometers'].extend(map(float, distances))
+        self.columns['diameter_min_km'].extend(map(float, diameters))
+        self.columns['is_potentially_hazardous_asteroid'].extend(map('True'.__eq__, hazards))
         return None
+
+    @METRICS.timed('database.sort_by_date')
+    def sort_by_date(self):
+        """
+        Stable sorts all columns by the close approach date ordinal, keeping the file order within a day.
+        Data that is already in date order is left untouched.
+
+        :return: list of int previous row of each row, None when the data was already in date order
+        """
+        dates = self.columns['close_approach_date']
+        if all(dates[i] <= dates[i + 1] for i in range(len(dates) - 1)):
+            return None
+
+        order = sorted(range(len(dates)), key=dates.__getitem__)
+        for name, column in self.columns.items():
+            self.columns[name] = array(column.typecode, map(column.__getitem__, order))
+        self.orbit_offsets = self.orbit_rows = None
+        self.value_indexes = {}
+        self.bitmap_index = None
+        return order
+
+    def search_dates(self, start_date, end_date):
+        """
+        Finds the rows with a close approach date in the inclusive [start_date, end_date] interval
+
+        :param start_date: int ordinal of the first date
+        :param end_date: int ordinal of the last date
+        :return: range of orbit row ids
+        """
+        dates = self.columns['close_approach_date']
+        return range(bisect_left(dates, start_date), bisect_right(dates, end_date))
+
+    @METRICS.timed('database.index_orbits')
+    def index_orbits(self):
+        """
+        Builds the index of orbit rows per Near Earth Object: the rows of NEO i are
+        orbit_rows[orbit_offsets[i]:orbit_offsets[i + 1]], in date order.
+
+        Searcher threads may build the index concurrently: orbit_offsets is only published once orbit_rows is
+        set, as get_orbit_rows checks orbit_offsets alone.
+
+        :return: None
+        """
+        neos = self.columns['neo']
+        counts = Counter(neos)
+        orbit_offsets = array('i', accumulate([0] + [counts[neo] for neo in range(len(self.neo_names))]))
+        # Stable sort, so rows stay in date order within each Near Earth Object
+        self.orbit_rows = array('i', sorted(range(len(neos)), key=neos.__getitem__))
+        self.orbit_offsets = orbit_offsets
+        return None
+
+    def extend_orbits(self, start):
+        """
+        Adds the rows appended from row start onwards to the orbit index, if it is built. Appended rows are dated
+        on or after the indexed rows, so they go after the indexed rows of their Near Earth Object: the index is
+        merged with them in one pass, copying the rows of the NEOs in between as slices, without sorting again.
+
+        :param start: int first appended row
+        :return: None
+        """
+        orbit_offsets = self.orbit_offsets
+        if orbit_offsets is None:
+            return None
+
+        neos = self.columns['neo']
+        added = {}
+        for row in range(start, len(neos)):
+            added.setdefault(neos[row], []).append(row)
+
+        # The index may be mapped from a snapshot, slices of its rows are copied as bytes
+        indexed_rows = memoryview(self.orbit_rows)
+        indexed = len(orbit_offsets) - 1
+        counts = [orbit_offsets[neo + 1] - orbit_offsets[neo] for neo in range(indexed)]
+        counts.extend([0] * (len(self.neo_names) - indexed))
+        orbit_rows = array('i')
+        position = 0
+        for neo in sorted(added):
+            # Rows of NEOs interned by the append go after all indexed rows
+            end = orbit_offsets[neo + 1] if neo < indexed else len(indexed_rows)
+            orbit_rows.frombytes(indexed_rows[position:end].cast('B'))
+            orbit_rows.extend(added[neo])
+            counts[neo] += len(added[neo])
+            position = end
+        orbit_rows.frombytes(indexed_rows[position:].cast('B'))
+
+        # Published in the same order as by index_orbits
+        self.orbit_rows = orbit_rows
+        self.orbit_offsets = array('i', accumulate([0] + counts))
+        return None
+
+    def orbit_index(self):
+        """
+        :return: dict of the orbit index arrays, stored in snapshots so mapped data does not rebuild it
+        """
+        return {'orbit_offsets': self.orbit_offsets, 'orbit_rows': self.orbit_rows}
+
+    def get_orbit_rows(self, neo):
+        """
+        :param neo: int index of the Near Earth Object
+        :return: array of the rows of all orbits of the Near Earth Object, in date order
+        """
+        orbit_offsets = self.orbit_offsets
+        if orbit_offsets is None:
+            self.index_orbits()
+            orbit_offsets = self.orbit_offsets
+        return self.orbit_rows[orbit_offsets[neo]:orbit_offsets[neo + 1]]
+
+    def get_orbit(self, row):
+        """
+        Creates an OrbitPath view of a single row.
+
+        :param row: int index of the orbit row
+        :return: OrbitPath
+        """
+        neo = self.columns['neo'][row]
+        return OrbitPath(
+            neo_id=self.neo_ids[neo],
+            name=self.neo_names[neo],
+            close_approach_date=self.columns['close_approach_date'][row],
+            miss_distance_kilometers=self.columns['miss_distance_kilometers'][row],
+            is_potentially_hazardous_asteroid=self.columns['is_potentially_hazardous_asteroid'][row],
+            estimated_diameter_min_kilometers=self.columns['diameter_min_km'][row],
+        )
+
+    def get_neo(self, row):
+        """
+        Creates a NearEarthObject view of the Near Earth Object recorded on a row, with all of its orbits.
+
+        :param row: int index of the orbit row
+        :return: NearEarthObject
+        """
+        neo = self.columns['neo'][row]
+        NEO = NearEarthObject(
+            id=self.neo_ids[neo],
+            name=self.neo_names[neo],
+            is_potentially_hazardous_asteroid=self.columns['is_potentially_hazardous_asteroid'][row],
+            estimated_diameter_min_kilometers=self.columns['diameter_min_km'][row],
+            miss_distance_kilometers=self.columns['miss_distance_kilometers'][row],
+        )
+        for orbit_row in self.get_orbit_rows(neo):
+            NEO.update_orbits(self.get_orbit(orbit_row))
+        return NEO
+
+    @METRICS.timed('database.take_orbits')
+    def take_orbits(self, rows, all_orbits=True):
+        """
+        Gathers the columns of a set of result rows, without creating any NearEarthObject or OrbitPath views.
+
+        :param rows: iterable of int result rows
+        :param all_orbits: bool whether each row stands for a Near Earth Object, expanded to all of its orbits,
+                           or for the single orbit recorded on it
+        :return: OrbitColumns of typed arrays with one entry per orbit, and tables of only the Near Earth Objects
+                 of the orbits
+        """
+        if all_orbits:
+            neo_column = self.columns['neo']
+            orbit_rows = array('i')
+            for row in rows:
+                orbit_rows.extend(self.get_orbit_rows(neo_column[row]))
+        else:
+            orbit_rows = rows
+
+        columns = {
+            name: array(typecode, map(self.columns[name].__getitem__, orbit_rows))
+            for name, typecode in NEODatabase.Columns.items() if name != 'neo'
+        }
+        # Number the Near Earth Objects of the orbits from 0, in order of appearance, as in partition
+        local = {}
+        neo_column = self.columns['neo']
+        columns['neo'] = array('i', (local.setdefault(neo_column[row], len(local)) for row in orbit_rows))
+        return OrbitColumns(
+            columns, [self.neo_ids[neo] for neo in local], [self.neo_names[neo] for neo in local]
+        )
+
+
+def split_ranges(filename, parts):
+    """
+    Splits a csv file into byte ranges starting and ending at newline boundaries.
+
+    :param filename: str representing the pathway of the csv file
+    :param parts: int maximum number of ranges
+    :return: list of (start, end) byte offsets, each range preceded by the header row
+    """
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as csv_file:
+        csv_file.readline()
+        boundaries = [csv_file.tell()]
+        for part in range(1, parts):
+            csv_file.seek(max(boundaries[-1], size * part // parts))
+            csv_file.readline()
+            boundaries.append(min(csv_file.tell(), size))
+        boundaries.append(size)
+
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+
+
+def parse_range(filename, byte_range):
+    """
+    Parses the header and one byte range of a csv file into typed columns, run in a worker process.
+
+    :param filename: str representing the pathway of the csv file
+    :param byte_range: tuple of (start, end) byte offsets at newline boundaries
+    :return: tuple of (dict of column name to array, list of neo ids, list of neo names)
+    """
+    start, end = byte_range
+    with open(filename, 'rb') as csv_file:
+        header = csv_file.readline()
+        csv_file.seek(start)
+        data = csv_file.read(end - start)
+
+    db = NEODatabase(filename)
+    db.read_rows(csv.reader(io.StringIO((header + data).decode('utf-8'), newline='')))
+    return db.columns, db.neo_ids, db.neo_names
@@ -5,3 +5,21 @@ class UnsupportedFeature(Exception):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+
+
+class SnapshotError(Exception):
+    """
+    Custom exception for a database snapshot that is missing, stale or cannot be read
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+
+class QueryServerError(Exception):
+    """
+    Custom exception for a query server that cannot be reached or rejects a query
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+#  -*- coding: utf-8 -*-
+
+"""
+Script generating synthetic Near Earth Object csv data files in the schema of data/neo_data.csv.
+
+You can run from the commandline with: generate_data.py SIZE FILENAME [--seed SEED]
+Example: generate_data.py 1M data/neo_data_1M.csv
+
+SIZE is a number of rows, or one of the preset sizes 10k, 1M and 10M. The output only depends on the size and
+the seed, so benchmarks run against the same data on every machine.
+
+Rows are grouped by Near Earth Object, each with its close approaches in date order, as in the NASA feed:
+- Close approach dates span 1900 to 2200, concentrated around the present like the observed approaches
+- Most Near Earth Objects have a few close approaches, a long tail of them has dozens
+- Diameters follow a log-normal distribution, large objects are more often potentially hazardous
+"""
+
+import argparse
+import datetime
+import random
+
+# Preset dataset sizes, in rows
+Sizes = {'10k': 10000, '1M': 1000000, '10M': 10000000}
+
+Header = [
+    'id', 'neo_reference_id', 'name', 'nasa_jpl_url', 'absolute_magnitude_h',
+    'estimated_diameter_min_kilometers', 'estimated_diameter_max_kilometers',
+    'estimated_diameter_min_meters', 'estimated_diameter_max_meters',
+    'estimated_diameter_min_miles', 'estimated_diameter_max_miles',
+    'estimated_diameter_min_feet', 'estimated_diameter_max_feet',
+    'is_potentially_hazardous_asteroid', 'kilometers_per_second', 'kilometers_per_hour', 'miles_per_hour',
+    'close_approach_date', 'close_approach_date_full', 'miss_distance_astronomical', 'miss_distance_lunar',
+    'miss_distance_kilometers', 'miss_distance_miles', 'orbiting_body',
+]
+
+FirstDate = datetime.date(1900, 1, 1).toordinal()
+LastDate = datetime.date(2200, 12, 31).toordinal()
+PeakDate = datetime.date(2020, 1, 1).toordinal()
+
+KilometersPerAU = 149597870.7
+KilometersPerLunarDistance = 384400.0
+KilometersPerMile = 1.609344
+
+# Close approaches are only reported within 0.5 AU
+MaxMissDistance = 0.5 * KilometersPerAU
+
+
+def parse_size(size):
+    """
+    :param size: str preset size name or number of rows
+    :return: int number of rows
+    """
+    return Sizes[size] if size in Sizes else int(size)
+
+
+def neo_fields(rng, number):
+    """
+    Generates the fields of a Near Earth Object, the columns shared by all of its close approaches.
+
+    :param rng: random.Random
+    :param number: int sequence number of the Near Earth Object
+    :return: str csv fields from id to is_potentially_hazardous_asteroid, without a trailing comma
+    """
+    neo_id = 2000000 + number
+    year = rng.randint(1900, 2020)
+    name = f'({year} {chr(65 + number % 26)}{chr(65 + number // 26 % 26)}{number // 676})'
+    magnitude = rng.uniform(14.0, 30.0)
+    diameter_min = rng.lognormvariate(-3.0, 1.2)
+    diameter_max = diameter_min * 2.2361
+    hazardous = diameter_min >= 0.14 and rng.random() < 0.6
+    return ','.join([
+        str(neo_id), str(neo_id), name, f'http://ssd.jpl.nasa.gov/sbdb.cgi?sstr={neo_id}', f'{magnitude:.2f}',
+        f'{diameter_min:.6f}', f'{diameter_max:.6f}',
+        f'{diameter_min * 1000:.4f}', f'{diameter_max * 1000:.4f}',
+        f'{diameter_min / KilometersPerMile:.6f}', f'{diameter_max / KilometersPerMile:.6f}',
+        f'{diameter_min * 3280.84:.4f}', f'{diameter_max * 3280.84:.4f}',
+        str(hazardous),
+    ])
+
+
+def approach_fields(rng, ordinal):
+    """
+    Generates the fields of a close approach.
+
+    :param rng: random.Random
+    :param ordinal: int close approach date ordinal
+    :return: str csv fields from kilometers_per_second to orbiting_body, without a trailing comma
+    """
+    speed = rng.uniform(2.0, 40.0)
+    miss_distance = rng.uniform(0.0005, 1.0) ** 0.7 * MaxMissDistance
+    date = datetime.date.fromordinal(ordinal).isoformat()
+    return ','.join([
+        f'{speed:.6f}', f'{speed * 3600:.4f}', f'{speed * 3600 / KilometersPerMile:.4f}',
+        date, f'{date} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}',
+        f'{miss_distance / KilometersPerAU:.9f}', f'{miss_distance / KilometersPerLunarDistance:.6f}',
+        f'{miss_distance:.6f}', f'{miss_distance / KilometersPerMile:.6f}', 'Earth',
+    ])
+
+
+def generate(filename, rows, seed=0):
+    """
+    Writes a synthetic csv data file.
+
+    :param filename: str representing the pathway of the csv file to write
+    :param rows: int number of close approach rows
+    :param seed: int seed of the random generator, the file only depends on rows and seed
+    :return: int number of Near Earth Objects written
+    """
+    rng = random.Random(seed)
+    written = 0
+    neos = 0
+    with open(filename, 'w', newline='', buffering=1024 * 1024) as csv_file:
+        csv_file.write(','.join(Header) + '\n')
+        while written < rows:
+            approaches = min(int(rng.paretovariate(1.3)), 60, rows - written)
+            fields = neo_fields(rng, neos)
+            dates = sorted(
+                int(rng.triangular(FirstDate, LastDate, PeakDate)) for _ in range(approaches)
+            )
+            csv_file.writelines(f'{fields},{approach_fields(rng, ordinal)}\n' for ordinal in dates)
+            written += approaches
+            neos += 1
+    return neos
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate synthetic Near Earth Objects (NEOs) csv data')
+    parser.add_argument('size', type=str, help=f'Number of rows, or one of the preset sizes {", ".join(Sizes)}')
+    parser.add_argument('filename', type=str, help='Name of the csv data file to write')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator')
+    args = parser.parse_args()
+
+    neos = generate(args.filename, parse_size(args.size), args.seed)
+    print(f'Wrote {parse_size(args.size)} close approaches of {neos} NEOs to {args.filename}')
@@ -0,0 +1,229 @@
+"""
+Lightweight instrumentation of the Near Earth Object database.
+
+The process wide METRICS collects named timers (calls and seconds) and counters from the NEODatabase, the
+NEOSearcher and the NEOWriter. It is disabled by default: timers then return a shared no-op context, counters
+return immediately and no iterator is wrapped, so instrumented code pays one attribute check per call. Per-row
+counts, e.g. the rows passed by each filter, are only collected while enabled.
+
+A Profiler captures a cProfile or tracemalloc profile of a block of code and dumps it to a file, to be read with
+pstats or tracemalloc.Snapshot.load.
+"""
+
+import cProfile
+import functools
+import threading
+import time
+import tracemalloc
+
+
+class _NullTimer(object):
+    """
+    No-op context manager returned by Metrics.timer while disabled.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class _Timer(object):
+    """
+    Context manager adding the time spent in its block to a timer of a Metrics.
+    """
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+NullTimer = _NullTimer()
+
+
+class Metrics(object):
+    """
+    Object collecting named timers and counters, only while enabled.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.timers = {}
+        self.counters = {}
+
+    def enable(self, enabled=True):
+        """
+        :param enabled: bool whether to collect metrics from now on
+        :return: None
+        """
+        self.enabled = enabled
+        return None
+
+    def reset(self):
+        """
+        Drops all collected metrics.
+
+        :return: None
+        """
+        with self.lock:
+            self.timers = {}
+            self.counters = {}
+        return None
+
+    def timer(self, name):
+        """
+        :param name: str name of the timer
+        :return: context manager timing its block into the timer
+        """
+        return _Timer(self, name) if self.enabled else NullTimer
+
+    def timed(self, name):
+        """
+        Decorator timing every call of a function into a timer.
+
+        :param name: str name of the timer
+        :return: decorator
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with _Timer(self, name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def add_time(self, name, seconds, calls=1):
+        """
+        :param name: str name of the timer
+        :param seconds: float time to add
+        :param calls: int number of calls the time was spent in
+        :return: None
+        """
+        if self.enabled:
+            with self.lock:
+                timer = self.timers.setdefault(name, [0, 0.0])
+                timer[0] += calls
+                timer[1] += seconds
+        return None
+
+    def count(self, name, value=1):
+        """
+        :param name: str name of the counter
+        :param value: int value to add
+        :return: None
+        """
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + value
+        return None
+
+    def counting(self, iterable, name):
+        """
+        :param iterable: iterable to pass through
+        :param name: str name of the counter of the items
+        :return: the iterable while disabled, otherwise a generator counting its items into the counter
+        """
+        if not self.enabled:
+            return iterable
+        return self._counting(iterable, name)
+
+    def _counting(self, iterable, name):
+        count = 0
+        try:
+            for item in iterable:
+                count += 1
+                yield item
+        finally:
+            self.count(name, count)
+
+    def snapshot(self):
+        """
+        :return: dict JSON serializable copy of the timers, with their calls and seconds, and of the counters
+        """
+        with self.lock:
+            return {
+                'timers': {name: {'calls': calls, 'seconds': seconds}
+                           for name, (calls, seconds) in sorted(self.timers.items())},
+                'counters': dict(sorted(self.counters.items())),
+            }
+
+    def __str__(self):
+        snapshot = self.snapshot()
+        names = list(snapshot['timers']) + list(snapshot['counters'])
+        width = max([len(name) for name in names] + [6]) + 2
+        lines = [f'{"timer":<{width}} {"calls":>10} {"ms":>12}']
+        for name, timer in snapshot['timers'].items():
+            lines.append(f'{name:<{width}} {timer["calls"]:>10} {timer["seconds"] * 1000:>12.3f}')
+        lines.append(f'{"counter":<{width}} {"value":>10}')
+        for name, value in snapshot['counters'].items():
+            lines.append(f'{name:<{width}} {value:>10}')
+        return '\n'.join(lines)
+
+
+# Metrics of the process, shared by all instrumented objects
+METRICS = Metrics()
+
+
+class Profiler(object):
+    """
+    Object capturing a profile of the code run between start and stop.
+
+    Modes:
+    - cpu: cProfile statistics, dumped with pstats.Stats.dump_stats
+    - memory: tracemalloc snapshot of the memory allocated and not freed, dumped with tracemalloc.Snapshot.dump
+    """
+    Modes = ('cpu', 'memory')
+
+    def __init__(self, mode, filename):
+        """
+        :param mode: str one of Profiler.Modes
+        :param filename: str name of the file the profile is dumped to
+        """
+        if mode not in Profiler.Modes:
+            raise ValueError(f'Unsupported profile mode: {mode}')
+        self.mode = mode
+        self.filename = filename
+        self.profile = None
+
+    def start(self):
+        if self.mode == 'cpu':
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            tracemalloc.start()
+        return None
+
+    def stop(self):
+        """
+        Stops profiling and dumps the profile.
+
+        :return: None
+        """
+        if self.mode == 'cpu':
+            self.profile.disable()
+            self.profile.dump_stats(self.filename)
+        else:
+            tracemalloc.take_snapshot().dump(self.filename)
+            tracemalloc.stop()
+        return None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
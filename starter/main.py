@@ -15,6 +15,9 @@ Search options:
 Output options: Required.
 - display: prints to stdout
 - csv_file: exports data to a csv
+- ndjson: exports data to newline-delimited JSON, one orbit per line
+- feather, parquet: exports data to an Arrow IPC (Feather) or Parquet file, requires pyarrow
+The output file defaults to results.<extension> in the working directory, -o/--output_file changes it.
 
 Filters options: Optional. Input as: option:operation:value e.g. diameter:>=:0.042
 - is_hazardous:[=]:bool
@@ -22,20 +25,53 @@ Filters options: Optional. Input as: option:operation:value e.g. diameter:>=:0.0
 - distance:[>=|=|<=]:float
 
 Return objects options: Optional, defaults to NEO if not specified.
-- NEO
-- Path
+- NEO: unique NEOs with an orbit matching the search, output with all of their orbits
+- Path: every orbit matching the search, filters on distance apply to each orbit
+
+Sort options: Optional, results are in date order if not specified. --sort_by distance|diameter|date orders
+them by the field, --desc from the highest value, and -n keeps the top results. NEOs are ranked by their best
+matching orbit.
+
+Aggregates: --group_by day|week|month --agg count,min_distance,hazard_ratio writes one row per period with
+orbits matching the search instead of the results. Aggregates: count of close approaches, neos, hazardous
+(unique NEOs), hazard_ratio (share of hazardous NEOs), min_distance, mean_distance and max_distance.
+
+Batch: main.py display --queries FILE reads one JSON object of query options per line, e.g.
+{"start_date": "2020-01-01", "end_date": "2020-01-07", "number": 10, "filter": ["diameter:>:0.042"]}
+from FILE, or stdin for -, and searches all of them with shared scans. File outputs get the query number
+appended to their name, e.g. results_1.csv.
+
+Server: main.py serve [--port PORT] [-f FILENAME] loads the database once and answers queries over HTTP.
+Queries are forwarded to a running server with --server HOST:PORT, skipping the local data load.
+
+Instrumentation: --stats prints the timers and counters of each stage to stderr on exit. --profile cpu|memory
+dumps a cProfile or tracemalloc profile of the run to --profile_file.
 
 Filename: Optional, used for specifying a filename for a csv to load data from. By default project looks for a csv in: data/neo_data.csv.
+A binary snapshot of the csv is cached next to it for faster startup, --no_snapshot skips it.
+--dataset SNAPSHOT opens a snapshot read-only without its csv, e.g. one dataset shared by several servers.
+
+Partitions: main.py partition DIRECTORY [--by year|month] [-f FILENAME] writes the data as one snapshot per year
+or month with a manifest of per-partition statistics. --partitions DIRECTORY then loads only the partitions
+overlapping the searched dates whose statistics can match the filters, then reads the other orbits of the NEOs
+found from the partitions listed for them in the manifest.
 """
 
 import argparse
+import atexit
+import json
+import os
 import pathlib
 import sys
 from datetime import datetime
 
-from exceptions import UnsupportedFeature
+from exceptions import QueryServerError, UnsupportedFeature
+from instrumentation import METRICS, Profiler
 from database import NEODatabase
-from search import Query, NEOSearcher
+from models import date_to_ordinal
+from partitions import Granularities
+from search import Filter, Query, NEOSearcher
+from server import NEOServer, remote_query
 from writer import OutputFormat, NEOWriter
 
 PROJECT_ROOT = pathlib.Path(__file__).parent.absolute()
@@ -72,7 +108,260 @@ def verify_output_choice(choice):
     return options[options.index(choice)]
 
 
+def add_load_arguments(parser):
+    """
+    Function that adds the arguments controlling how the database is loaded to a parser.
+
+    :param parser:    argparse.ArgumentParser
+    :return: None
+    """
+    parser.add_argument('-f', '--filename', type=str, help='Name of input csv data file')
+    parser.add_argument('--dataset', type=str,
+                        help='Name of a snapshot file to memory-map read-only instead of loading a csv data file, '
+                             'shared by all processes mapping it')
+    parser.add_argument('--partitions', type=str,
+                        help='Name of a partitioned dataset directory written by "main.py partition" to load instead '
+                             'of a csv data file, only its partitions overlapping the searched dates and filters')
+    parser.add_argument('--no_snapshot', action='store_true',
+                        help='Always parse the csv data file, without reading or writing its binary snapshot')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Int representing the number of processes parsing the csv data file')
+    parser.add_argument('--append', nargs='+', default=[],
+                        help='Names of csv data files with new orbits, e.g. daily feed updates, added to the loaded '
+                             'data. The csv data file is never written, the rows are only kept in its snapshot, '
+                             'not with --no_snapshot, --dataset or --partitions')
+    parser.add_argument('--value_indexes', action='store_true',
+                        help='Build sorted indexes on diameter and distance to answer threshold filters without '
+                             'scanning the date range')
+    parser.add_argument('--stats', action='store_true',
+                        help='Collect per-stage timers and counters of the load, search and output, printed to '
+                             'stderr on exit')
+    parser.add_argument('--profile', choices=Profiler.Modes,
+                        help='Capture a cProfile (cpu) or tracemalloc (memory) profile of the run')
+    parser.add_argument('--profile_file', type=str,
+                        help='Name of the file the profile is dumped to, defaults to neo.<mode>.prof')
+
+
+def instrument(args):
+    """
+    Function that enables the instrumentation selected by the --stats and --profile arguments, reported when the
+    process exits.
+
+    :param args:    argparse.Namespace with the instrumentation arguments
+    :return: None
+    """
+    if args.stats:
+        METRICS.enable()
+        atexit.register(lambda: print(METRICS, file=sys.stderr))
+    if args.profile:
+        filename = args.profile_file or f'neo.{args.profile}.prof'
+        profiler = Profiler(args.profile, filename)
+        profiler.start()
+
+        def dump_profile():
+            profiler.stop()
+            print(f'Profile written to {filename}', file=sys.stderr)
+
+        atexit.register(dump_profile)
+
+
+def search_bounds(args):
+    """
+    Function that finds the dates and filters of the query given by the arguments, to prune partitions with.
+
+    :param args:    argparse.Namespace with the query arguments
+    :return: tuple of (tuple of (start, end) date ordinals, either may be None, list of Filters)
+    """
+    start_date = args.date or args.start_date
+    end_date = args.date or args.end_date
+    date_range = (start_date and date_to_ordinal(start_date), end_date and date_to_ordinal(end_date))
+    filters_dict = Filter.create_filter_options(args.filter or [])
+    return date_range, filters_dict['NEO'] + filters_dict['Path']
+
+
+def load_database(args, date_range=None, filters=()):
+    """
+    Function that loads the NEODatabase selected by the load arguments, exiting when it cannot be loaded.
+
+    :param args:    argparse.Namespace with the load arguments
+    :param date_range:    tuple of (start, end) date ordinals searched, to prune the partitions of --partitions
+    :param filters:    list of Filters searched, to prune the partitions of --partitions
+    :return: NEODatabase
+    """
+    if args.filename:
+        filename = args.filename
+    else:
+        filename = f'{PROJECT_ROOT}/data/neo_data.csv'
+
+    db = NEODatabase(filename=filename)
+
+    try:
+        if args.partitions:
+            db.load_partitions(args.partitions, date_range, filters, value_indexes=args.value_indexes)
+        elif args.dataset:
+            db.load_dataset(args.dataset, value_indexes=args.value_indexes)
+        else:
+            db.load_data(snapshot=not args.no_snapshot, workers=args.workers, value_indexes=args.value_indexes)
+        for append_filename in args.append:
+            db.append_data(append_filename, snapshot=not args.no_snapshot)
+    except FileNotFoundError as e:
+        print(f'File {e.filename} not found, please try another file name.')
+        sys.exit()
+    except Exception as e:
+        print(e)
+        sys.exit()
+
+    return db
+
+
+def serve(argv):
+    """
+    Function that runs the query server until interrupted.
+
+    :param argv:    list of str command line arguments following 'serve'
+    :return: None
+    """
+    parser = argparse.ArgumentParser(prog='main.py serve', description='Near Earth Objects (NEOs) Database server')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Host to bind the server to')
+    parser.add_argument('--port', type=int, default=8642, help='Port to bind the server to')
+    parser.add_argument('--threads', type=int, default=4, help='Int representing the number of search threads')
+    add_load_arguments(parser)
+    args = parser.parse_args(argv)
+    instrument(args)
+
+    db = load_database(args)
+    print(f'Serving {len(db)} orbits of {len(db.neo_names)} NEOs on http://{args.host}:{args.port}')
+    try:
+        NEOServer(db, host=args.host, port=args.port, threads=args.threads).serve()
+    except KeyboardInterrupt:
+        pass
+
+
+def partition(argv):
+    """
+    Function that writes the loaded data as a partitioned dataset.
+
+    :param argv:    list of str command line arguments following 'partition'
+    :return: None
+    """
+    parser = argparse.ArgumentParser(prog='main.py partition',
+                                     description='Write a Near Earth Objects (NEOs) partitioned dataset')
+    parser.add_argument('directory', type=str, help='Directory to write the partitions and their manifest to')
+    parser.add_argument('--by', choices=Granularities, default='year',
+                        help='Calendar period of the close approach dates of each partition')
+    add_load_arguments(parser)
+    args = parser.parse_args(argv)
+    instrument(args)
+
+    db = load_database(args)
+    try:
+        partitions = db.write_partitions(args.directory, args.by)
+    except OSError as e:
+        print(f'Cannot write partitions to {args.directory}: {e}')
+        sys.exit()
+    print(f'Wrote {len(db)} orbits to {len(partitions)} partitions in {args.directory}')
+
+
+def read_queries(filename):
+    """
+    Function that reads a batch of queries, one JSON object of Query options per line. Blank lines and lines
+    starting with # are skipped.
+
+    :param filename:    str name of the file to read, - for stdin
+    :return: list of dict Query options
+    """
+    if filename == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(filename) as queries_file:
+            lines = queries_file.readlines()
+
+    return [json.loads(line) for line in lines if line.strip() and not line.lstrip().startswith('#')]
+
+
+def run_batch(args):
+    """
+    Function that searches a batch of queries and writes the results of each query.
+
+    :param args:    argparse.Namespace with the load, output and --queries arguments
+    :return: None
+    """
+    try:
+        batch = read_queries(args.queries)
+    except (OSError, ValueError) as e:
+        print(f'Cannot read queries from {args.queries}: {e}')
+        sys.exit()
+
+    try:
+        if args.server:
+            results = [remote_query(args.server, **options) for options in batch]
+        else:
+            db = load_database(args)
+            results = NEOSearcher(db).get_objects_batch([Query(**options).build_query() for options in batch])
+    except QueryServerError as e:
+        print(e)
+        sys.exit()
+    except ValueError as e:
+        print(f'Invalid query: {e}')
+        sys.exit()
+    except UnsupportedFeature as e:
+        print('Unsupported Feature; Write unsuccessful')
+        sys.exit()
+
+    writer = NEOWriter()
+    for number, (options, query_results) in enumerate(zip(batch, results), start=1):
+        print(f'Query #{number}: {json.dumps(options)}')
+        filename = None
+        if args.output != OutputFormat.display.value:
+            root, extension = os.path.splitext(args.output_file or f'results.{NEOWriter.Extensions[args.output]}')
+            filename = f'{root}_{number}{extension}'
+        try:
+            writer.write(data=query_results, format=args.output, filename=filename)
+        except Exception as e:
+            print(e)
+            print('Write unsuccessful')
+            sys.exit()
+    print('Write successful.')
+
+
+def run_aggregate(args):
+    """
+    Function that aggregates the orbits matching the query given by the arguments per period and writes the
+    aggregates.
+
+    :param args:    argparse.Namespace with the load, query, output, --group_by and --agg arguments
+    :return: None
+    """
+    db = load_database(args, *search_bounds(args))
+    aggregates = [name.strip() for name in args.agg.split(',') if name.strip()]
+    try:
+        groups = NEOSearcher(db).aggregate(Query(**vars(args)).build_query(), args.group_by, aggregates)
+    except UnsupportedFeature as e:
+        print(e)
+        print('Unsupported Feature; Write unsuccessful')
+        sys.exit()
+
+    try:
+        result = NEOWriter().write_aggregates(args.output, groups, args.output_file)
+    except Exception as e:
+        print(e)
+        print('Write unsuccessful')
+        sys.exit()
+
+    if result:
+        print('Write successful.')
+    else:
+        print('Write unsuccessful.')
+
+
 if __name__ == '__main__':
+    if sys.argv[1:2] == ['serve']:
+        serve(sys.argv[2:])
+        sys.exit()
+    if sys.argv[1:2] == ['partition']:
+        partition(sys.argv[2:])
+        sys.exit()
+
     parser = argparse.ArgumentParser(description='Near Earth Objects (NEOs) Database')
     parser.add_argument('output', choices=OutputFormat.list(), type=verify_output_choice,
                         help='Select option for how to output the search results.')
@@ -85,7 +374,24 @@ if __name__ == '__main__':
     parser.add_argument('-e', '--end_date', type=verify_date,
                         help='YYYY-MM-DD format to find NEOs up to the end date')
     parser.add_argument('-n', '--number', type=int, help='Int representing max number of NEOs to return')
-    parser.add_argument('-f', '--filename', type=str, help='Name of input csv data file')
+    parser.add_argument('--sort_by', choices=list(Query.SortOptions),
+                        help='Order the results by distance, diameter or date instead of date order, keeping the '
+                             'top -n results. NEOs are ranked by their best matching orbit')
+    parser.add_argument('--desc', action='store_true', help='Order the results from the highest value')
+    parser.add_argument('--group_by', choices=NEOSearcher.GroupOptions,
+                        help='Aggregate the matching orbits per day, week or month instead of returning them')
+    parser.add_argument('--agg', type=str, default='count',
+                        help=f'Comma separated aggregates of --group_by: {", ".join(NEOSearcher.Aggregates)}')
+    parser.add_argument('-o', '--output_file', type=str,
+                        help='Name of the output file of the csv_file, ndjson, feather and parquet outputs')
+    add_load_arguments(parser)
+    parser.add_argument('--explain', action='store_true',
+                        help='Print the query plan with estimated and actual row counts and per-stage timings')
+    parser.add_argument('--server', type=str,
+                        help='HOST:PORT of a running "main.py serve" server to forward the query to')
+    parser.add_argument('--queries', type=str,
+                        help='Name of a file with one JSON object of query options per line, or - for stdin, to '
+                             'search as a batch instead of the query given by the arguments')
     parser.add_argument('--filter', nargs='+', help='Select filter options with filter value: '
                                                     'is_hazardous:[=]:bool, '
                                                     'diameter:[>=|=|<=]:float, '
@@ -95,39 +401,75 @@ if __name__ == '__main__':
 
     args = parser.parse_args()
     var_args = vars(args)
+    instrument(args)
 
-    # Load Data
-    if args.filename:
-        filename = args.filename
-    else:
-        filename = f'{PROJECT_ROOT}/data/neo_data.csv'
-
-    db = NEODatabase(filename=filename)
+    if args.server and args.explain:
+        print('--explain is not supported with --server, the plan is chosen by the server')
+        sys.exit()
 
-    try:
-        db.load_data()
-    except FileNotFoundError as e:
-        print(f'File {var_args.get("filename")} not found, please try another file name.')
+    if args.group_by:
+        if args.server or args.queries or args.explain:
+            print('--group_by is not supported with --server, --queries or --explain')
+        else:
+            run_aggregate(args)
         sys.exit()
-    except Exception as e:
-        print(Exception)
+
+    if args.queries:
+        if args.explain:
+            print('--explain is not supported with --queries')
+        else:
+            run_batch(args)
         sys.exit()
 
-    # Build Query
-    query_selectors = Query(**var_args).build_query()
+    columns = None
+    if args.server:
+        # Get Results from the server, which already holds the loaded data
+        try:
+            results = remote_query(args.server, **var_args)
+        except QueryServerError as e:
+            print(e)
+            sys.exit()
+    else:
+        # Load Data
+        db = load_database(args, *search_bounds(args))
 
-    # Get Results
-    try:
-        results = NEOSearcher(db).get_objects(query_selectors)
-    except UnsupportedFeature as e:
-        print('Unsupported Feature; Write unsuccessful')
-        sys.exit()
+        # Build Query
+        query_selectors = Query(**var_args).build_query()
+
+        # Get Results
+        try:
+            searcher = NEOSearcher(db)
+            # NEOs found in the loaded partitions are completed with their orbits from the other partitions
+            fetch_orbits = db.partitions is not None and query_selectors.return_object == 'NEO'
+            streamed = args.output in (OutputFormat.display.value, OutputFormat.csv_file.value)
+            if args.explain:
+                results, plan = searcher.explain(query_selectors)
+                print(plan)
+                if fetch_orbits:
+                    results = [db.get_neo(row) for row in db.fetch_orbits(searcher.get_rows(query_selectors))]
+            elif fetch_orbits:
+                rows = db.fetch_orbits(searcher.get_rows(query_selectors))
+                results = map(db.get_neo, rows) if streamed else []
+                columns = None if streamed else db.take_orbits(rows)
+            elif streamed:
+                # Results are streamed to the writer as they are found
+                results = searcher.iter_objects(query_selectors)
+            else:
+                # Columnar formats are written from the columns of the result orbits
+                results = []
+                columns = db.take_orbits(searcher.get_rows(query_selectors),
+                                         all_orbits=query_selectors.return_object == 'NEO')
+        except UnsupportedFeature as e:
+            print('Unsupported Feature; Write unsuccessful')
+            sys.exit()
 
     # Output Results
     try:
         result = NEOWriter().write(
             data=results,
             format=args.output,
+            filename=args.output_file,
+            columns=columns,
         )
     except Exception as e:
         print(e)
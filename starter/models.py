@@ -1,24 +1,65 @@
+import datetime
+
+
+def date_to_ordinal(date_str):
+    """
+    Encodes a YYYY-MM-DD date string as its proleptic Gregorian ordinal.
+
+    :param date_str: str representing a date in %Y-%m-%d format
+    :return: int ordinal of the date
+    """
+    return datetime.date(int(date_str[0:4]), int(date_str[5:7]), int(date_str[8:10])).toordinal()
+
+
+def ordinal_to_date(ordinal):
+    """
+    Decodes a date ordinal back into a YYYY-MM-DD date string.
+
+    :param ordinal: int ordinal of the date
+    :return: str representing the date in %Y-%m-%d format
+    """
+    return datetime.date.fromordinal(ordinal).isoformat()
+
+
+def period_bounds(ordinal, period):
+    """
+    Finds the calendar period containing a date. Weeks start on Monday.
+
+    :param ordinal: int ordinal of the date
+    :param period: str 'day', 'week', 'month' or 'year'
+    :return: tuple of (start, end) date ordinals, the period covers start <= date < end
+    """
+    if period == 'day':
+        return ordinal, ordinal + 1
+    if period == 'week':
+        # Ordinal 1, 0001-01-01, is a Monday
+        start = ordinal - (ordinal - 1) % 7
+        return start, start + 7
+    date = datetime.date.fromordinal(ordinal)
+    if period == 'year':
+        return datetime.date(date.year, 1, 1).toordinal(), datetime.date(date.year + 1, 1, 1).toordinal()
+    end = datetime.date(date.year + 1, 1, 1) if date.month == 12 else datetime.date(date.year, date.month + 1, 1)
+    return date.replace(day=1).toordinal(), end.toordinal()
+
+
 class NearEarthObject(object):
     """
     Object containing data describing a Near Earth Object and it's orbits.
 
-    # TODO: You may be adding instance methods to NearEarthObject to help you implement search and output data.
+    Instances are lightweight views, the NEODatabase only creates them for the results it hands out.
     """
+    __slots__ = ('orbits', 'id', 'name', 'is_potentially_hazardous_asteroid',
+                 'diameter_min_km', 'miss_distance_kilometers')
 
     def __init__(self, **kwargs):
         """
         :param kwargs:    dict of attributes about a given Near Earth Object, only a subset of attributes used
         """
-        # TODO: What instance variables will be useful for storing on the Near Earth Object?
-
         self.orbits = []
         self.id = kwargs.get('id')
         self.name = kwargs.get('name')
-        self.string_hazard = kwargs.get('is_potentially_hazardous_asteroid')
-        if(self.string_hazard == 'True'):
-            self.is_potentially_hazardous_asteroid = True
-        else:
-            self.is_potentially_hazardous_asteroid = False
+        # Accepts both the raw csv string and an already decoded flag
+        self.is_potentially_hazardous_asteroid = str(kwargs.get('is_potentially_hazardous_asteroid')) in ('True', '1')
         self.diameter_min_km = float(kwargs.get('estimated_diameter_min_kilometers'))
         self.miss_distance_kilometers = float(kwargs.get('miss_distance_kilometers'))
 
@@ -29,28 +70,37 @@ class NearEarthObject(object):
         :param orbit: OrbitPath
         :return: None
         """
-
-        # TODO: How do we connect orbits back to the Near Earth Object?
         self.orbits.append(orbit)
 
     def __repr__(self):
         return(f'id: {self.id} \nname: {self.name} \norbits: {self.orbits}')
 
+
 class OrbitPath(object):
     """
     Object containing data describing a Near Earth Object orbit.
 
-    # TODO: You may be adding instance methods to OrbitPath to help you implement search and output data.
+    Instances are lightweight views, the NEODatabase only creates them for the results it hands out.
     """
+    __slots__ = ('neo_id', 'neo_name', 'close_approach_date', 'miss_distance_kilometers',
+                 'is_potentially_hazardous_asteroid', 'diameter_min_km')
 
     def __init__(self, **kwargs):
         """
         :param kwargs:    dict of attributes about a given orbit, only a subset of attributes used
         """
-        # TODO: What instance variables will be useful for storing on the Near Earth Object?
+        self.neo_id = kwargs.get('neo_id')
         self.neo_name = kwargs.get('name')
-        self.close_approach_date = kwargs.get('close_approach_date')
+        close_approach_date = kwargs.get('close_approach_date')
+        # Dates are stored as ordinals in the database columns
+        if isinstance(close_approach_date, int):
+            close_approach_date = ordinal_to_date(close_approach_date)
+        self.close_approach_date = close_approach_date
         self.miss_distance_kilometers = float(kwargs.get('miss_distance_kilometers'))
+        # Attributes of the Near Earth Object recorded with the orbit, when known
+        self.is_potentially_hazardous_asteroid = str(kwargs.get('is_potentially_hazardous_asteroid')) in ('True', '1')
+        diameter_min_km = kwargs.get('estimated_diameter_min_kilometers')
+        self.diameter_min_km = float(diameter_min_km) if diameter_min_km is not None else float('nan')
 
     def __repr__(self):
         return(f'neo_name: {self.neo_name} \n'\
@@ -0,0 +1,134 @@
+"""
+Partitioned datasets of a NEODatabase.
+
+A partitioned dataset is a directory with one snapshot per calendar year or month of close approach dates, see
+snapshot.py, and a manifest describing each partition: its snapshot file, its first and last date and the
+Statistics of its rows. Loading a partitioned dataset only maps the partitions whose dates overlap the searched
+dates and whose column bounds can match the search filters, so memory use and startup time follow the searched
+window rather than the whole archive. Near Earth Objects found by a search are then completed with their orbits
+from the other partitions, reading only their own rows, see NEODatabase.fetch_orbits.
+
+Manifest layout, utf-8 JSON in manifest.json:
+- version: format version of the manifest
+- granularity: 'year' or 'month'
+- source: signature of the csv file the partitions were written from, see snapshot.source_signature
+- partitions: list of {'key', 'file', 'start', 'end', 'rows', 'statistics'} in date order, start and end being
+  the first and last date ordinals of the partition
+- orbits: dict of Near Earth Object name to the keys of the partitions holding its orbits, in date order, for
+  the Near Earth Objects with orbits in more than one partition
+"""
+
+import datetime
+import json
+import os
+
+from exceptions import SnapshotError
+from planner import Statistics
+
+ManifestName = 'manifest.json'
+ManifestVersion = 2
+
+# Calendar periods the rows of a partitioned dataset can be split by
+Granularities = ('year', 'month')
+
+
+def partition_key(ordinal, granularity):
+    """
+    :param ordinal: int date ordinal within the partition
+    :param granularity: str one of Granularities
+    :return: str name of the partition, YYYY or YYYY-MM
+    """
+    date = datetime.date.fromordinal(ordinal)
+    return f'{date.year:04d}' if granularity == 'year' else f'{date.year:04d}-{date.month:02d}'
+
+
+def manifest_path(directory):
+    """
+    :param directory: str representing the pathway of the partitioned dataset
+    :return: str representing the pathway of its manifest
+    """
+    return os.path.join(directory, ManifestName)
+
+
+def write_manifest(directory, granularity, source, partitions, orbits):
+    """
+    Writes the manifest of a partitioned dataset atomically, replacing any previous manifest.
+
+    :param directory: str representing the pathway of the partitioned dataset
+    :param granularity: str one of Granularities
+    :param source: dict source signature of the partitioned csv file, or None
+    :param partitions: list of dict partition descriptions, in date order
+    :param orbits: dict of Near Earth Object name to the keys of the partitions holding its orbits, for the Near
+                   Earth Objects with orbits in more than one partition
+    :return: None
+    """
+    manifest = {
+        'version': ManifestVersion, 'granularity': granularity, 'source': source, 'partitions': partitions,
+        'orbits': orbits,
+    }
+    temp_path = f'{manifest_path(directory)}.tmp'
+    with open(temp_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(temp_path, manifest_path(directory))
+    return None
+
+
+def read_manifest(directory):
+    """
+    :param directory: str representing the pathway of the partitioned dataset
+    :return: dict manifest
+    :raises SnapshotError: when the manifest is missing, from another version or corrupt
+    """
+    try:
+        with open(manifest_path(directory)) as manifest_file:
+            manifest = json.load(manifest_file)
+    except OSError as e:
+        raise SnapshotError(f'Cannot read manifest of {directory}: {e}')
+    except ValueError as e:
+        raise SnapshotError(f'Corrupt manifest of {directory}: {e}')
+
+    if manifest.get('version') != ManifestVersion:
+        raise SnapshotError(f'Unsupported manifest version {manifest.get("version")} of {directory}')
+    return manifest
+
+
+def prune_partitions(manifest, date_range=None, filters=()):
+    """
+    Selects the partitions a search can find rows in.
+
+    :param manifest: dict manifest, see read_manifest
+    :param date_range: tuple of (start, end) date ordinals searched, either bound may be None, None for all dates
+    :param filters: list of Filters of the search
+    :return: list of dict descriptions of the partitions overlapping the date range that can match all filters,
+             in date order
+    """
+    start, end = date_range or (None, None)
+    partitions = []
+    for partition in manifest['partitions']:
+        if start is not None and partition['end'] < start:
+            continue
+        if end is not None and partition['start'] > end:
+            continue
+        statistics = Statistics.from_dict(partition['statistics'])
+        if all(statistics.may_match(f) for f in filters):
+            partitions.append(partition)
+    return partitions
+
+
+def orbit_partitions(manifest, names, loaded=()):
+    """
+    Selects the partitions holding the orbits of Near Earth Objects that are missing from the loaded partitions.
+
+    :param manifest: dict manifest, see read_manifest
+    :param names: iterable of str Near Earth Object names
+    :param loaded: collection of str keys of the loaded partitions
+    :return: list of tuples of (dict partition description, set of str names of the Near Earth Objects with
+             orbits in it), in date order
+    """
+    missing = {}
+    for name in names:
+        for key in manifest['orbits'].get(name, ()):
+            if key not in loaded:
+                missing.setdefault(key, set()).add(name)
+    return [(partition, missing[partition['key']]) for partition in manifest['partitions']
+            if partition['key'] in missing]
@@ -0,0 +1,391 @@
+"""
+Cost-based query planning for the NEOSearcher.
+
+Column statistics collected when data is loaded (quantiles of the numeric columns and the hazardous ratio per
+year) are used to estimate how many rows each filter keeps. The QueryPlanner uses those estimates and the exact
+counts of the indexes to choose the access path of a query, the date index, a value index or the hazardous bitmap
+index, and to order the filters most selective first. The resulting QueryPlan can measure the rows and time of
+each stage of its execution and be printed as an EXPLAIN.
+"""
+
+import datetime
+import time
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from itertools import compress
+
+from models import ordinal_to_date
+
+
+class Statistics(object):
+    """
+    Object holding the column statistics of a NEODatabase.
+    """
+
+    # Number of equal-depth buckets of the numeric column quantiles
+    Quantiles = 64
+    NumericColumns = ('diameter_min_km', 'miss_distance_kilometers')
+
+    def __init__(self, rows=0, columns=None, hazard_by_year=None):
+        """
+        :param rows: int number of rows described
+        :param columns: dict of numeric column name to dict with the 'min', 'max' and 'quantiles' of its values
+        :param hazard_by_year: dict of int year to [hazardous rows, total rows] of the year
+        """
+        self.rows = rows
+        self.columns = columns or {}
+        self.hazard_by_year = hazard_by_year or {}
+
+    @staticmethod
+    def collect(db):
+        """
+        Collects the statistics of all rows of a database.
+
+        :param db: NEODatabase to describe
+        :return: Statistics
+        """
+        rows = len(db)
+        columns = {}
+        for name in Statistics.NumericColumns:
+            values = sorted(db.columns[name])
+            if values:
+                quantiles = [values[i * (rows - 1) // Statistics.Quantiles] for i in range(Statistics.Quantiles + 1)]
+                columns[name] = {'min': values[0], 'max': values[-1], 'quantiles': quantiles}
+
+        dates = db.columns['close_approach_date']
+        totals = Counter(dates)
+        hazardous = Counter(compress(dates, db.columns['is_potentially_hazardous_asteroid']))
+        hazard_by_year = {}
+        for ordinal, count in totals.items():
+            year = hazard_by_year.setdefault(datetime.date.fromordinal(ordinal).year, [0, 0])
+            year[0] += hazardous[ordinal]
+            year[1] += count
+
+        return Statistics(rows, columns, hazard_by_year)
+
+    def extend(self, db, start):
+        """
+        Updates the statistics with the rows appended to a database from row start onwards. Row counts, minimums,
+        maximums and hazardous ratios stay exact, the quantiles are kept as an approximation.
+
+        :param db: NEODatabase the rows were appended to
+        :param start: int first appended row
+        :return: None
+        """
+        self.rows = len(db)
+        for name, column in self.columns.items():
+            values = db.columns[name][start:]
+            if len(values):
+                column['min'] = min(column['min'], min(values))
+                column['max'] = max(column['max'], max(values))
+
+        dates = db.columns['close_approach_date'][start:]
+        hazardous = Counter(compress(dates, db.columns['is_potentially_hazardous_asteroid'][start:]))
+        for ordinal, count in Counter(dates).items():
+            year = self.hazard_by_year.setdefault(datetime.date.fromordinal(ordinal).year, [0, 0])
+            year[0] += hazardous[ordinal]
+            year[1] += count
+        return None
+
+    def to_dict(self):
+        """
+        :return: dict JSON serializable form of the statistics
+        """
+        return {
+            'rows': self.rows,
+            'columns': self.columns,
+            'hazard_by_year': {str(year): counts for year, counts in self.hazard_by_year.items()},
+        }
+
+    @staticmethod
+    def from_dict(statistics):
+        """
+        :param statistics: dict form of the statistics, see to_dict
+        :return: Statistics
+        """
+        return Statistics(
+            statistics['rows'],
+            statistics['columns'],
+            {int(year): counts for year, counts in statistics['hazard_by_year'].items()},
+        )
+
+    def cdf(self, name, value, inclusive):
+        """
+        Estimates the fraction of rows of a numeric column below a value, interpolating between quantiles
+
+        :param name: str numeric column name
+        :param value: float value
+        :param inclusive: bool whether rows equal to the value are counted
+        :return: float between 0 and 1
+        """
+        quantiles = self.columns.get(name, {}).get('quantiles')
+        if not quantiles:
+            return 0.5
+        buckets = len(quantiles) - 1
+        i = (bisect_right if inclusive else bisect_left)(quantiles, value)
+        if i == 0:
+            return 0.0
+        if i > buckets:
+            return 1.0
+        low, high = quantiles[i - 1], quantiles[i]
+        within = (value - low) / (high - low) if high > low else 0.0
+        return (i - 1 + within) / buckets
+
+    def hazard_ratio(self, date_range):
+        """
+        :param date_range: tuple of (start, end) date ordinals
+        :return: float fraction of hazardous rows in the years overlapping the date range
+        """
+        start_year = datetime.date.fromordinal(date_range[0]).year
+        end_year = datetime.date.fromordinal(date_range[1]).year
+        years = [counts for year, counts in self.hazard_by_year.items() if start_year <= year <= end_year]
+        years = years or list(self.hazard_by_year.values())
+        total = sum(counts[1] for counts in years)
+        return sum(counts[0] for counts in years) / total if total else 0.5
+
+    def may_match(self, f):
+        """
+        Checks exactly, from the minimum and maximum of the column or the hazardous row counts, whether any of
+        the described rows can match a filter
+
+        :param f: Filter
+        :return: bool False when no row can match
+        """
+        if not self.rows:
+            return False
+        value = f.cast_value()
+        if f.column_name() == 'is_potentially_hazardous_asteroid':
+            if f.operation != '=':
+                return True
+            hazardous = sum(counts[0] for counts in self.hazard_by_year.values())
+            return hazardous > 0 if value else hazardous < self.rows
+
+        bounds = self.columns.get(f.column_name())
+        if bounds is None:
+            return True
+        return {
+            '<': bounds['min'] < value,
+            '<=': bounds['min'] <= value,
+            '>': bounds['max'] > value,
+            '>=': bounds['max'] >= value,
+            '=': bounds['min'] <= value <= bounds['max'],
+        }[f.operation]
+
+    def selectivity(self, f, date_range):
+        """
+        Estimates the fraction of rows a filter keeps
+
+        :param f: Filter
+        :param date_range: tuple of (start, end) date ordinals searched
+        :return: float between 0 and 1
+        """
+        value = f.cast_value()
+        if f.column_name() == 'is_potentially_hazardous_asteroid':
+            ratio = self.hazard_ratio(date_range)
+            if f.operation != '=':
+                return 0.5
+            return ratio if value else 1.0 - ratio
+
+        name = f.column_name()
+        below = self.cdf(name, value, inclusive=False)
+        below_or_equal = self.cdf(name, value, inclusive=True)
+        return {
+            '<': below,
+            '<=': below_or_equal,
+            '>': 1.0 - below_or_equal,
+            '>=': 1.0 - below,
+            '=': below_or_equal - below,
+        }[f.operation]
+
+
+class PlanStage(object):
+    """
+    Object describing one stage of a QueryPlan, with its estimated and measured output rows.
+    """
+
+    def __init__(self, name, estimated, key=None):
+        """
+        :param name: str description of the stage
+        :param estimated: float estimated number of rows output by the stage
+        :param key: str name of the stage shared by the queries of other dates, defaults to name
+        """
+        self.name = name
+        self.key = key or name
+        self.estimated = estimated
+        self.actual = 0
+        # Time spent producing the rows of the stage, including the time of the stages feeding it
+        self.seconds = 0.0
+
+
+class QueryPlan(object):
+    """
+    Object describing how a query is executed: an access path, the filters in evaluation order, the NEO
+    deduplication of NEO queries and the limit, or the top rows of the sort order.
+
+    Access paths:
+    - date: scan the rows of the date range
+    - value: rows of the value index of access_filter, restricted to the date range and sorted into date order
+    - bitmap: set bits of the hazardous BitmapIndex of access_filter, masked to the date range
+    """
+    AccessPaths = ('date', 'value', 'bitmap')
+
+    def __init__(self, date_range, access, access_filter, filters, number, return_object='NEO', sort_by=None,
+                 desc=False):
+        """
+        :param date_range: tuple of (start, end) date ordinals
+        :param access: str access path, one of QueryPlan.AccessPaths
+        :param access_filter: Filter answered by the 'value' or 'bitmap' access path, or None for 'date'
+        :param filters: list of Filters left to apply, in evaluation order
+        :param number: int maximum number of results, or None
+        :param return_object: str 'NEO' to deduplicate the rows of each NEO, 'Path' to return every matching orbit
+        :param sort_by: str Query.SortOptions name results are ordered by, or None for date order
+        :param desc: bool whether results are ordered from the highest value
+        """
+        self.date_range = date_range
+        self.access = access
+        self.access_filter = access_filter
+        self.filters = filters
+        self.number = number
+        self.return_object = return_object
+        self.sort_by = sort_by
+        self.desc = desc
+        self.stages = []
+
+    def add_stage(self, name, estimated, key=None):
+        stage = PlanStage(name, estimated, key)
+        self.stages.append(stage)
+        return stage
+
+    @staticmethod
+    def measure(stage, rows):
+        """
+        Lazily passes rows through, counting them and timing their production in the stage
+
+        :param stage: PlanStage to record into
+        :param rows: iterable of row ids output by the stage
+        :return: generator of the same row ids
+        """
+        iterator = iter(rows)
+        clock = time.perf_counter
+        while True:
+            start = clock()
+            try:
+                row = next(iterator)
+            except StopIteration:
+                stage.seconds += clock() - start
+                return
+            stage.seconds += clock() - start
+            stage.actual += 1
+            yield row
+
+    def record(self, metrics):
+        """
+        Adds the measured rows and own time of each stage to the counters and timers of a Metrics.
+
+        :param metrics: instrumentation.Metrics
+        :return: None
+        """
+        upstream = 0.0
+        for stage in self.stages:
+            metrics.count(f'search.{stage.key}.rows', stage.actual)
+            metrics.add_time(f'search.{stage.key}', max(stage.seconds - upstream, 0.0))
+            upstream = stage.seconds
+        return None
+
+    def __str__(self):
+        width = max([len(stage.name) for stage in self.stages] + [5]) + 3
+        lines = [f'{"stage":<{width}} {"est rows":>10} {"rows":>10} {"ms":>10}']
+        upstream = 0.0
+        for number, stage in enumerate(self.stages, start=1):
+            # Stage timings include their upstream stages, report each stage's own time
+            own = max(stage.seconds - upstream, 0.0)
+            upstream = stage.seconds
+            name = f'{number}. {stage.name}'
+            lines.append(f'{name:<{width}} {stage.estimated:>10.0f} {stage.actual:>10} {own * 1000:>10.3f}')
+        return '\n'.join(lines)
+
+
+class QueryPlanner(object):
+    """
+    Object choosing the QueryPlan of a query from the column statistics of a NEODatabase.
+    """
+
+    # Relative cost of a row found through a value index compared to a row scanned in a date range, as value
+    # index candidates are checked against the date range and sorted back into date order
+    IndexScanCost = 4
+
+    # Relative cost of a row of the date range scanned as a bit of a bitmap compared to a row scanned in Python
+    BitmapScanCost = 0.02
+
+    def __init__(self, db):
+        """
+        :param db: NEODatabase to plan queries on
+        """
+        self.db = db
+
+    def plan(self, date_range, filters, number, return_object='NEO', sort_by=None, desc=False):
+        """
+        :param date_range: tuple of (start, end) date ordinals
+        :param filters: list of Filters of the query
+        :param number: int maximum number of results, or None
+        :param return_object: str 'NEO' or 'Path', see QueryPlan
+        :param sort_by: str sort option, see QueryPlan
+        :param desc: bool sort order, see QueryPlan
+        :return: QueryPlan
+        """
+        statistics = self.db.get_statistics()
+        rows = self.db.search_dates(*date_range)
+        date_rows = len(rows)
+        date_fraction = date_rows / len(self.db) if len(self.db) else 0.0
+
+        # Each candidate access path, with the exact number of rows it yields and its cost
+        access, access_filter, access_rows, cost = 'date', None, date_rows, date_rows
+        for f in filters:
+            if f.column_name() == 'is_potentially_hazardous_asteroid' and f.operation == '=':
+                count = self.db.get_bitmap_index().count(f.cast_value(), rows.start, rows.stop)
+                candidate = ('bitmap', f, count, date_rows * QueryPlanner.BitmapScanCost + count)
+            elif f.column_name() in self.db.value_indexes:
+                count = self.db.value_indexes[f.column_name()].count(f.operation, f.cast_value())
+                candidate = ('value', f, count * date_fraction, count * QueryPlanner.IndexScanCost)
+            else:
+                continue
+            if candidate[3] < cost:
+                access, access_filter, access_rows, cost = candidate
+
+        estimates = {id(f): statistics.selectivity(f, date_range) for f in filters}
+        remaining = sorted((f for f in filters if f is not access_filter), key=lambda f: estimates[id(f)])
+        plan = QueryPlan(date_range, access, access_filter, remaining, number, return_object, sort_by, desc)
+
+        dates = f'{ordinal_to_date(date_range[0])}..{ordinal_to_date(date_range[1])}'
+        estimated = access_rows
+        if access == 'date':
+            plan.add_stage(f'date index scan {dates}', estimated, 'date index scan')
+        else:
+            plan.add_stage(f'{access} index scan {describe(access_filter)} within {dates}', estimated,
+                           f'{access} index scan {describe(access_filter)}')
+
+        for f in remaining:
+            estimated *= estimates[id(f)]
+            plan.add_stage(f'filter {describe(f)} (selectivity {estimates[id(f)]:.3f})', estimated,
+                           f'filter {describe(f)}')
+
+        if return_object == 'NEO':
+            estimated = min(estimated, len(self.db.neo_names))
+            plan.add_stage('unique NEOs', estimated)
+        if sort_by is not None:
+            order = f'{sort_by} {"desc" if desc else "asc"}'
+            if number is not None:
+                plan.add_stage(f'top {number} by {order}', min(estimated, number), 'top k')
+            else:
+                plan.add_stage(f'sort by {order}', estimated, 'sort')
+        elif number is not None:
+            plan.add_stage(f'limit {number}', min(estimated, number), 'limit')
+        return plan
+
+
+def describe(f):
+    """
+    :param f: Filter
+    :return: str short description of the filter
+    """
+    return f'{f.field} {f.operation} {f.value}'
@@ -1,11 +1,19 @@
-import datetime
+import heapq
+import math
 import operator as op
+import threading
 
-from collections import namedtuple
+from array import array
+from bisect import bisect_left
+from collections import namedtuple, OrderedDict
 from enum import Enum
+from itertools import compress, islice, repeat
 
+from database import BitmapIndex
 from exceptions import UnsupportedFeature
-from models import NearEarthObject, OrbitPath
+from instrumentation import METRICS
+from models import NearEarthObject, OrbitPath, date_to_ordinal, ordinal_to_date, period_bounds
+from planner import QueryPlanner
 
 
 class DateSearch(Enum):
@@ -29,10 +37,17 @@ class Query(object):
     to structure the query information into a format the NEOSearcher can use for date search.
     """
 
-    Selectors = namedtuple('Selectors', ['date_search', 'number', 'filters', 'return_object'])
+    Selectors = namedtuple('Selectors', ['date_search', 'number', 'filters', 'return_object', 'sort_by', 'desc'])
     DateSearch = namedtuple('DateSearch', ['type', 'values'])
     ReturnObjects = {'NEO': NearEarthObject, 'Path': OrbitPath}
 
+    SortOptions = {
+        # Sort option name to the NEODatabase column results are ordered by
+        'distance': 'miss_distance_kilometers',
+        'diameter': 'diameter_min_km',
+        'date': 'close_approach_date',
+    }
+
     def __init__(self, **kwargs):
         """
         :param kwargs: dict of search query parameters to determine which SearchOperation query to use
@@ -45,6 +60,8 @@ class Query(object):
         self.end_date = kwargs.get('end_date')
         self.number = kwargs.get('number')
         self.filter = kwargs.get('filter')
+        self.sort_by = kwargs.get('sort_by')
+        self.desc = bool(kwargs.get('desc'))
 
     def build_query(self):
         """
@@ -60,7 +77,15 @@ class Query(object):
         else:
             date_search = Query.DateSearch(type = 'interval', values = [self.start_date, self.end_date])
 
-        Selector = Query.Selectors(date_search = date_search, number = self.number, filters = self.filter, return_object = None)
+        return_object = self.return_object or 'NEO'
+        if return_object not in Query.ReturnObjects:
+            raise UnsupportedFeature(f'Unsupported return object: {return_object}')
+
+        if self.sort_by is not None and self.sort_by not in Query.SortOptions:
+            raise UnsupportedFeature(f'Unsupported sort option: {self.sort_by}')
+
+        Selector = Query.Selectors(date_search = date_search, number = self.number, filters = self.filter, return_object = return_object,
+                                   sort_by = self.sort_by, desc = self.desc)
         return Selector
 
 
@@ -125,31 +150,121 @@ class Filter(object):
         return defaultdict
 
 
-    def apply(self, results):
+    def cast_value(self):
         """
-        Function that applies the filter operation onto a set of results
+        Casts the raw filter value into the type of the property it filters on
 
-        :param results: List of Near Earth Object results
-        :return: filtered list of Near Earth Object results
+        :return: bool or float value of the filter
         """
-        # TODO: Takes a list of NearEarthObjects and applies the value of its filter operation to the results
-        filtered_results = []
         if(self.field == 'is_hazardous'):
-            # Casting for the value in the filter
-            if(self.value == 'True'):
-                casted_value = True
-            else:
-                casted_value = False
-        else:
-            casted_value = float(self.value)
+            return self.value == 'True'
+        return float(self.value)
 
-        neo_property = Filter.Options[self.field]
-        for result in results:
-            if(Filter.Operators[self.operation](getattr(result, neo_property), casted_value)): 
-                filtered_results.append(result)
-            
+    def column_name(self):
+        """
+        :return: str name of the NEODatabase column the filter applies to
+        """
+        return Filter.Options[self.field]
 
-        return filtered_results
+    @staticmethod
+    def compile(filters, db):
+        """
+        Class function that compiles a list of Filters into a single predicate over the database columns.
+
+        The filter clauses are bound to their columns, casted values and operators once, and evaluated in the given
+        order, so the QueryPlanner puts the most selective clause first.
+
+        :param filters: list of Filters, NEO and Path filters alike
+        :param db: NEODatabase holding the columns the filters apply to
+        :return: function taking an orbit row id and returning whether the row matches all filters
+        """
+        clauses = [(db.columns[f.column_name()], Filter.Operators[f.operation], f.cast_value()) for f in filters]
+
+        def matches(row):
+            for column, operation, value in clauses:
+                if not operation(column[row], value):
+                    return False
+            return True
+
+        return matches
+
+
+class ResultCache(object):
+    """
+    Object holding the result rows of recent queries, evicting the least recently used entries once either the
+    number of entries or the total size of the cached rows exceeds its bounds.
+
+    The cache is bound to a generation of the NEODatabase and is emptied when the database is reloaded.
+    """
+    Info = namedtuple('Info', ['hits', 'misses', 'entries', 'bytes'])
+
+    def __init__(self, max_entries=128, max_bytes=64 * 1024 * 1024):
+        """
+        :param max_entries: int maximum number of cached queries, 0 disables the cache
+        :param max_bytes: int maximum total size in bytes of the cached result rows
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.generation = None
+        self.lock = threading.Lock()
+
+    def get(self, key, generation):
+        """
+        :param key: hashable canonical query key
+        :param generation: int generation of the NEODatabase being searched
+        :return: array of cached result rows, or None on a miss
+        """
+        with self.lock:
+            if generation != self.generation:
+                self.clear()
+                self.generation = generation
+            rows = self.entries.get(key)
+            if rows is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return rows
+
+    def put(self, key, generation, rows):
+        """
+        :param key: hashable canonical query key
+        :param generation: int generation of the NEODatabase the rows were found in
+        :param rows: array of result rows
+        :return: None
+        """
+        size = rows.itemsize * len(rows)
+        with self.lock:
+            if generation != self.generation or not self.max_entries or size > self.max_bytes:
+                return None
+            if key in self.entries:
+                replaced = self.entries.pop(key)
+                self.bytes -= replaced.itemsize * len(replaced)
+            self.entries[key] = rows
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= evicted.itemsize * len(evicted)
+        return None
+
+    def clear(self):
+        """
+        Drops all cached results, keeping the hit and miss counters.
+
+        :return: None
+        """
+        self.entries.clear()
+        self.bytes = 0
+
+    def info(self):
+        """
+        :return: ResultCache.Info namedtuple with the hit and miss counters and the current cache size
+        """
+        return ResultCache.Info(self.hits, self.misses, len(self.entries), self.bytes)
 
 
 class NEOSearcher(object):
@@ -157,93 +272,450 @@ class NEOSearcher(object):
     Object with date search functionality on Near Earth Objects exposed by a generic
     search interface get_objects, which, based on the query specifications, determines
     how to perform the search.
+
+    Searches only read the NEODatabase, so a single loaded database can serve any number of queries. The
+    result rows of recent queries are kept in a ResultCache keyed on the canonical form of the query.
     """
 
-    def __init__(self, db):
+    # Calendar periods aggregate queries group orbits by
+    GroupOptions = ('day', 'week', 'month')
+
+    # Reductions of aggregate queries over the matching orbits of each period:
+    # - count: number of close approaches
+    # - neos: number of unique NEOs
+    # - hazardous: number of unique potentially hazardous NEOs
+    # - hazard_ratio: share of the unique NEOs that are potentially hazardous
+    # - min_distance, mean_distance, max_distance: miss distance in kilometers
+    Aggregates = ('count', 'neos', 'hazardous', 'hazard_ratio', 'min_distance', 'mean_distance', 'max_distance')
+
+    def __init__(self, db, cache_size=128, cache_bytes=64 * 1024 * 1024):
         """
-        :param db: NEODatabase holding the NearEarthObject instances and their OrbitPath instances
+        :param db: NEODatabase holding the columns of the Near Earth Objects and their orbits
+        :param cache_size: int maximum number of cached query results, 0 disables caching
+        :param cache_bytes: int maximum total size in bytes of the cached query results
         """
         self.db = db
-        # TODO: What kind of an instance variable can we use to connect DateSearch to how we do search?
-        self.NEOs = db.NEOs
-        self.date_to_NEOs = db.date_to_NEOs
+        self.cache = ResultCache(cache_size, cache_bytes)
+        self.planner = QueryPlanner(db)
+
+    def cache_key(self, query):
+        """
+        Canonicalizes Query.Selectors, so equivalent queries share a cache entry: dates are parsed to ordinals and
+        filters are parsed, casted and sorted.
 
+        :param query: Query.Selectors object with query information
+        :return: tuple hashable key of the query
+        """
+        date_range = self.date_range(query.date_search)
+        filters = Filter.create_filter_options(query.filters or [])
+        clauses = tuple(sorted(
+            (f.field, f.operation, f.cast_value()) for f in filters['NEO'] + filters['Path']
+        ))
+        return date_range, query.number, clauses, query.return_object, query.sort_by, query.desc
+
+    @METRICS.timed('search.get_objects')
     def get_objects(self, query):
         """
         Generic search interface that, depending on the details in the QueryBuilder (query) calls the
-        appropriate instance search function, then applys any filters, with distance as the last filter.
+        appropriate instance search function, then applys any filters in a single pass.
 
         Once any filters provided are applied, return the number of requested objects in the query.return_object
-        specified.
+        specified. Only those final results are materialized as NearEarthObject or OrbitPath views of the database
+        rows.
+
+        The search runs as a lazy pipeline: date scan, filters, deduplication of NEOs, then the limit, so it
+        stops scanning as soon as the requested number of objects is found. Filters are evaluated on every orbit
+        row, so a Path query returns each matching orbit and skips the deduplication. A sorted query keeps the
+        best matching orbit of each NEO and then the top number of rows with a bounded heap. The result rows are
+        cached, so a repeated query only creates the views again.
 
         :param query: Query.Selectors object with query information
         :return: Dataset of NearEarthObjects or OrbitalPaths
         """
-        # TODO: This is a generic method that will need to understand, using DateSearch, how to implement search
-        # TODO: Write instance methods that get_objects can use to implement the two types of DateSearch your project
-        # TODO: needs to support that then your filters can be applied to. Remember to return the number specified in
-        # TODO: the Query.Selectors as well as in the return_type from Query.Selectors
-        date_search = query.date_search
-        number = query.number
-        filters = query.filters
-        return_object = query.return_object
-        results = self.simple_search(date_search)
+        view = self.result_view(query)
+        return [view(row) for row in self.get_rows(query)]
 
+    def result_view(self, query):
+        """
+        :param query: Query.Selectors object with query information
+        :return: function creating the NearEarthObject or OrbitPath view of a result row
+        """
+        view = self.db.get_orbit if query.return_object == 'Path' else self.db.get_neo
+        if not METRICS.enabled:
+            return view
+
+        def counted_view(row):
+            result = view(row)
+            METRICS.count(f'objects.{type(result).__name__}')
+            if query.return_object == 'NEO':
+                METRICS.count('objects.OrbitPath', len(result.orbits))
+            return result
 
-        if filters != None:
-            filters_dict = Filter.create_filter_options(filters)
-            for i in range(len(filters_dict['NEO'])):
-                results = filters_dict['NEO'][i].apply(results)
+        return counted_view
+
+    def get_rows(self, query):
+        """
+        :param query: Query.Selectors object with query information
+        :return: array of the result rows, one per Near Earth Object or orbit, served from the cache when possible
+        """
+        key = self.cache_key(query)
+        generation = self.db.generation
+        rows = self.cache.get(key, generation)
+        METRICS.count('search.queries')
+        if rows is None:
+            if METRICS.enabled:
+                plan = self.plan(query)
+                rows = array('i', self.search_rows(query, plan, measure=True))
+                plan.record(METRICS)
+            else:
+                rows = array('i', self.search_rows(query))
+            self.cache.put(key, generation, rows)
+        return rows
 
-            for j in range(len(filters_dict['Path'])):
-                results = filters_dict['Path'][j].apply(results)
+    def get_objects_batch(self, queries):
+        """
+        Searches a batch of queries with shared scans, see get_rows_batch.
 
+        :param queries: list of Query.Selectors objects
+        :return: list of Datasets of NearEarthObjects or OrbitalPaths, one per query
+        """
+        return [[self.result_view(query)(row) for row in rows]
+                for query, rows in zip(queries, self.get_rows_batch(queries))]
 
-        # Last step is to cut by number
-        results = self.cut_by_number(results, number)
-    
-        return results
+    @METRICS.timed('search.get_rows_batch')
+    def get_rows_batch(self, queries):
+        """
+        Searches a batch of queries, scanning the rows shared by queries with overlapping date ranges once.
+
+        Queries not in the result cache are grouped by overlapping date ranges. Each distinct filter clause of a
+        group is evaluated once over the rows of the whole group into a bitmap, and each query combines the
+        bitmaps of its clauses with the rows of its own dates, so a batch of reports sharing dates and filters
+        costs one pass per distinct clause instead of one scan per query.
+
+        :param queries: list of Query.Selectors objects
+        :return: list of arrays of result rows, one per query
+        """
+        generation = self.db.generation
+        keys = [self.cache_key(query) for query in queries]
+        found = {}
+        pending = {}
+        for key, query in zip(keys, queries):
+            if key not in found and key not in pending:
+                rows = self.cache.get(key, generation)
+                if rows is None:
+                    pending[key] = query
+                else:
+                    found[key] = rows
+
+        # Group the queries by overlapping date ranges, in order of their first date
+        groups = []
+        group_end = None
+        for key in sorted(pending, key=lambda key: key[0]):
+            start_date, end_date = key[0]
+            if group_end is None or start_date > group_end:
+                groups.append([])
+                group_end = end_date
+            groups[-1].append(key)
+            group_end = max(group_end, end_date)
+
+        METRICS.count('search.batch.queries', len(queries))
+        METRICS.count('search.batch.groups', len(groups))
+        for group in groups:
+            for key, rows in zip(group, self.shared_scan([pending[key] for key in group])):
+                found[key] = rows
+                self.cache.put(key, generation, rows)
+
+        return [found[key] for key in keys]
+
+    @METRICS.timed('search.shared_scan')
+    def shared_scan(self, queries):
+        """
+        Searches queries with overlapping date ranges in one scan over the rows of all their dates.
+
+        :param queries: list of Query.Selectors objects
+        :return: list of arrays of result rows, one per query
+        """
+        date_ranges = [self.date_range(query.date_search) for query in queries]
+        rows = self.db.search_dates(min(start for start, _ in date_ranges), max(end for _, end in date_ranges))
+        clause_bitmaps = {}
+
+        def clause_bitmap(f):
+            clause = (f.column_name(), f.operation, f.cast_value())
+            if clause not in clause_bitmaps:
+                METRICS.count('search.batch.clauses')
+                METRICS.count('search.batch.rows_scanned', len(rows))
+                column = self.db.columns[clause[0]][rows.start:rows.stop]
+                flags = bytes(map(Filter.Operators[f.operation], column, repeat(clause[2])))
+                bits = flags.translate(BitmapIndex.BitTable)[::-1]
+                clause_bitmaps[clause] = int(bits, 2) << rows.start if bits else 0
+            return clause_bitmaps[clause]
 
-        
-    def simple_search(self, date_search):
-        # If only a sinlge date search is required
         results = []
-        if(date_search.type == 'single_date'):
-            for i in range(len(self.date_to_NEOs[date_search.values])):
-            
-                NEO_name = self.date_to_NEOs[date_search.values][i].name
-                if(NEO_name in self.NEOs.keys()):
-                    # To make sure only unique NEOs are printed
-                    results.append(self.NEOs[NEO_name])
-                    self.NEOs.pop(NEO_name, None)
-                    
+        for query, date_range in zip(queries, date_ranges):
+            query_rows = self.db.search_dates(*date_range)
+            bitmap = BitmapIndex.mask(query_rows.start, query_rows.stop)
+            filters_dict = Filter.create_filter_options(query.filters or [])
+            for f in filters_dict['NEO'] + filters_dict['Path']:
+                bitmap &= clause_bitmap(f)
+
+            matches = BitmapIndex.iter_rows(bitmap, query_rows.start, query_rows.stop)
+            if query.sort_by is not None:
+                if query.return_object == 'NEO':
+                    matches = self.best_rows(matches, query.sort_by, query.desc)
+                results.append(array('i', self.top_rows(matches, query.sort_by, query.desc, query.number)))
+                continue
+            if query.return_object == 'NEO':
+                matches = self.unique_neos(matches)
+            results.append(array('i', islice(matches, query.number)))
+        return results
 
-        else:
-            start_date = datetime.datetime.strptime(date_search.values[0], '%Y-%m-%d')  
-            end_date = datetime.datetime.strptime(date_search.values[1], '%Y-%m-%d')  
-            step = datetime.timedelta(days=1)
-
-            while(start_date <= end_date):
-                temp_date = start_date.date()
-                tmp_date_str = temp_date.strftime('%Y-%m-%d')
-                start_date += step 
-                for i in range(len(self.date_to_NEOs[tmp_date_str])):
-                    NEO_name = self.date_to_NEOs[tmp_date_str][i].name
-
-                    if(NEO_name in self.NEOs.keys()):
-                        # To make sure only unique NEOs are printed
-                        results.append(self.NEOs[NEO_name])
-                        self.NEOs.pop(NEO_name, None)
-                        
+    @METRICS.timed('search.aggregate')
+    def aggregate(self, query, group_by, aggregates):
+        """
+        Runs grouped reductions over the orbits matching the date search and filters of a query, without
+        creating any NearEarthObject or OrbitPath. The number, return object and sort options of the query do
+        not apply.
 
+        The matching rows are in date order, so each period is a contiguous slice of them: the slice bounds
+        are found by bisecting the date column, and each aggregate reduces the column slices of the period
+        with builtins, e.g. min over the miss distances.
+
+        :param query: Query.Selectors object with query information
+        :param group_by: str one of NEOSearcher.GroupOptions
+        :param aggregates: list of str NEOSearcher.Aggregates names
+        :return: list of dicts with the 'period' start date and the value of each aggregate, one per period with
+                 matching orbits, in date order
+        """
+        if group_by not in NEOSearcher.GroupOptions:
+            raise UnsupportedFeature(f'Unsupported group option: {group_by}')
+        for name in aggregates:
+            if name not in NEOSearcher.Aggregates:
+                raise UnsupportedFeature(f'Unsupported aggregate: {name}')
+
+        filters_dict = Filter.create_filter_options(query.filters or [])
+        plan = self.planner.plan(
+            self.date_range(query.date_search), filters_dict['NEO'] + filters_dict['Path'], None, 'Path'
+        )
+        rows = self.search_rows(query, plan)
+        if not isinstance(rows, range):
+            rows = array('i', rows)
+
+        dates = self.db.columns['close_approach_date']
+        groups = []
+        start = 0
+        while start < len(rows):
+            period, next_period = period_bounds(dates[rows[start]], group_by)
+            stop = bisect_left(rows, bisect_left(dates, next_period, rows[start]), start)
+            group = {'period': ordinal_to_date(period)}
+            group.update(self.reduce_rows(rows[start:stop], aggregates))
+            groups.append(group)
+            start = stop
+        METRICS.count('search.aggregate.groups', len(groups))
+        return groups
+
+    def reduce_rows(self, rows, aggregates):
+        """
+        :param rows: range or array of orbit row ids, not empty
+        :param aggregates: list of str NEOSearcher.Aggregates names
+        :return: dict of the value of each aggregate over the rows
+        """
+        columns = self.db.columns
+
+        def values(name):
+            if isinstance(rows, range):
+                return columns[name][rows.start:rows.stop]
+            return list(map(columns[name].__getitem__, rows))
+
+        distances = None
+        neos = None
+        hazardous = None
+        results = {}
+        for name in aggregates:
+            if name == 'count':
+                results[name] = len(rows)
+            elif name.endswith('_distance'):
+                if distances is None:
+                    distances = values('miss_distance_kilometers')
+                if name == 'min_distance':
+                    results[name] = min(distances)
+                elif name == 'max_distance':
+                    results[name] = max(distances)
+                else:
+                    results[name] = math.fsum(distances) / len(rows)
+            else:
+                if neos is None:
+                    neo_values = values('neo')
+                    neos = set(neo_values)
+                    hazardous = set(compress(neo_values, values('is_potentially_hazardous_asteroid')))
+                if name == 'neos':
+                    results[name] = len(neos)
+                elif name == 'hazardous':
+                    results[name] = len(hazardous)
+                else:
+                    results[name] = len(hazardous) / len(neos)
         return results
 
+    def iter_objects(self, query):
+        """
+        Lazily yields the results of a query, bypassing the result cache, so that results can be streamed to a
+        NEOWriter without holding them all in memory.
 
-    def cut_by_number(self, results, number):
-        if(len(results) > number):
-            # To make sure that the results won't be larger than the required number
-            results =  results[:number]
-        else:
-            pass
+        :param query: Query.Selectors object with query information
+        :return: generator of NearEarthObjects or OrbitPaths
+        """
+        view = self.result_view(query)
+        METRICS.count('search.queries')
+        if not METRICS.enabled:
+            for row in self.search_rows(query):
+                yield view(row)
+            return
+
+        plan = self.plan(query)
+        try:
+            for row in self.search_rows(query, plan, measure=True):
+                yield view(row)
+        finally:
+            plan.record(METRICS)
+
+    def explain(self, query):
+        """
+        Runs a query, bypassing the result cache, while measuring the rows and time of every stage of its plan.
+
+        :param query: Query.Selectors object with query information
+        :return: tuple of (list of NearEarthObjects or OrbitPaths, QueryPlan with the measured stages)
+        """
+        plan = self.plan(query)
+        rows = list(self.search_rows(query, plan, measure=True))
+        plan.record(METRICS)
+        view = self.result_view(query)
+        return [view(row) for row in rows], plan
+
+    @METRICS.timed('search.plan')
+    def plan(self, query):
+        """
+        :param query: Query.Selectors object with query information
+        :return: QueryPlan chosen by the QueryPlanner
+        """
+        filters_dict = Filter.create_filter_options(query.filters or [])
+        return self.planner.plan(
+            self.date_range(query.date_search), filters_dict['NEO'] + filters_dict['Path'], query.number,
+            query.return_object, query.sort_by, query.desc
+        )
+
+    def search_rows(self, query, plan=None, measure=False):
+        """
+        Runs the search pipeline of a query without materializing any results.
 
+        :param query: Query.Selectors object with query information
+        :param plan: QueryPlan of the query, planned when not provided
+        :param measure: bool whether to record the rows and time of each stage in the plan, evaluating each
+                        filter as its own stage
+        :return: iterator of the result orbit row ids
+        """
+        plan = plan or self.plan(query)
+        stages = iter(plan.stages)
+
+        def stage(rows):
+            return plan.measure(next(stages), rows) if measure else rows
+
+        results = stage(self.access_rows(plan))
+
+        if measure:
+            for f in plan.filters:
+                results = stage(filter(Filter.compile([f], self.db), results))
+        elif plan.filters:
+            # All remaining NEO and Path filters are evaluated together in a single pass over the results
+            results = filter(Filter.compile(plan.filters, self.db), results)
+
+        if plan.sort_by is not None:
+            if plan.return_object == 'NEO':
+                results = stage(self.best_rows(results, plan.sort_by, plan.desc))
+            return stage(self.top_rows(results, plan.sort_by, plan.desc, plan.number))
+
+        if plan.return_object == 'NEO':
+            results = stage(self.unique_neos(results))
+
+        # Last step is to cut by number
+        if plan.number is not None:
+            results = stage(islice(results, plan.number))
         return results
+
+    def access_rows(self, plan):
+        """
+        Finds the candidate rows of a plan through its access path, in date order.
+
+        :param plan: QueryPlan
+        :return: iterable of orbit row ids
+        """
+        rows = self.db.search_dates(*plan.date_range)
+        if plan.access == 'date':
+            return rows
+
+        f = plan.access_filter
+        if plan.access == 'bitmap':
+            bitmap_index = self.db.get_bitmap_index()
+            return bitmap_index.iter_rows(bitmap_index.bitmap(f.cast_value()), rows.start, rows.stop)
+
+        candidates = self.db.value_indexes[f.column_name()].search(f.operation, f.cast_value())
+        return sorted(row for row in candidates if rows.start <= row < rows.stop)
+
+    def date_range(self, date_search):
+        """
+        :param date_search: Query.DateSearch namedtuple with a single date or a [start, end] interval
+        :return: tuple of (start, end) date ordinals
+        """
+        if(date_search.type == 'single_date'):
+            return date_to_ordinal(date_search.values), date_to_ordinal(date_search.values)
+        return date_to_ordinal(date_search.values[0]), date_to_ordinal(date_search.values[1])
+
+    def unique_neos(self, rows):
+        """
+        Lazily yields the first of the given rows for each unique Near Earth Object
+
+        :param rows: iterable of orbit row ids
+        :return: generator of orbit row ids
+        """
+        neos = self.db.columns['neo']
+        # Per-query bitmap of the NEOs already returned, so the database itself is never modified
+        seen = bytearray(len(self.db.neo_names))
+        for row in rows:
+            neo = neos[row]
+            if not seen[neo]:
+                seen[neo] = 1
+                yield row
+
+    def best_rows(self, rows, sort_by, desc):
+        """
+        Collects the row of each unique Near Earth Object ranked first by a sort option, the earliest on ties
+
+        :param rows: iterable of orbit row ids, in date order
+        :param sort_by: str one of Query.SortOptions
+        :param desc: bool whether the highest value ranks first
+        :return: list of orbit row ids, one per Near Earth Object
+        """
+        neos = self.db.columns['neo']
+        column = self.db.columns[Query.SortOptions[sort_by]]
+        better = op.gt if desc else op.lt
+        best = {}
+        for row in rows:
+            neo = neos[row]
+            current = best.get(neo)
+            if current is None or better(column[row], column[current]):
+                best[neo] = row
+        return list(best.values())
+
+    def top_rows(self, rows, sort_by, desc, number=None):
+        """
+        Orders rows by a sort option, keeping only the first number of them with a bounded heap, in
+        O(n log number). Rows with equal values keep their given order.
+
+        :param rows: iterable of orbit row ids
+        :param sort_by: str one of Query.SortOptions
+        :param desc: bool whether to order from the highest value
+        :param number: int number of rows to keep, or None for all rows
+        :return: list of orbit row ids
+        """
+        key = self.db.columns[Query.SortOptions[sort_by]].__getitem__
+        if number is None:
+            return sorted(rows, key=key, reverse=desc)
+        return (heapq.nlargest if desc else heapq.nsmallest)(number, rows, key=key)
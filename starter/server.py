@@ -0,0 +1,223 @@
+"""
+Long-running query server for the Near Earth Object database.
+
+The server loads a NEODatabase once and answers queries over a small JSON over HTTP endpoint, so repeated
+queries skip the interpreter startup and data load of main.py. Requests are accepted by an asyncio front end
+and searched on a pool of worker threads sharing the loaded database.
+
+Endpoints:
+- GET /health: size of the loaded database and the hit/miss counters of the query result cache
+- GET /metrics: snapshot of the instrumentation timers and counters, collected when the server runs with --stats
+- POST /query: JSON object of the Query options (date, start_date, end_date, number, filter, return_object,
+  sort_by, desc),
+  answered with the JSON list of matching Near Earth Objects and their orbits, or of matching orbits for a
+  return_object of Path
+"""
+
+import asyncio
+import http.client
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from exceptions import QueryServerError, UnsupportedFeature
+from instrumentation import METRICS
+from models import NearEarthObject, OrbitPath
+from search import Query, NEOSearcher
+
+# Query options forwarded from a client to the server
+QueryOptions = ('date', 'start_date', 'end_date', 'number', 'filter', 'return_object', 'sort_by', 'desc')
+
+Reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+
+
+def neo_to_dict(NEO):
+    """
+    :param NEO: NearEarthObject
+    :return: dict JSON representation of the Near Earth Object and its orbits
+    """
+    return {
+        'id': NEO.id,
+        'name': NEO.name,
+        'is_potentially_hazardous_asteroid': NEO.is_potentially_hazardous_asteroid,
+        'estimated_diameter_min_kilometers': NEO.diameter_min_km,
+        'miss_distance_kilometers': NEO.miss_distance_kilometers,
+        'orbits': [
+            {'close_approach_date': orbit.close_approach_date,
+             'miss_distance_kilometers': orbit.miss_distance_kilometers}
+            for orbit in NEO.orbits
+        ],
+    }
+
+
+def neo_from_dict(attributes):
+    """
+    :param attributes: dict JSON representation of a Near Earth Object, see neo_to_dict
+    :return: NearEarthObject with its OrbitPaths
+    """
+    NEO = NearEarthObject(**attributes)
+    for orbit in attributes['orbits']:
+        NEO.update_orbits(OrbitPath(
+            neo_id=NEO.id, name=NEO.name,
+            is_potentially_hazardous_asteroid=NEO.is_potentially_hazardous_asteroid,
+            estimated_diameter_min_kilometers=NEO.diameter_min_km, **orbit
+        ))
+    return NEO
+
+
+def orbit_to_dict(orbit):
+    """
+    :param orbit: OrbitPath
+    :return: dict JSON representation of the orbit and the Near Earth Object attributes recorded with it
+    """
+    return {
+        'neo_id': orbit.neo_id,
+        'name': orbit.neo_name,
+        'close_approach_date': orbit.close_approach_date,
+        'miss_distance_kilometers': orbit.miss_distance_kilometers,
+        'is_potentially_hazardous_asteroid': orbit.is_potentially_hazardous_asteroid,
+        'estimated_diameter_min_kilometers': orbit.diameter_min_km,
+    }
+
+
+class NEOServer(object):
+    """
+    Object serving NEOSearcher queries on a loaded NEODatabase over HTTP.
+    """
+
+    def __init__(self, db, host='127.0.0.1', port=8642, threads=4):
+        """
+        :param db: loaded NEODatabase to search
+        :param host: str host to bind
+        :param port: int port to bind, 0 picks a free port
+        :param threads: int number of worker threads running searches
+        """
+        self.db = db
+        self.searcher = NEOSearcher(db)
+        self.host = host
+        self.port = port
+        self.threads = threads
+        self.loop = None
+        self.ready = threading.Event()
+
+    def serve(self):
+        """
+        Runs the server until stop is called. The bound port is available in port once ready is set.
+
+        :return: None
+        """
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        executor = ThreadPoolExecutor(max_workers=self.threads)
+        self.loop.set_default_executor(executor)
+
+        server = self.loop.run_until_complete(asyncio.start_server(self.handle, self.host, self.port))
+        self.port = server.sockets[0].getsockname()[1]
+        self.ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            server.close()
+            self.loop.run_until_complete(server.wait_closed())
+            executor.shutdown(wait=True)
+            self.loop.close()
+
+    def stop(self):
+        """
+        Stops a running server, safe to call from any thread.
+
+        :return: None
+        """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def search(self, options):
+        """
+        Runs a query on the loaded database, called on a worker thread.
+
+        :param options: dict of Query options
+        :return: list of dict JSON representations of the resulting Near Earth Objects or orbits
+        """
+        query_selectors = Query(**options).build_query()
+        to_dict = orbit_to_dict if query_selectors.return_object == 'Path' else neo_to_dict
+        return [to_dict(result) for result in self.searcher.get_objects(query_selectors)]
+
+    async def dispatch(self, method, path, body):
+        """
+        Routes a request to its endpoint.
+
+        :return: tuple of (int HTTP status, dict JSON payload)
+        """
+        if path == '/health' and method == 'GET':
+            return 200, {
+                'rows': len(self.db), 'neos': len(self.db.neo_names), 'cache': self.searcher.cache.info()._asdict()
+            }
+        if path == '/metrics' and method == 'GET':
+            return 200, {'enabled': METRICS.enabled, **METRICS.snapshot()}
+        if path == '/query' and method == 'POST':
+            options = json.loads(body.decode('utf-8') or '{}')
+            if not isinstance(options, dict):
+                raise ValueError('Query must be a JSON object')
+            options = {key: value for key, value in options.items() if key in QueryOptions}
+            results = await self.loop.run_in_executor(None, self.search, options)
+            return 200, {'results': results}
+        return 404, {'error': f'No route for {method} {path}'}
+
+    async def handle(self, reader, writer):
+        """
+        Answers a single HTTP/1.1 request per connection.
+        """
+        try:
+            method, path, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                key, _, value = line.decode('latin-1').partition(':')
+                headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            status, payload = await self.dispatch(method, path, body)
+        except (ValueError, KeyError, TypeError, UnsupportedFeature, asyncio.IncompleteReadError) as e:
+            status, payload = 400, {'error': str(e)}
+        except Exception as e:
+            status, payload = 500, {'error': str(e)}
+
+        data = json.dumps(payload).encode('utf-8')
+        writer.write(
+            f'HTTP/1.1 {status} {Reasons[status]}\r\n'
+            f'Content-Type: application/json\r\n'
+            f'Content-Length: {len(data)}\r\n'
+            f'Connection: close\r\n\r\n'.encode('latin-1') + data
+        )
+        await writer.drain()
+        writer.close()
+
+
+def remote_query(address, **kwargs):
+    """
+    Forwards query options to a running NEOServer.
+
+    :param address: str HOST:PORT of the server
+    :param kwargs: dict of Query options, options other than QueryOptions are ignored
+    :return: list of NearEarthObjects, or OrbitPaths for a return_object of Path
+    :raises QueryServerError: when the server cannot be reached or rejects the query
+    """
+    host, _, port = address.rpartition(':')
+    options = {key: kwargs[key] for key in QueryOptions if kwargs.get(key) is not None}
+
+    connection = http.client.HTTPConnection(host or '127.0.0.1', int(port))
+    try:
+        connection.request('POST', '/query', body=json.dumps(options), headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        payload = json.loads(response.read().decode('utf-8'))
+    except (OSError, http.client.HTTPException, ValueError) as e:
+        raise QueryServerError(f'Cannot query server at {address}: {e}')
+    finally:
+        connection.close()
+
+    if response.status != 200:
+        raise QueryServerError(payload.get('error', f'Server error {response.status}'))
+    if options.get('return_object') == 'Path':
+        return [OrbitPath(**attributes) for attributes in payload['results']]
+    return [neo_from_dict(attributes) for attributes in payload['results']]
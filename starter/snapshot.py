@@ -0,0 +1,427 @@
+"""
+Versioned binary snapshots of a loaded NEODatabase.
+
+A snapshot is written next to the source csv file and holds the database columns as raw typed arrays plus the
+interned name and id tables, so later runs can memory-map it instead of parsing the csv again. The snapshot
+records a signature of the csv file it was built from (size, modification time and a hash of its first and
+last bytes) and is only used while that signature still matches.
+
+Mapped snapshots are read-only and nothing is decoded up front: columns and indexes are memoryviews over the
+mapping and strings are decoded from their heap when accessed, so processes mapping the same snapshot share its
+pages in the OS page cache and only fault in the pages their queries touch.
+
+Rows appended to the database after the snapshot was written are added to it incrementally. Every segment is
+a single extent with spare capacity after its data: appended rows are written in place into the spare capacity,
+and a segment outgrowing its capacity is moved to the end of the snapshot with twice the capacity it needs. The
+footer is then written again after the old footer, which is only left behind as unused space, so mapped segments
+never have to be copied and an append only reads the trailer, the footer and the moved segments. Moved segments,
+replaced indexes and old footers leave unused space behind, the snapshot is rewritten once it holds more unused
+than used bytes.
+
+Appends take an exclusive lock on the snapshot and readers a shared lock while they map it and read its footer,
+so a reader never sees a footer being written. Locks are advisory and only taken where fcntl is available.
+Appended rows are only stored in the snapshot, never in its csv file: the footer lists the appended data, and a
+snapshot listing any is never replaced by a snapshot of the csv file alone, see appended_data.
+
+Layout:
+- prefix: magic bytes and format version
+- extents: raw column and index arrays and string tables, each aligned to 8 bytes and followed by its spare
+  capacity. A string table of n strings is an extent of n + 1 int64 offsets and an extent of the heap of the
+  utf-8 encoded strings
+- footer: utf-8 JSON describing the source signature, the appended files, the column statistics, the unused
+  bytes and the offset, size, capacity and length of the extent of every segment and index
+- trailer: footer length and magic bytes
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections import namedtuple
+from collections.abc import Sequence
+from contextlib import contextmanager
+
+from exceptions import SnapshotError
+
+try:
+    import fcntl
+except ImportError:
+    # Snapshots are not locked where fcntl is unavailable, e.g. on Windows
+    fcntl = None
+
+MAGIC = b'NEOSNAP\0'
+VERSION = 4
+Prefix = struct.Struct('<8sI4x')
+Trailer = struct.Struct('<Q8s')
+
+# Bytes hashed from each end of the source file for its signature
+SampleBytes = 64 * 1024
+Alignment = 8
+
+# Spare capacity of the extents of a new snapshot, as a fraction of their size
+Slack = 0.25
+
+# Typecode of the string table segments, and of their offsets
+StringTable = 's'
+StringOffset = 'q'
+StringTables = ('neo_ids', 'neo_names')
+# Name suffix of the segment holding the heap of a string table
+HeapSuffix = '.heap'
+
+# Contents of a snapshot, see read_snapshot
+Snapshot = namedtuple('Snapshot', ['columns', 'neo_ids', 'neo_names', 'statistics', 'indexes'])
+
+
+class StringHeap(Sequence):
+    """
+    Read-only sequence of the strings of a string table extent, each decoded from the heap when accessed.
+    """
+
+    def __init__(self, offsets, heap):
+        """
+        :param offsets: memoryview of the n + 1 offsets of the strings in the heap
+        :param heap: memoryview of the utf-8 encoded strings
+        """
+        self.offsets = offsets
+        self.heap = heap
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('StringHeap index out of range')
+        return str(self.heap[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+    def __eq__(self, other):
+        return isinstance(other, Sequence) and len(self) == len(other) and all(map(str.__eq__, self, other))
+
+
+def snapshot_path(filename):
+    """
+    :param filename: str representing the pathway of the source csv file
+    :return: str representing the pathway of the snapshot of that file
+    """
+    return f'{filename}.snapshot'
+
+
+def source_signature(filename):
+    """
+    Computes the signature identifying the current contents of a source file.
+
+    :param filename: str representing the pathway of the source csv file
+    :return: dict with the size, modification time and sampled hash of the file
+    """
+    stat = os.stat(filename)
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as source:
+        digest.update(source.read(SampleBytes))
+        if stat.st_size > SampleBytes:
+            source.seek(-SampleBytes, os.SEEK_END)
+            digest.update(source.read(SampleBytes))
+
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': digest.hexdigest()}
+
+
+def _aligned(size):
+    return size + (-size % Alignment)
+
+
+def _string_table(values, base=0):
+    """
+    :param values: list of str
+    :param base: int offset in the heap of the first string, the size of the heap the strings are appended to
+    :return: tuple of (array of the n + 1 offsets of the strings, bytes of their utf-8 heap)
+    """
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = array(StringOffset, [base])
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+    return offsets, b''.join(encoded)
+
+
+def _segments(columns, neo_ids, neo_names, heap_sizes=None):
+    """
+    :param columns: dict of column name to array or memoryview
+    :param neo_ids: list of str Near Earth Object ids
+    :param neo_names: list of str Near Earth Object names
+    :param heap_sizes: dict of string table name to the size of its heap, when the strings are appended to it
+    :return: list of (name, typecode, length, bytes) of the segments
+    """
+    segments = [(name, _typecode(column), len(column), column.tobytes()) for name, column in columns.items()]
+    for name, values in zip(StringTables, (neo_ids, neo_names)):
+        offsets, heap = _string_table(values, heap_sizes[name] if heap_sizes else 0)
+        if heap_sizes:
+            # The offset of the first string is already the last offset of the table
+            offsets = offsets[1:]
+        segments.append((name, StringTable, len(values), offsets.tobytes()))
+        segments.append((f'{name}{HeapSuffix}', 'B', len(heap), heap))
+    return segments
+
+
+def _typecode(column):
+    # Arrays and memoryviews mapped from a previous snapshot alike
+    return column.format if isinstance(column, memoryview) else column.typecode
+
+
+@contextmanager
+def _locked(snapshot, exclusive=False):
+    """
+    Locks an open snapshot for the duration of the context, waiting for any conflicting lock to be released. The
+    lock is released explicitly, as a mapping of the snapshot keeps its file open.
+
+    :param snapshot: file of the snapshot
+    :param exclusive: bool whether to take an exclusive lock, for writing, or a shared lock, for reading
+    :return: context manager
+    """
+    if fcntl is None:
+        yield
+        return
+    fcntl.flock(snapshot.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    try:
+        yield
+    finally:
+        fcntl.flock(snapshot.fileno(), fcntl.LOCK_UN)
+
+
+def _write_extent(snapshot, typecode, length, data, capacity):
+    """
+    Writes data as a new extent at the current, aligned, position of the snapshot and moves past its capacity.
+
+    :return: dict describing the segment of the extent
+    """
+    offset = snapshot.tell()
+    snapshot.write(data)
+    snapshot.seek(offset + capacity)
+    return {'typecode': typecode, 'offset': offset, 'nbytes': len(data), 'capacity': capacity, 'length': length}
+
+
+def _write_footer(snapshot, footer):
+    footer_bytes = json.dumps(footer).encode('utf-8')
+    snapshot.write(footer_bytes)
+    snapshot.write(Trailer.pack(len(footer_bytes), MAGIC))
+
+
+def _parse_footer(prefix, tail, path):
+    """
+    :param prefix: bytes-like start of the snapshot, at least the prefix
+    :param tail: bytes-like end of the snapshot, at least the footer and the trailer, e.g. the whole snapshot
+    :param path: str representing the pathway of the snapshot, for error messages
+    :return: tuple of (dict footer, int length of the footer)
+    """
+    try:
+        magic, version = Prefix.unpack_from(prefix, 0)
+        if magic != MAGIC or version != VERSION:
+            raise SnapshotError(f'Unsupported snapshot format {magic!r} version {version}')
+        footer_length, trailer_magic = Trailer.unpack_from(tail, len(tail) - Trailer.size)
+        if trailer_magic != MAGIC or footer_length > len(tail) - Trailer.size:
+            raise SnapshotError(f'Incomplete snapshot {path}')
+        footer_end = len(tail) - Trailer.size
+        footer = json.loads(bytes(tail[footer_end - footer_length:footer_end]).decode('utf-8'))
+    except (struct.error, ValueError) as e:
+        raise SnapshotError(f'Corrupt snapshot {path}: {e}')
+
+    if footer['byteorder'] != sys.byteorder:
+        raise SnapshotError(f'Snapshot {path} was written with {footer["byteorder"]} byte order')
+    return footer, footer_length
+
+
+def _read_footer(snapshot, path):
+    """
+    Reads the footer of an open snapshot from its prefix and its end only.
+
+    :param snapshot: binary file of the snapshot
+    :param path: str representing the pathway of the snapshot, for error messages
+    :return: tuple of (dict footer, int offset of the footer)
+    """
+    size = snapshot.seek(0, os.SEEK_END)
+    if size < Prefix.size + Trailer.size:
+        raise SnapshotError(f'Incomplete snapshot {path}')
+    snapshot.seek(0)
+    prefix = snapshot.read(Prefix.size)
+    snapshot.seek(size - Trailer.size)
+    footer_length, _ = Trailer.unpack(snapshot.read(Trailer.size))
+    footer_start = max(size - Trailer.size - footer_length, 0)
+    snapshot.seek(footer_start)
+    footer, footer_length = _parse_footer(prefix, snapshot.read(), path)
+    return footer, size - Trailer.size - footer_length
+
+
+def write_snapshot(path, signature, columns, neo_ids, neo_names, statistics=None, indexes=None, appended=None):
+    """
+    Writes a snapshot atomically, replacing any previous snapshot at path.
+
+    :param path: str representing the pathway of the snapshot
+    :param signature: dict source signature, see source_signature
+    :param columns: dict of column name to array
+    :param neo_ids: list of str interned Near Earth Object ids
+    :param neo_names: list of str interned Near Earth Object names
+    :param statistics: dict JSON serializable column statistics, stored in the footer
+    :param indexes: dict of index name to array, derived from the columns
+    :param appended: list of str descriptions of the data appended to the source, recorded in the footer
+    :return: None
+    """
+    footer = {'byteorder': sys.byteorder, 'source': signature, 'appended': list(appended or []),
+              'statistics': statistics, 'unused': 0, 'segments': {}, 'indexes': {}}
+
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as snapshot:
+        snapshot.write(Prefix.pack(MAGIC, VERSION))
+        for name, typecode, length, data in _segments(columns, neo_ids, neo_names):
+            capacity = _aligned(len(data) + int(len(data) * Slack))
+            footer['segments'][name] = _write_extent(snapshot, typecode, length, data, capacity)
+        for name, index in (indexes or {}).items():
+            data = index.tobytes()
+            footer['indexes'][name] = _write_extent(snapshot, _typecode(index), len(index), data, _aligned(len(data)))
+        _write_footer(snapshot, footer)
+
+    os.replace(temp_path, path)
+    return None
+
+
+def append_snapshot(path, signature, columns, neo_ids, neo_names, statistics=None, appended=None, indexes=None):
+    """
+    Appends rows, and the Near Earth Objects they introduce, to an existing snapshot in place.
+
+    Rows are written into the spare capacity of their segments, segments without enough capacity left are moved
+    to the end of the snapshot. The indexes replace the stored indexes, which describe the rows before the
+    append. The new footer is written after the old one while holding an exclusive lock, see read_snapshot.
+
+    :param path: str representing the pathway of the snapshot
+    :param signature: dict source signature the snapshot must have been written from
+    :param columns: dict of column name to array of the appended rows
+    :param neo_ids: list of str ids of the Near Earth Objects interned after those already in the snapshot
+    :param neo_names: list of str names of the Near Earth Objects interned after those already in the snapshot
+    :param statistics: dict JSON serializable column statistics of all rows, replacing the stored statistics
+    :param appended: str description of the appended data, recorded in the footer
+    :param indexes: dict of index name to array of all rows, replacing the stored indexes
+    :return: bool whether the snapshot holds more unused than used bytes, and should be written again
+    :raises SnapshotError: when the snapshot is missing, stale, from another version or corrupt
+    """
+    try:
+        snapshot = open(path, 'r+b')
+    except OSError as e:
+        raise SnapshotError(f'Cannot open snapshot {path}: {e}')
+
+    with snapshot, _locked(snapshot, exclusive=True):
+        footer, footer_start = _read_footer(snapshot, path)
+        if footer['source'] != signature:
+            raise SnapshotError(f'Snapshot {path} is stale')
+
+        # The old footer stays in place until the new one is written, only then it becomes unused space
+        end = _aligned(snapshot.seek(0, os.SEEK_END))
+        footer['unused'] += end - footer_start
+        segments = footer['segments']
+        heap_sizes = {name: segments[f'{name}{HeapSuffix}']['nbytes'] for name in StringTables}
+        for name, typecode, length, data in _segments(columns, neo_ids, neo_names, heap_sizes):
+            segment = segments[name]
+            if segment['nbytes'] + len(data) <= segment['capacity']:
+                snapshot.seek(segment['offset'] + segment['nbytes'])
+                snapshot.write(data)
+                segment['nbytes'] += len(data)
+                segment['length'] += length
+                continue
+
+            # Move the segment to the end, with room for as many rows again
+            snapshot.seek(segment['offset'])
+            data = snapshot.read(segment['nbytes']) + data
+            snapshot.seek(end)
+            segments[name] = _write_extent(
+                snapshot, typecode, segment['length'] + length, data, _aligned(2 * len(data))
+            )
+            footer['unused'] += segment['capacity']
+            end = snapshot.tell()
+
+        snapshot.seek(end)
+        footer['unused'] += sum(index['capacity'] for index in footer['indexes'].values())
+        footer['indexes'] = {}
+        for name, index in (indexes or {}).items():
+            data = index.tobytes()
+            footer['indexes'][name] = _write_extent(snapshot, _typecode(index), len(index), data, _aligned(len(data)))
+        footer['statistics'] = statistics
+        footer['appended'].append(appended)
+        _write_footer(snapshot, footer)
+
+    used = sum(segment['nbytes'] for segment in list(segments.values()) + list(footer['indexes'].values()))
+    return footer['unused'] > used
+
+
+def read_snapshot(path, signature=None):
+    """
+    Memory-maps a snapshot, provided it was written from a source with the given signature.
+
+    Nothing is copied: columns and indexes are returned as read-only memoryviews over the mapping, and string
+    tables as StringHeaps.
+
+    :param path: str representing the pathway of the snapshot
+    :param signature: dict source signature the snapshot must match, None to use the snapshot as is
+    :return: Snapshot namedtuple of (dict of column name to memoryview, neo ids, neo names,
+             dict of column statistics or None, dict of index name to memoryview)
+    :raises SnapshotError: when the snapshot is missing, stale, from another version or corrupt
+    """
+    try:
+        snapshot = open(path, 'rb')
+    except OSError as e:
+        raise SnapshotError(f'Cannot map snapshot {path}: {e}')
+
+    # Appends never change the mapped bytes, only the footer must not be read while it is being written
+    with snapshot, _locked(snapshot):
+        try:
+            mapping = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise SnapshotError(f'Cannot map snapshot {path}: {e}')
+        footer, footer_length = _parse_footer(mapping, mapping, path)
+
+    footer_start = len(mapping) - Trailer.size - footer_length
+    if signature is not None and footer['source'] != signature:
+        raise SnapshotError(f'Snapshot {path} is stale')
+
+    buffer = memoryview(mapping)
+    extents = {}
+    for name, segment in list(footer['segments'].items()) + list(footer['indexes'].items()):
+        if segment['offset'] + segment['nbytes'] > footer_start:
+            raise SnapshotError(f'Truncated snapshot {path}')
+        extents[name] = buffer[segment['offset']:segment['offset'] + segment['nbytes']]
+
+    columns = {}
+    tables = {}
+    for name, segment in footer['segments'].items():
+        if segment['typecode'] == StringTable:
+            tables[name] = StringHeap(extents[name].cast(StringOffset), extents[f'{name}{HeapSuffix}'])
+        elif not name.endswith(HeapSuffix):
+            columns[name] = extents[name].cast(segment['typecode'])
+    indexes = {name: extents[name].cast(index['typecode']) for name, index in footer['indexes'].items()}
+
+    return Snapshot(columns, tables.get('neo_ids', []), tables.get('neo_names', []), footer.get('statistics'), indexes)
+
+
+def appended_data(path):
+    """
+    Reads the list of the data appended to a snapshot, whatever its source signature and format version, so a
+    snapshot holding appended rows is not replaced by a snapshot of its csv file alone.
+
+    :param path: str representing the pathway of the snapshot
+    :return: list of str descriptions of the appended data, empty when the snapshot is missing or has no
+             readable footer
+    """
+    try:
+        with open(path, 'rb') as snapshot, _locked(snapshot):
+            size = snapshot.seek(0, os.SEEK_END)
+            if size < Trailer.size:
+                return []
+            snapshot.seek(size - Trailer.size)
+            footer_length, magic = Trailer.unpack(snapshot.read(Trailer.size))
+            if magic != MAGIC or footer_length > size - Trailer.size:
+                return []
+            snapshot.seek(size - Trailer.size - footer_length)
+            footer = json.loads(snapshot.read(footer_length).decode('utf-8'))
+    except (OSError, ValueError):
+        return []
+    return list(footer.get('appended') or [])
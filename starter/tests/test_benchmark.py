@@ -0,0 +1,54 @@
+import filecmp
+import os
+import tempfile
+import unittest
+
+from benchmark import Filters, benchmark, regressions
+from database import NEODatabase
+from generate_data import generate
+
+
+class TestSyntheticData(unittest.TestCase):
+    """
+    Test Class covering the synthetic data files of the benchmarks.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_generator_deterministic(self):
+        generate(self.path('first.csv'), 2000, seed=1)
+        generate(self.path('second.csv'), 2000, seed=1)
+        generate(self.path('other.csv'), 2000, seed=2)
+
+        self.assertTrue(filecmp.cmp(self.path('first.csv'), self.path('second.csv'), shallow=False))
+        self.assertFalse(filecmp.cmp(self.path('first.csv'), self.path('other.csv'), shallow=False))
+
+    def test_generated_data_loads(self):
+        neos = generate(self.path('neo_data.csv'), 2000)
+        db = NEODatabase(self.path('neo_data.csv'))
+        db.load_data(snapshot=False)
+
+        self.assertEqual(len(db), 2000)
+        self.assertEqual(len(db.neo_names), neos)
+        self.assertLess(neos, 2000)
+
+    def test_benchmark_report(self):
+        generate(self.path('neo_data.csv'), 2000)
+        report = {'results': {'2000': benchmark(self.path('neo_data.csv'), repeat=1)}}
+        cases = report['results']['2000']['cases']
+
+        self.assertEqual(len([case for case in cases if case.startswith('get_objects range ')]),
+                         2 ** len(Filters) - 1)
+        self.assertIn('NEOWriter csv_file', cases)
+        self.assertEqual(regressions(report, report, 0.0), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
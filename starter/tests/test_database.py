@@ -0,0 +1,418 @@
+import csv
+import os
+import pathlib
+import shutil
+import tempfile
+import time
+import unittest
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+import snapshot
+from database import NEODatabase
+from exceptions import SnapshotError
+from models import date_to_ordinal
+from partitions import read_manifest
+from search import Filter, NEOSearcher, Query
+from snapshot import StringHeap, appended_data, read_snapshot, snapshot_path, write_snapshot
+
+
+PROJECT_ROOT = pathlib.Path(__file__).parent.parent
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """
+    Base Test Class with assertions comparing the contents of NEODatabases.
+    """
+
+    def assertSameData(self, db, other):
+        self.assertEqual(db.neo_names, other.neo_names)
+        self.assertEqual(db.neo_ids, other.neo_ids)
+        for name in NEODatabase.Columns:
+            self.assertEqual(list(db.columns[name]), list(other.columns[name]))
+
+
+class TestSnapshot(DatabaseTestCase):
+    """
+    Test Class covering the binary snapshot the NEODatabase caches next to its csv file.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.neo_data_file = os.path.join(self.tmp_dir, 'neo_data.csv')
+        shutil.copy(f'{PROJECT_ROOT}/data/neo_data.csv', self.neo_data_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_snapshot_written_and_used(self):
+        db = NEODatabase(filename=self.neo_data_file)
+        db.load_data()
+        self.assertTrue(os.path.exists(snapshot_path(self.neo_data_file)))
+
+        cached = NEODatabase(filename=self.neo_data_file)
+        cached.load_data()
+        self.assertIsInstance(cached.columns['neo'], memoryview)
+        self.assertSameData(db, cached)
+
+    def test_snapshot_rebuilt_when_csv_changes(self):
+        NEODatabase(filename=self.neo_data_file).load_data()
+        with open(self.neo_data_file) as csv_file:
+            lines = csv_file.readlines()
+        with open(self.neo_data_file, 'w') as csv_file:
+            csv_file.writelines(lines[:len(lines) // 2])
+
+        db = NEODatabase(filename=self.neo_data_file)
+        db.load_data()
+        parsed = NEODatabase(filename=self.neo_data_file)
+        parsed.load_data(snapshot=False)
+        self.assertEqual(len(db), len(lines) // 2 - 1)
+        self.assertSameData(db, parsed)
+
+    def test_dataset_mapped_without_source(self):
+        parsed = NEODatabase(filename=self.neo_data_file)
+        parsed.load_data()
+        os.rename(snapshot_path(self.neo_data_file), os.path.join(self.tmp_dir, 'dataset'))
+        os.remove(self.neo_data_file)
+
+        db = NEODatabase(filename=self.neo_data_file)
+        db.load_dataset(os.path.join(self.tmp_dir, 'dataset'))
+        self.assertIsInstance(db.neo_names, StringHeap)
+        self.assertIsInstance(db.orbit_rows, memoryview)
+        self.assertIsNone(db.name_to_index)
+        self.assertSameData(db, parsed)
+        rows = range(0, len(db), 97)
+        self.assertEqual([repr(db.get_neo(row)) for row in rows], [repr(parsed.get_neo(row)) for row in rows])
+
+    def test_string_tables_decoded_on_access(self):
+        path = os.path.join(self.tmp_dir, 'strings.snapshot')
+        names = ['(2020 AB)', 'Ērosē', '', '433 Eros']
+        columns = {name: array(typecode) for name, typecode in NEODatabase.Columns.items()}
+        write_snapshot(path, {}, columns, ['1', '2', '3', '4'], names)
+
+        snapshot = read_snapshot(path, {})
+        self.assertEqual(len(snapshot.neo_names), 4)
+        self.assertEqual(snapshot.neo_names[1], 'Ērosē')
+        self.assertEqual(snapshot.neo_names[-1], '433 Eros')
+        self.assertEqual(snapshot.neo_names[1:3], names[1:3])
+        self.assertEqual(list(snapshot.neo_names), names)
+
+
+class TestParallelLoad(DatabaseTestCase):
+    """
+    Test Class covering the multi-process csv loader of the NEODatabase.
+    """
+
+    def test_parallel_load_matches_serial_load(self):
+        neo_data_file = f'{PROJECT_ROOT}/data/neo_data.csv'
+        serial = NEODatabase(filename=neo_data_file)
+        serial.load_data(snapshot=False)
+
+        for workers in (2, 5):
+            parallel = NEODatabase(filename=neo_data_file)
+            parallel.load_data(snapshot=False, workers=workers)
+            self.assertSameData(serial, parallel)
+
+
+class TestOrbitIndex(unittest.TestCase):
+    """
+    Test Class covering the aggregation of all orbits onto a single Near Earth Object.
+    """
+
+    def setUp(self):
+        self.db = NEODatabase(filename=f'{PROJECT_ROOT}/data/neo_data.csv')
+        self.db.load_data()
+
+    def test_neo_interned_once(self):
+        self.assertEqual(len(self.db.neo_names), len(set(self.db.neo_names)))
+        self.assertEqual(set(self.db.columns['neo']), set(range(len(self.db.neo_names))))
+
+    def test_neo_view_has_all_orbits(self):
+        neos = self.db.columns['neo']
+        dates = self.db.columns['close_approach_date']
+        for row in range(0, len(self.db), 97):
+            NEO = self.db.get_neo(row)
+            rows = [other for other in range(len(self.db)) if neos[other] == neos[row]]
+
+            self.assertEqual(len(NEO.orbits), len(rows))
+            self.assertTrue(all(orbit.neo_name == NEO.name for orbit in NEO.orbits))
+            self.assertEqual(sorted(dates[other] for other in rows), [dates[other] for other in rows])
+
+    def test_orbit_index_published_after_rows(self):
+        published = []
+
+        class RecordingDatabase(NEODatabase):
+            def __setattr__(self, name, value):
+                if name in ('orbit_offsets', 'orbit_rows') and value is not None:
+                    # A concurrent reader seeing orbit_offsets must find orbit_rows set
+                    published.append((name, getattr(self, 'orbit_rows', None) is not None))
+                object.__setattr__(self, name, value)
+
+        db = RecordingDatabase(filename=f'{PROJECT_ROOT}/data/neo_data.csv')
+        db.load_data(snapshot=False)
+        db.get_orbit_rows(0)
+        self.assertEqual(published, [('orbit_rows', False), ('orbit_offsets', True)])
+
+    def test_concurrent_orbit_lookups(self):
+        db = NEODatabase(filename=f'{PROJECT_ROOT}/data/neo_data.csv')
+        db.load_data(snapshot=False)
+        expected = [len(self.db.get_orbit_rows(neo)) for neo in range(len(db.neo_names))]
+        with ThreadPoolExecutor(8) as executor:
+            counts = list(executor.map(lambda neo: len(db.get_orbit_rows(neo)), range(len(db.neo_names))))
+        self.assertEqual(counts, expected)
+
+
+class TestAppendData(unittest.TestCase):
+    """
+    Test Class covering the incremental append of csv files to a loaded NEODatabase.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.neo_data_file = f'{PROJECT_ROOT}/data/neo_data.csv'
+        with open(self.neo_data_file) as csv_file:
+            self.header, *self.lines = csv_file.readlines()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_csv(self, name, lines):
+        filename = os.path.join(self.tmp_dir, name)
+        with open(filename, 'w') as csv_file:
+            csv_file.writelines([self.header] + lines)
+        return filename
+
+    def orbits(self, db):
+        """
+        :return: list of (name, date, distance, diameter, hazardous) tuples of the rows of a database
+        """
+        names = [db.neo_names[neo] for neo in db.columns['neo']]
+        values = [db.columns[name] for name in NEODatabase.Columns if name != 'neo']
+        return list(zip(names, *values))
+
+    def assertAppended(self, base_lines, delta_lines):
+        base_file = self.write_csv('base.csv', base_lines)
+        delta_file = self.write_csv('delta.csv', delta_lines)
+        db = NEODatabase(filename=base_file)
+        db.load_data(value_indexes=True)
+        db.get_bitmap_index()
+        appended = db.append_data(delta_file)
+
+        full_lines = base_lines + [line for line in delta_lines if line not in base_lines]
+        full = NEODatabase(filename=self.write_csv('full.csv', full_lines))
+        full.load_data(snapshot=False, value_indexes=True)
+        self.assertEqual(appended, len(full) - len(base_lines))
+        self.assertEqual(self.orbits(db), self.orbits(full))
+        self.assertEqual(sorted(db.neo_names), sorted(full.neo_names))
+        self.assertEqual(len(set(db.columns['neo'])), len(db.neo_names))
+
+        # Indexes and statistics are kept in step with the appended rows
+        for name, index in db.value_indexes.items():
+            self.assertEqual(list(index.values), list(full.value_indexes[name].values))
+            self.assertEqual(list(index.rows), list(full.value_indexes[name].rows))
+        orbit_index = [list(db.orbit_offsets), list(db.orbit_rows)]
+        db.index_orbits()
+        self.assertEqual(orbit_index, [list(db.orbit_offsets), list(db.orbit_rows)])
+        bitmap_index = db.get_bitmap_index()
+        self.assertEqual(bitmap_index.hazardous, full.get_bitmap_index().hazardous)
+        self.assertEqual(list(bitmap_index.month_hazardous), list(full.get_bitmap_index().month_hazardous))
+        self.assertEqual(db.get_statistics().hazard_by_year, full.get_statistics().hazard_by_year)
+
+        # The snapshot holds the appended rows
+        reloaded = NEODatabase(filename=base_file)
+        reloaded.load_data()
+        self.assertEqual(self.orbits(reloaded), self.orbits(full))
+
+    def sorted_lines(self):
+        date_column = next(csv.reader([self.header])).index('close_approach_date')
+        return sorted(self.lines, key=lambda line: next(csv.reader([line]))[date_column])
+
+    def test_append_newer_rows(self):
+        lines = self.sorted_lines()
+        middle = len(lines) // 2
+        # The delta repeats the last day of the base, those orbits must not be appended twice
+        self.assertAppended(lines[:middle], lines[middle - 5:])
+
+    def test_appended_snapshot_stays_mapped(self):
+        lines = self.sorted_lines()
+        size = len(lines) // 10
+        base_file = self.write_csv('base.csv', lines[:4 * size])
+        db = NEODatabase(filename=base_file)
+        db.load_data()
+        # Appends fill the spare capacity of the segments, then move them
+        for part in range(4, 10):
+            delta_lines = lines[part * size:(part + 1) * size if part < 9 else len(lines)]
+            self.assertGreater(db.append_data(self.write_csv(f'delta_{part}.csv', delta_lines)), 0)
+
+            reloaded = NEODatabase(filename=base_file)
+            reloaded.load_data()
+            self.assertEqual(self.orbits(reloaded), self.orbits(db))
+            self.assertTrue(all(isinstance(column, memoryview) for column in reloaded.columns.values()))
+            self.assertIsInstance(reloaded.neo_names, StringHeap)
+            self.assertIsInstance(reloaded.orbit_offsets, memoryview)
+            for neo in range(len(reloaded.neo_names)):
+                self.assertEqual(list(reloaded.get_orbit_rows(neo)), list(db.get_orbit_rows(neo)))
+
+    def test_append_to_mapped_data(self):
+        lines = self.sorted_lines()
+        middle = len(lines) // 2
+        base_file = self.write_csv('base.csv', lines[:middle])
+        delta_file = self.write_csv('delta.csv', lines[middle:])
+        base = NEODatabase(filename=base_file)
+        base.load_data()
+        directory = os.path.join(self.tmp_dir, 'partitions')
+        first = base.write_partitions(directory, 'month')[0]
+
+        # Snapshot, dataset and single partition loads all map their columns read-only
+        cached = NEODatabase(filename=base_file)
+        cached.load_data()
+        dataset = NEODatabase(filename=None)
+        dataset.load_dataset(snapshot_path(base_file))
+        partition = NEODatabase(filename=None)
+        partition.load_partitions(directory, (first['start'], first['end']))
+        for db in (cached, dataset, partition):
+            self.assertTrue(all(isinstance(column, memoryview) for column in db.columns.values()))
+            expected = self.orbits(db)
+            appended = db.append_data(delta_file)
+            self.assertEqual(len(db), len(expected) + appended)
+            self.assertEqual(self.orbits(db)[:len(expected)], expected)
+
+        # The snapshot the cached data was loaded from holds the appended rows
+        reloaded = NEODatabase(filename=base_file)
+        reloaded.load_data()
+        self.assertEqual(self.orbits(reloaded), self.orbits(cached))
+
+    def test_append_older_rows(self):
+        lines = self.sorted_lines()
+        middle = len(lines) // 2
+        self.assertAppended(lines[middle:], lines[:middle])
+
+    def test_snapshot_with_appended_rows_kept(self):
+        lines = self.sorted_lines()
+        middle = len(lines) // 2
+        base_file = self.write_csv('base.csv', lines[middle:])
+        db = NEODatabase(filename=base_file)
+        db.load_data()
+        # Older rows rewrite the snapshot, which still lists the appended data
+        delta_file = self.write_csv('delta.csv', lines[:middle])
+        db.append_data(delta_file)
+        self.assertEqual(appended_data(snapshot_path(base_file)), [delta_file])
+
+        with open(snapshot_path(base_file), 'rb') as snapshot_file:
+            contents = snapshot_file.read()
+        self.write_csv('base.csv', lines[middle:-1])
+        with self.assertRaises(SnapshotError):
+            NEODatabase(filename=base_file).load_data()
+        with open(snapshot_path(base_file), 'rb') as snapshot_file:
+            self.assertEqual(snapshot_file.read(), contents)
+
+    @unittest.skipIf(snapshot.fcntl is None, 'Snapshots are only locked where fcntl is available')
+    def test_readers_wait_for_appends(self):
+        base_file = self.write_csv('base.csv', self.lines)
+        db = NEODatabase(filename=base_file)
+        db.load_data()
+        fcntl = snapshot.fcntl
+        with open(snapshot_path(base_file), 'r+b') as snapshot_file, ThreadPoolExecutor(1) as executor:
+            fcntl.flock(snapshot_file.fileno(), fcntl.LOCK_EX)
+            reader = executor.submit(read_snapshot, snapshot_path(base_file))
+            time.sleep(0.1)
+            self.assertFalse(reader.done())
+            fcntl.flock(snapshot_file.fileno(), fcntl.LOCK_UN)
+            self.assertEqual(len(reader.result().neo_names), len(db.neo_names))
+
+
+class TestPartitions(DatabaseTestCase):
+    """
+    Test Class covering partitioned datasets and the pruning of their partitions on load.
+    """
+
+    def setUp(self):
+        self.db = NEODatabase(filename=f'{PROJECT_ROOT}/data/neo_data.csv')
+        self.db.load_data()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.partitions = self.db.write_partitions(self.directory.name, 'month')
+
+    def test_manifest_describes_partitions(self):
+        manifest = read_manifest(self.directory.name)
+        self.assertEqual(manifest['granularity'], 'month')
+        self.assertEqual(manifest['partitions'], self.partitions)
+        self.assertGreater(len(self.partitions), 1)
+        self.assertEqual(sum(partition['rows'] for partition in self.partitions), len(self.db))
+        for partition in self.partitions:
+            self.assertTrue(partition['start'] <= partition['end'])
+            self.assertTrue(os.path.exists(os.path.join(self.directory.name, partition['file'])))
+
+    def test_all_partitions_hold_all_data(self):
+        db = NEODatabase(filename=None)
+        db.load_partitions(self.directory.name)
+        self.assertEqual(db.partitions, [partition['key'] for partition in self.partitions])
+        for name in NEODatabase.Columns:
+            if name != 'neo':
+                self.assertEqual(list(db.columns[name]), list(self.db.columns[name]))
+        self.assertEqual([db.neo_names[neo] for neo in db.columns['neo']],
+                         [self.db.neo_names[neo] for neo in self.db.columns['neo']])
+
+    def test_date_range_loads_overlapping_partition(self):
+        last = self.partitions[-1]
+        query_selectors = Query(
+            start_date='2020-01-05', end_date='2020-01-20', filter=["diameter:>:0.042"], return_object='Path'
+        ).build_query()
+        date_range = (date_to_ordinal('2020-01-05'), date_to_ordinal('2020-01-20'))
+        filters = Filter.create_filter_options(query_selectors.filters)['NEO']
+
+        db = NEODatabase(filename=None)
+        self.assertEqual(db.load_partitions(self.directory.name, date_range, filters), [last['key']])
+        self.assertEqual(len(db), last['rows'])
+        self.assertEqual(
+            [(orbit.neo_name, orbit.close_approach_date) for orbit in NEOSearcher(db).get_objects(query_selectors)],
+            [(orbit.neo_name, orbit.close_approach_date)
+             for orbit in NEOSearcher(self.db).get_objects(query_selectors)]
+        )
+
+    def test_neo_results_fetch_all_orbits(self):
+        last = self.partitions[-1]
+        query_selectors = Query(
+            start_date='2020-01-05', end_date='2020-01-20', filter=["distance:<:30000000"]
+        ).build_query()
+        date_range = (date_to_ordinal('2020-01-05'), date_to_ordinal('2020-01-20'))
+        filters = Filter.create_filter_options(query_selectors.filters)['Path']
+
+        db = NEODatabase(filename=None)
+        self.assertEqual(db.load_partitions(self.directory.name, date_range, filters), [last['key']])
+        rows = db.fetch_orbits(NEOSearcher(db).get_rows(query_selectors))
+        expected = NEOSearcher(self.db).get_objects(query_selectors)
+        self.assertTrue(expected)
+        self.assertEqual([(db.get_neo(row).name, len(db.get_neo(row).orbits)) for row in rows],
+                         [(neo.name, len(neo.orbits)) for neo in expected])
+
+        # Only the earlier orbits of the NEOs found are read from the other partitions
+        name_to_index = self.db.get_name_index()
+        dates = self.db.columns['close_approach_date']
+        earlier = sum(
+            dates[row] < last['start']
+            for neo in expected for row in self.db.get_orbit_rows(name_to_index[neo.name])
+        )
+        self.assertTrue(earlier)
+        self.assertEqual(len(db), last['rows'] + earlier)
+        self.assertEqual(db.fetch_orbits(rows), rows)
+        self.assertEqual(len(db), last['rows'] + earlier)
+
+    def test_filter_bounds_prune_partitions(self):
+        largest = max(self.db.columns['diameter_min_km'])
+        db = NEODatabase(filename=None)
+        filters = Filter.create_filter_options([f'diameter:>:{largest}'])['NEO']
+        self.assertEqual(db.load_partitions(self.directory.name, filters=filters), [])
+        self.assertEqual(len(db), 0)
+
+        dates = self.db.columns['close_approach_date']
+        diameters = self.db.columns['diameter_min_km']
+        expected = [partition['key'] for partition in self.partitions
+                    if any(diameters[row] == largest and partition['start'] <= dates[row] <= partition['end']
+                           for row in range(len(self.db)))]
+        filters = Filter.create_filter_options([f'diameter:>=:{largest}'])['NEO']
+        self.assertEqual(db.load_partitions(self.directory.name, filters=filters), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
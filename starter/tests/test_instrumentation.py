@@ -0,0 +1,72 @@
+import os
+import pathlib
+import pstats
+import tempfile
+import unittest
+
+from database import NEODatabase
+from instrumentation import METRICS, Profiler
+from search import Query, NEOSearcher
+
+
+PROJECT_ROOT = pathlib.Path(__file__).parent.parent
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Test Class covering the timers and counters collected from the database, searcher and writer.
+    """
+
+    def setUp(self):
+        METRICS.reset()
+        self.db = NEODatabase(filename=f'{PROJECT_ROOT}/data/neo_data.csv')
+        self.query_selectors = Query(
+            number=10, start_date='2020-01-01', end_date='2020-12-31', return_object='NEO',
+            filter=["diameter:>:0.042"]
+        ).build_query()
+
+    def tearDown(self):
+        METRICS.enable(False)
+        METRICS.reset()
+
+    def test_disabled_collects_nothing(self):
+        self.db.load_data()
+        NEOSearcher(self.db).get_objects(self.query_selectors)
+
+        self.assertEqual(METRICS.snapshot(), {'timers': {}, 'counters': {}})
+
+    def test_enabled_collects_stages(self):
+        METRICS.enable()
+        self.db.load_data(snapshot=False)
+        results = NEOSearcher(self.db).get_objects(self.query_selectors)
+        snapshot = METRICS.snapshot()
+
+        self.assertEqual(snapshot['counters']['database.rows_parsed'], len(self.db))
+        self.assertGreaterEqual(snapshot['counters']['search.date index scan.rows'],
+                                snapshot['counters']['search.filter diameter > 0.042.rows'])
+        self.assertGreaterEqual(snapshot['counters']['search.filter diameter > 0.042.rows'],
+                                snapshot['counters']['search.unique NEOs.rows'])
+        self.assertEqual(snapshot['counters']['search.limit.rows'], len(results))
+        self.assertEqual(snapshot['counters']['objects.NearEarthObject'], len(results))
+        self.assertEqual(snapshot['counters']['objects.OrbitPath'], sum(len(neo.orbits) for neo in results))
+        self.assertIn('database.load_csv', snapshot['timers'])
+        self.assertEqual(snapshot['timers']['search.get_objects']['calls'], 1)
+
+
+class TestProfiler(unittest.TestCase):
+    """
+    Test Class covering the profiles dumped by the Profiler.
+    """
+
+    def test_cpu_profile_dumped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'neo.cpu.prof')
+            with Profiler('cpu', filename):
+                NEODatabase(filename=f'{PROJECT_ROOT}/data/neo_data.csv').load_data(snapshot=False)
+
+            functions = [function for _, _, function in pstats.Stats(filename).stats]
+        self.assertIn('load_csv', functions)
+
+
+if __name__ == '__main__':
+    unittest.main()
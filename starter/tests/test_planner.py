@@ -0,0 +1,53 @@
+import pathlib
+import unittest
+
+from database import NEODatabase
+from models import date_to_ordinal
+from planner import Statistics
+from search import Filter, Query, NEOSearcher
+
+
+PROJECT_ROOT = pathlib.Path(__file__).parent.parent
+
+
+class TestQueryPlanner(unittest.TestCase):
+    """
+    Test Class covering the column statistics and the plans chosen by the QueryPlanner.
+    """
+
+    def setUp(self):
+        self.db = NEODatabase(filename=f'{PROJECT_ROOT}/data/neo_data.csv')
+        self.db.load_data()
+
+    def test_statistics_collected_on_load(self):
+        self.db.load_data(snapshot=False)
+        self.assertIsNotNone(self.db.statistics)
+        self.assertEqual(self.db.statistics.rows, len(self.db))
+        restored = Statistics.from_dict(self.db.statistics.to_dict())
+        self.assertEqual(restored.hazard_by_year, self.db.statistics.hazard_by_year)
+
+    def test_selectivity_estimates(self):
+        statistics = self.db.get_statistics()
+        date_range = (date_to_ordinal('1900-01-01'), date_to_ordinal('2100-01-01'))
+        column = self.db.columns['miss_distance_kilometers']
+        for value in (1e5, 1e6, 1e7, 5e7):
+            f = Filter('distance', 'Orbit', '<', str(value))
+            actual = sum(1 for distance in column if distance < value) / len(column)
+            self.assertAlmostEqual(statistics.selectivity(f, date_range), actual, delta=0.05)
+
+    def test_explain_matches_search(self):
+        query_selectors = Query(
+            number=10, start_date='2020-01-01', end_date='2020-01-10',
+            filter=["diameter:>:0.042", "is_hazardous:=:True", "distance:>:234989"]
+        ).build_query()
+        searcher = NEOSearcher(self.db)
+        results, plan = searcher.explain(query_selectors)
+
+        self.assertEqual([neo.name for neo in results], [neo.name for neo in searcher.get_objects(query_selectors)])
+        self.assertEqual(plan.stages[-1].actual, len(results))
+        selectivities = [self.db.get_statistics().selectivity(f, plan.date_range) for f in plan.filters]
+        self.assertEqual(selectivities, sorted(selectivities))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,462 @@
+import pathlib
+import unittest
+from types import SimpleNamespace
+
+from database import NEODatabase
+from exceptions import UnsupportedFeature
+from models import OrbitPath, date_to_ordinal, ordinal_to_date, period_bounds
+from search import Filter, Query, NEOSearcher
+
+
+PROJECT_ROOT = pathlib.Path(__file__).parent.parent
+
+
+class TestDateIndex(unittest.TestCase):
+    """
+    Test Class covering the sorted date index of the NEODatabase used by date range searches.
+    """
+
+    def setUp(self):
+        self.neo_data_file = f'{PROJECT_ROOT}/data/neo_data.csv'
+
+        self.db = NEODatabase(filename=self.neo_data_file)
+        self.db.load_data()
+
+    def test_rows_sorted_by_date(self):
+        dates = self.db.columns['close_approach_date']
+        self.assertTrue(all(dates[i] <= dates[i + 1] for i in range(len(dates) - 1)))
+
+    def test_search_dates_matches_scan(self):
+        start_date = date_to_ordinal('2020-01-01')
+        end_date = date_to_ordinal('2020-01-10')
+        dates = self.db.columns['close_approach_date']
+        expected = [row for row in range(len(self.db)) if start_date <= dates[row] <= end_date]
+
+        self.assertEqual(list(self.db.search_dates(start_date, end_date)), expected)
+
+    def test_find_between_dates_without_data(self):
+        query_selectors = Query(
+            number=10, start_date='1900-01-01', end_date='1900-12-31', return_object='NEO'
+        ).build_query()
+        results = NEOSearcher(self.db).get_objects(query_selectors)
+
+        self.assertEqual(results, [])
+
+
+class TestFilterOrder(unittest.TestCase):
+    """
+    Test Class covering the evaluation of the filter clauses in order of their estimated selectivity.
+    """
+
+    def setUp(self):
+        self.db = NEODatabase(filename=f'{PROJECT_ROOT}/data/neo_data.csv')
+        self.db.load_data()
+        self.query_selectors = Query(
+            start_date='2019-12-01', end_date='2020-12-31',
+            filter=["distance:<:1000000000", "distance:>:30000000", "diameter:>:0.3"]
+        ).build_query()
+
+    def test_planner_orders_clauses_by_selectivity(self):
+        searcher = NEOSearcher(self.db)
+        plan = searcher.plan(self.query_selectors)
+        statistics = self.db.get_statistics()
+        selectivities = [statistics.selectivity(f, plan.date_range) for f in plan.filters]
+
+        self.assertEqual(plan.access, 'date')
+        self.assertEqual(selectivities, sorted(selectivities))
+        self.assertEqual([f.value for f in plan.filters], ['0.3', '30000000', '1000000000'])
+
+    def test_compiled_clauses_short_circuit_in_order(self):
+        reads = {}
+
+        class CountingColumn(list):
+            def __init__(self, name, values):
+                super().__init__(values)
+                self.name = name
+
+            def __getitem__(self, row):
+                reads[self.name] = reads.get(self.name, 0) + 1
+                return super().__getitem__(row)
+
+        plan = NEOSearcher(self.db).plan(self.query_selectors)
+        db = SimpleNamespace(columns={name: CountingColumn(name, column) for name, column in self.db.columns.items()})
+        matches = Filter.compile(plan.filters, db)
+        rows = list(self.db.search_dates(*plan.date_range))
+        selected = [row for row in rows if matches(row)]
+
+        diameters = self.db.columns['diameter_min_km']
+        distances = self.db.columns['miss_distance_kilometers']
+        self.assertEqual(selected, [row for row in rows
+                                    if diameters[row] > 0.3 and 30000000 < distances[row] < 1000000000])
+        # The diameter clause is read for every row, the distance clauses only for the rows it keeps
+        self.assertEqual(reads['diameter_min_km'], len(rows))
+        passed = sum(1 for row in rows if diameters[row] > 0.3)
+        passed_both = sum(1 for row in rows if diameters[row] > 0.3 and distances[row] > 30000000)
+        self.assertEqual(reads['miss_distance_kilometers'], passed + passed_both)
+
+
+class TestLazySearch(unittest.TestCase):
+    """
+    Test Class covering the lazy search pipeline: filters on every orbit, then the deduplication and the limit.
+    """
+
+    def setUp(self):
+        self.db = NEODatabase(filename=f'{PROJECT_ROOT}/data/neo_data.csv')
+        self.db.load_data()
+
+    def test_limit_stops_date_scan(self):
+        pulled = []
+
+        class CountingSearcher(NEOSearcher):
+            def access_rows(self, plan):
+                for row in super().access_rows(plan):
+                    pulled.append(row)
+                    yield row
+
+        query_selectors = Query(number=3, start_date='1900-01-01', end_date='2200-12-31').build_query()
+        results = CountingSearcher(self.db).get_objects(query_selectors)
+
+        self.assertEqual(len(results), 3)
+        self.assertLess(len(pulled), len(self.db) // 10)
+        self.assertEqual(pulled, list(range(len(pulled))))
+
+    def test_neo_matches_on_later_orbit(self):
+        start_date, end_date = date_to_ordinal('2019-12-01'), date_to_ordinal('2020-12-31')
+        neos = self.db.columns['neo']
+        distances = self.db.columns['miss_distance_kilometers']
+        first_rows = {}
+        for row in self.db.search_dates(start_date, end_date):
+            first = first_rows.setdefault(neos[row], row)
+            if distances[row] < distances[first]:
+                break
+        else:
+            self.fail('No NEO with a closer later orbit in the window')
+
+        # The first orbit of the NEO in the window fails the filter, the later orbit passes it
+        query_selectors = Query(
+            start_date='2019-12-01', end_date='2020-12-31', filter=[f"distance:<:{distances[first]!r}"]
+        ).build_query()
+        results = NEOSearcher(self.db).get_objects(query_selectors)
+        self.assertIn(self.db.neo_names[neos[row]], [neo.name for neo in results])
+
+
+class TestOrbitSearch(unittest.TestCase):
+    """
+    Test Class covering queries returning OrbitPaths, with filters evaluated on each orbit.
+    """
+
+    def setUp(self):
+        self.db = NEODatabase(filename=f'{PROJECT_ROOT}/data/neo_data.csv')
+        self.db.load_data()
+        self.searcher = NEOSearcher(self.db)
+
+    def test_path_query_returns_every_matching_orbit(self):
+        query_selectors = Query(
+            start_date='2020-01-01', end_date='2020-12-31', return_object='Path', filter=["distance:<:5000000"]
+        ).build_query()
+        results = self.searcher.get_objects(query_selectors)
+
+        start_date, end_date = date_to_ordinal('2020-01-01'), date_to_ordinal('2020-12-31')
+        dates = self.db.columns['close_approach_date']
+        distances = self.db.columns['miss_distance_kilometers']
+        expected = [row for row in range(len(self.db))
+                    if start_date <= dates[row] <= end_date and distances[row] < 5000000]
+
+        self.assertTrue(all(isinstance(orbit, OrbitPath) for orbit in results))
+        self.assertEqual(len(results), len(expected))
+        self.assertTrue(all(orbit.miss_distance_kilometers < 5000000 for orbit in results))
+        self.assertGreater(len(results), len({orbit.neo_name for orbit in results}))
+
+    def test_path_query_number_limits_orbits(self):
+        query_selectors = Query(
+            number=7, start_date='2020-01-01', end_date='2020-12-31', return_object='Path'
+        ).build_query()
+        results = self.searcher.get_objects(query_selectors)
+        _, plan = self.searcher.explain(query_selectors)
+
+        self.assertEqual(len(results), 7)
+        self.assertNotIn('unique NEOs', [stage.name for stage in plan.stages])
+
+    def test_return_object_defaults_to_neo(self):
+        query_selectors = Query(number=5, date='2020-01-01').build_query()
+
+        self.assertEqual(query_selectors.return_object, 'NEO')
+
+
+class TestBatchSearch(unittest.TestCase):
+    """
+    Test Class covering batches of queries searched with shared scans.
+    """
+
+    def setUp(self):
+        self.db = NEODatabase(filename=f'{PROJECT_ROOT}/data/neo_data.csv')
+        self.db.load_data()
+        self.queries = [
+            Query(start_date=start_date, end_date=end_date, number=number, filter=filters,
+                  return_object=return_object).build_query()
+            for start_date, end_date in [('2020-01-01', '2020-03-01'), ('2020-02-01', '2020-06-01'),
+                                         ('2021-01-01', '2021-02-01')]
+            for number in (None, 5)
+            for filters in (None, ["diameter:>:0.042"], ["is_hazardous:=:True", "distance:<:30000000"])
+            for return_object in ('NEO', 'Path')
+        ]
+
+    def test_batch_matches_single_queries(self):
+        batch = NEOSearcher(self.db).get_objects_batch(self.queries)
+        searcher = NEOSearcher(self.db)
+
+        self.assertEqual(len(batch), len(self.queries))
+        for results, query_selectors in zip(batch, self.queries):
+            self.assertEqual([repr(result) for result in results],
+                             [repr(result) for result in searcher.get_objects(query_selectors)])
+
+    def test_batch_results_cached(self):
+        searcher = NEOSearcher(self.db)
+        searcher.get_rows_batch(self.queries[:4])
+        searcher.get_rows_batch(self.queries)
+
+        self.assertEqual(searcher.cache.info().hits, 4)
+        self.assertEqual(searcher.cache.info().entries, len(self.queries))
+
+
+class TestReusableSearcher(unittest.TestCase):
+    """
+    Test Class covering repeated queries against a single loaded NEODatabase.
+    """
+
+    def setUp(self):
+        self.db = NEODatabase(filename=f'{PROJECT_ROOT}/data/neo_data.csv')
+        self.db.load_data()
+
+    def test_repeated_queries_return_same_results(self):
+        query_selectors = Query(
+            number=10, start_date='2020-01-01', end_date='2020-01-10', return_object='NEO',
+            filter=["diameter:>:0.042"]
+        ).build_query()
+        searcher = NEOSearcher(self.db)
+        names = [neo.name for neo in searcher.get_objects(query_selectors)]
+
+        for _ in range(3):
+            self.assertEqual([neo.name for neo in searcher.get_objects(query_selectors)], names)
+            self.assertEqual([neo.name for neo in NEOSearcher(self.db).get_objects(query_selectors)], names)
+
+    def test_search_does_not_modify_database(self):
+        neo_names = list(self.db.neo_names)
+        rows = len(self.db)
+        query_selectors = Query(number=1000, start_date='2019-01-01', end_date='2021-01-01').build_query()
+        NEOSearcher(self.db).get_objects(query_selectors)
+
+        self.assertEqual(self.db.neo_names, neo_names)
+        self.assertEqual(len(self.db), rows)
+
+
+class TestResultCache(unittest.TestCase):
+    """
+    Test Class covering the query result cache of the NEOSearcher.
+    """
+
+    def setUp(self):
+        self.db = NEODatabase(filename=f'{PROJECT_ROOT}/data/neo_data.csv')
+        self.db.load_data()
+        self.searcher = NEOSearcher(self.db)
+
+    def test_equivalent_queries_share_entry(self):
+        first = Query(number=10, start_date='2020-01-01', end_date='2020-01-10',
+                      filter=["diameter:>:0.042", "is_hazardous:=:True"]).build_query()
+        second = Query(number=10, start_date='2020-01-01', end_date='2020-01-10',
+                       filter=["is_hazardous:=:True", "diameter:>:0.0420"]).build_query()
+
+        names = [neo.name for neo in self.searcher.get_objects(first)]
+        self.assertEqual([neo.name for neo in self.searcher.get_objects(second)], names)
+        self.assertEqual(self.searcher.cache.info()[:3], (1, 1, 1))
+
+    def test_cache_invalidated_on_reload(self):
+        query_selectors = Query(number=10, date='2020-01-01').build_query()
+        self.searcher.get_objects(query_selectors)
+        self.db.load_data()
+        self.searcher.get_objects(query_selectors)
+
+        self.assertEqual(self.searcher.cache.info().misses, 2)
+
+    def test_cache_bounded(self):
+        self.searcher.cache.max_entries = 2
+        for day in range(1, 6):
+            self.searcher.get_objects(Query(number=10, date=f'2020-01-0{day}').build_query())
+
+        self.assertEqual(self.searcher.cache.info().entries, 2)
+
+
+class TestValueIndexes(unittest.TestCase):
+    """
+    Test Class covering searches answered through the secondary value indexes.
+    """
+
+    def setUp(self):
+        self.db = NEODatabase(filename=f'{PROJECT_ROOT}/data/neo_data.csv')
+        self.db.load_data()
+        self.indexed_db = NEODatabase(filename=f'{PROJECT_ROOT}/data/neo_data.csv')
+        self.indexed_db.load_data(value_indexes=True)
+
+    def test_value_index_search(self):
+        column = self.db.columns['miss_distance_kilometers']
+        index = self.indexed_db.value_indexes['miss_distance_kilometers']
+        for operation in ('<', '<=', '>', '>='):
+            expected = {row for row in range(len(self.db)) if Filter.Operators[operation](column[row], 5e6)}
+            self.assertEqual(set(index.search(operation, 5e6)), expected)
+
+    def test_indexed_search_matches_scan(self):
+        for filters in (["distance:<:2000000"], ["diameter:>=:1.2", "is_hazardous:=:True"], ["diameter:<:0.02"]):
+            query_selectors = Query(
+                number=1000, start_date='2019-12-01', end_date='2020-02-01', filter=filters
+            ).build_query()
+            expected = [neo.name for neo in NEOSearcher(self.db).get_objects(query_selectors)]
+            results = [neo.name for neo in NEOSearcher(self.indexed_db).get_objects(query_selectors)]
+            self.assertEqual(results, expected)
+
+
+class TestBitmapIndex(unittest.TestCase):
+    """
+    Test Class covering the hazardous flag BitmapIndex and searches answered through it.
+    """
+
+    def setUp(self):
+        self.db = NEODatabase(filename=f'{PROJECT_ROOT}/data/neo_data.csv')
+        self.db.load_data()
+        self.hazards = self.db.columns['is_potentially_hazardous_asteroid']
+
+    def test_bitmap_rows_and_counts(self):
+        bitmap_index = self.db.get_bitmap_index()
+        for start, end in ((0, len(self.db)), (17, 400), (250, 251), (300, 300)):
+            for hazardous in (True, False):
+                expected = [row for row in range(start, end) if self.hazards[row] == hazardous]
+                rows = bitmap_index.iter_rows(bitmap_index.bitmap(hazardous), start, end)
+                self.assertEqual(list(rows), expected)
+                self.assertEqual(bitmap_index.count(hazardous, start, end), len(expected))
+
+    def test_hazardous_search_through_bitmap(self):
+        query_selectors = Query(
+            number=1000, start_date='2019-12-01', end_date='2020-01-31', filter=["is_hazardous:=:True"]
+        ).build_query()
+        searcher = NEOSearcher(self.db)
+        neos = self.db.columns['neo']
+        expected = []
+        for row in self.db.search_dates(*searcher.date_range(query_selectors.date_search)):
+            if self.hazards[row] and neos[row] not in expected:
+                expected.append(neos[row])
+
+        self.assertEqual(searcher.plan(query_selectors).access, 'bitmap')
+        names = [neo.name for neo in searcher.get_objects(query_selectors)]
+        self.assertEqual(names, [self.db.neo_names[neo] for neo in expected])
+
+
+class TestSortedSearch(unittest.TestCase):
+    """
+    Test Class covering queries ordered by a sort option, keeping the top rows.
+    """
+
+    def setUp(self):
+        self.db = NEODatabase(filename=f'{PROJECT_ROOT}/data/neo_data.csv')
+        self.db.load_data()
+        self.searcher = NEOSearcher(self.db)
+        self.rows = list(self.db.search_dates(date_to_ordinal('2020-01-01'), date_to_ordinal('2020-12-31')))
+
+    def test_path_top_distances(self):
+        query_selectors = Query(
+            number=10, start_date='2020-01-01', end_date='2020-12-31', return_object='Path', sort_by='distance'
+        ).build_query()
+        distances = self.db.columns['miss_distance_kilometers']
+        expected = sorted(distances[row] for row in self.rows)[:10]
+
+        results = self.searcher.get_objects(query_selectors)
+        self.assertEqual([orbit.miss_distance_kilometers for orbit in results], expected)
+        self.assertEqual(self.searcher.plan(query_selectors).stages[-1].key, 'top k')
+
+    def test_neo_top_diameters_desc(self):
+        query_selectors = Query(
+            number=5, start_date='2020-01-01', end_date='2020-12-31', sort_by='diameter', desc=True
+        ).build_query()
+        neos = self.db.columns['neo']
+        diameters = self.db.columns['diameter_min_km']
+        best = {}
+        for row in self.rows:
+            best[neos[row]] = max(best.get(neos[row], float('-inf')), diameters[row])
+        expected = sorted(best.values(), reverse=True)[:5]
+
+        results = self.searcher.get_objects(query_selectors)
+        self.assertEqual(len({neo.name for neo in results}), 5)
+        self.assertEqual([neo.diameter_min_km for neo in results], expected)
+
+    def test_batch_matches_single_sorted_queries(self):
+        queries = [
+            Query(number=number, start_date='2020-01-01', end_date='2020-06-30', sort_by='distance', desc=desc,
+                  return_object=return_object, filter=["diameter:>:0.042"]).build_query()
+            for number, desc, return_object in ((3, False, 'NEO'), (8, True, 'Path'), (None, True, 'NEO'))
+        ]
+        expected = [list(NEOSearcher(self.db, cache_size=0).get_rows(query)) for query in queries]
+        self.assertEqual([list(rows) for rows in NEOSearcher(self.db).get_rows_batch(queries)], expected)
+
+    def test_unsupported_sort_option(self):
+        with self.assertRaises(UnsupportedFeature):
+            Query(date='2020-01-01', sort_by='name').build_query()
+
+
+class TestAggregation(unittest.TestCase):
+    """
+    Test Class covering aggregate queries reducing the matching orbits of each period.
+    """
+
+    def setUp(self):
+        self.db = NEODatabase(filename=f'{PROJECT_ROOT}/data/neo_data.csv')
+        self.db.load_data()
+        self.searcher = NEOSearcher(self.db)
+
+    def expected_groups(self, query_selectors, group_by):
+        query_selectors = query_selectors._replace(return_object='Path')
+        groups = {}
+        for orbit in NEOSearcher(self.db, cache_size=0).get_objects(query_selectors):
+            period = period_bounds(date_to_ordinal(orbit.close_approach_date), group_by)[0]
+            groups.setdefault(ordinal_to_date(period), []).append(orbit)
+        return groups
+
+    def test_groups_match_objects(self):
+        query_selectors = Query(start_date='2019-12-20', end_date='2020-02-10').build_query()
+        for group_by in NEOSearcher.GroupOptions:
+            groups = self.searcher.aggregate(query_selectors, group_by, list(NEOSearcher.Aggregates))
+            expected = self.expected_groups(query_selectors, group_by)
+
+            self.assertEqual([group['period'] for group in groups], list(expected))
+            for group in groups:
+                orbits = expected[group['period']]
+                distances = [orbit.miss_distance_kilometers for orbit in orbits]
+                neos = {orbit.neo_name for orbit in orbits}
+                hazardous = {orbit.neo_name for orbit in orbits if orbit.is_potentially_hazardous_asteroid}
+                self.assertEqual(group['count'], len(orbits))
+                self.assertEqual(group['neos'], len(neos))
+                self.assertEqual(group['hazardous'], len(hazardous))
+                self.assertAlmostEqual(group['hazard_ratio'], len(hazardous) / len(neos))
+                self.assertEqual(group['min_distance'], min(distances))
+                self.assertEqual(group['max_distance'], max(distances))
+                self.assertAlmostEqual(group['mean_distance'], sum(distances) / len(distances), places=3)
+
+    def test_filtered_weeks(self):
+        query_selectors = Query(
+            number=3, start_date='2020-01-01', end_date='2020-01-31', filter=["distance:<:20000000"]
+        ).build_query()
+        groups = self.searcher.aggregate(query_selectors, 'week', ['count', 'max_distance'])
+        expected = self.expected_groups(query_selectors._replace(number=None), 'week')
+
+        self.assertEqual(list(groups[0]), ['period', 'count', 'max_distance'])
+        self.assertEqual([group['count'] for group in groups], [len(orbits) for orbits in expected.values()])
+        self.assertTrue(all(group['max_distance'] < 20000000 for group in groups))
+        self.assertTrue(all(date_to_ordinal(group['period']) % 7 == 1 for group in groups))
+
+    def test_unsupported_aggregate(self):
+        query_selectors = Query(date='2020-01-01').build_query()
+        with self.assertRaises(UnsupportedFeature):
+            self.searcher.aggregate(query_selectors, 'year', ['count'])
+        with self.assertRaises(UnsupportedFeature):
+            self.searcher.aggregate(query_selectors, 'day', ['median_distance'])
+
+
+if __name__ == '__main__':
+    unittest.main()
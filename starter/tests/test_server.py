@@ -0,0 +1,57 @@
+import pathlib
+import threading
+import unittest
+
+from database import NEODatabase
+from exceptions import QueryServerError
+from search import Query, NEOSearcher
+from server import NEOServer, remote_query
+
+
+PROJECT_ROOT = pathlib.Path(__file__).parent.parent
+
+
+class TestQueryServer(unittest.TestCase):
+    """
+    Test Class covering queries forwarded to a running NEOServer.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.db = NEODatabase(filename=f'{PROJECT_ROOT}/data/neo_data.csv')
+        cls.db.load_data()
+        cls.server = NEOServer(cls.db, port=0, threads=2)
+        cls.thread = threading.Thread(target=cls.server.serve, daemon=True)
+        cls.thread.start()
+        cls.server.ready.wait(5)
+        cls.address = f'127.0.0.1:{cls.server.port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        cls.thread.join(5)
+
+    def test_remote_query_matches_local_query(self):
+        options = dict(number=10, start_date='2020-01-01', end_date='2020-01-10', filter=["diameter:>:0.042"])
+        local = NEOSearcher(self.db).get_objects(Query(**options).build_query())
+        remote = remote_query(self.address, **options)
+
+        self.assertEqual([repr(neo) for neo in remote], [repr(neo) for neo in local])
+        self.assertEqual([neo.diameter_min_km for neo in remote], [neo.diameter_min_km for neo in local])
+
+    def test_remote_path_query_matches_local_query(self):
+        options = dict(number=10, start_date='2020-01-01', end_date='2020-12-31', return_object='Path',
+                       filter=["distance:<:5000000"])
+        local = NEOSearcher(self.db).get_objects(Query(**options).build_query())
+        remote = remote_query(self.address, **options)
+
+        self.assertEqual([repr(orbit) for orbit in remote], [repr(orbit) for orbit in local])
+        self.assertEqual([orbit.neo_id for orbit in remote], [orbit.neo_id for orbit in local])
+
+    def test_invalid_query_rejected(self):
+        with self.assertRaises(QueryServerError):
+            remote_query(self.address, date='not-a-date')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import io
+import json
+import os
+import pathlib
+import tempfile
+import unittest
+
+from database import NEODatabase
+from search import Query, NEOSearcher
+from writer import NEOWriter, pyarrow
+
+
+PROJECT_ROOT = pathlib.Path(__file__).parent.parent
+
+
+class TestStreamingWriter(unittest.TestCase):
+    """
+    Test Class covering streaming lazily produced results through the NEOWriter.
+    """
+
+    def setUp(self):
+        self.db = NEODatabase(filename=f'{PROJECT_ROOT}/data/neo_data.csv')
+        self.db.load_data()
+        self.query_selectors = Query(
+            number=50, start_date='2020-01-01', end_date='2020-12-31', return_object='NEO'
+        ).build_query()
+        self.searcher = NEOSearcher(self.db)
+
+    def test_display_streams_in_batches(self):
+        stream = io.StringIO()
+        writer = NEOWriter(flush_size=7, stream=stream)
+        writer.write('display', self.searcher.iter_objects(self.query_selectors))
+
+        output = stream.getvalue()
+        expected = self.searcher.get_objects(self.query_selectors)
+        self.assertEqual(output.count('The NEO number #'), len(expected))
+        self.assertIn(f'Found {len(expected)} results', output)
+
+    def test_csv_file_from_generator(self):
+        expected = self.searcher.get_objects(self.query_selectors)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'results.csv')
+            NEOWriter().write('csv_file', self.searcher.iter_objects(self.query_selectors), filename=filename)
+            with open(filename) as file:
+                lines = file.read().splitlines()
+
+        self.assertEqual(len(lines) - 1, sum(len(neo.orbits) for neo in expected))
+
+    def test_aggregates_ndjson(self):
+        groups = self.searcher.aggregate(self.query_selectors, 'week', ['count', 'hazard_ratio'])
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'aggregates.ndjson')
+            NEOWriter().write_aggregates('ndjson', groups, filename)
+            with open(filename) as file:
+                self.assertEqual([json.loads(line) for line in file], groups)
+
+
+class TestColumnarFormats(unittest.TestCase):
+    """
+    Test Class covering the output formats written from the columns of the result orbits.
+    """
+
+    def setUp(self):
+        self.db = NEODatabase(filename=f'{PROJECT_ROOT}/data/neo_data.csv')
+        self.db.load_data()
+        query_selectors = Query(
+            number=50, start_date='2020-01-01', end_date='2020-12-31', return_object='NEO',
+            filter=["is_hazardous:=:True"]
+        ).build_query()
+        searcher = NEOSearcher(self.db)
+        self.results = searcher.get_objects(query_selectors)
+        self.columns = self.db.take_orbits(searcher.get_rows(query_selectors))
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_take_orbits_matches_objects(self):
+        expected = NEOWriter.orbit_columns(self.results).columns
+        for name in ('close_approach_date', 'miss_distance_kilometers'):
+            self.assertEqual(self.columns.columns[name], expected[name])
+        names = [self.columns.neo_names[neo] for neo in self.columns.columns['neo']]
+        self.assertEqual(names, [neo.name for neo in self.results for orbit in neo.orbits])
+
+    def test_take_orbits_tables_hold_only_result_neos(self):
+        self.assertEqual(self.columns.neo_names, [neo.name for neo in self.results])
+        self.assertEqual(self.columns.neo_ids, [neo.id for neo in self.results])
+        self.assertLess(len(self.columns.neo_names), len(self.db.neo_names))
+        self.assertTrue(all(self.columns.columns['is_potentially_hazardous_asteroid']))
+
+    def test_ndjson_from_columns_matches_objects(self):
+        from_columns = os.path.join(self.directory.name, 'columns.ndjson')
+        from_objects = os.path.join(self.directory.name, 'objects.ndjson')
+        NEOWriter().write('ndjson', [], filename=from_columns, columns=self.columns)
+        NEOWriter().write('ndjson', self.results, filename=from_objects)
+
+        with open(from_columns) as columns_file, open(from_objects) as objects_file:
+            lines = [json.loads(line) for line in columns_file]
+            self.assertEqual(lines, [json.loads(line) for line in objects_file])
+        self.assertEqual(len(lines), sum(len(neo.orbits) for neo in self.results))
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_feather_and_parquet_round_trip(self):
+        for format in ('feather', 'parquet'):
+            filename = os.path.join(self.directory.name, f'results.{format}')
+            NEOWriter().write(format, [], filename=filename, columns=self.columns)
+            reader = pyarrow.feather.read_table if format == 'feather' else pyarrow.parquet.read_table
+            table = reader(filename)
+            self.assertEqual(table.column('miss_distance_kilometers').to_pylist(),
+                             list(self.columns.columns['miss_distance_kilometers']))
+
+
+if __name__ == '__main__':
+    unittest.main()
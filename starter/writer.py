@@ -1,5 +1,23 @@
+from array import array
 from enum import Enum
+from itertools import chain, islice
 import csv
+import datetime
+import json
+import os
+import sys
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from database import NEODatabase, OrbitColumns
+from exceptions import UnsupportedFeature
+from instrumentation import METRICS
+from models import OrbitPath, date_to_ordinal, ordinal_to_date
 
 
 class OutputFormat(Enum):
@@ -8,6 +26,11 @@ class OutputFormat(Enum):
     """
     display = 'display'
     csv_file = 'csv_file'
+    ndjson = 'ndjson'
+    # Arrow IPC file format, also known as Feather V2, requires pyarrow
+    feather = 'feather'
+    # Requires pyarrow
+    parquet = 'parquet'
 
     @staticmethod
     def list():
@@ -21,11 +44,38 @@ class NEOWriter(object):
     """
     Python object use to write the results from
     supported output formatting options.
+
+    Results are streamed: any iterable of results is accepted and consumed once, and output is written in
+    batches, so memory use does not grow with the number of results and output does not cost a system call
+    per row.
     """
 
-    def __init__(self):
-        # TODO: How can we use the OutputFormat in the NEOWriter?
-        pass
+    # Default number of results written per batch to the terminal
+    FlushSize = 1024
+
+    # Default buffer size in bytes of the output files
+    BufferSize = 1024 * 1024
+
+    # File extension of the default output file of each file OutputFormat
+    Extensions = {
+        OutputFormat.csv_file.value: 'csv',
+        OutputFormat.ndjson.value: 'ndjson',
+        OutputFormat.feather.value: 'arrow',
+        OutputFormat.parquet.value: 'parquet',
+    }
+
+    # Date ordinal of 1970-01-01, Arrow dates count days from it
+    UnixEpoch = datetime.date(1970, 1, 1).toordinal()
+
+    def __init__(self, flush_size=FlushSize, buffer_size=BufferSize, stream=None):
+        """
+        :param flush_size: int number of results written to the terminal per batch
+        :param buffer_size: int buffer size in bytes of the output files
+        :param stream: text stream to display results on, defaults to sys.stdout
+        """
+        self.flush_size = flush_size
+        self.buffer_size = buffer_size
+        self.stream = stream
 
     def write(self, format, data, **kwargs):
         """
@@ -34,57 +84,250 @@ class NEOWriter(object):
         appropriate instance write function
 
         :param format: str representing the OutputFormat
-        :param data: collection of NearEarthObject or OrbitPath results
+        :param data: iterable of NearEarthObject or OrbitPath results, each NearEarthObject is written as all of its
+        orbits
         :param kwargs: Additional attributes used for formatting
-        output e.g. filename
+        output e.g. filename, or columns: the OrbitColumns of the results, written by the ndjson, feather and
+        parquet formats instead of the objects in data
         :return: bool representing if write successful or not
         """
-        # TODO: Using the OutputFormat, how can we organize
-        # our 'write' logic for output to stdout vs to csvfile
-        # TODO: into instance methods for NEOWriter? Write instance
-        # methods that write() can call to do the necessary
-        # TODO: output format.
         if format == OutputFormat.display.value:
             self.display(data)
-        else:
-            self.write_to_csv(data)
+            return True
 
+        filename = kwargs.get('filename') or f'./results.{NEOWriter.Extensions[format]}'
+        if format == OutputFormat.csv_file.value:
+            self.write_to_csv(data, filename)
+            return True
+
+        columns = kwargs.get('columns') or self.orbit_columns(data)
+        if not len(columns.columns['neo']):
+            print("No results found, try different search.")
+            return True
+
+        METRICS.count('writer.rows', len(columns.columns['neo']))
+        with METRICS.timer(f'writer.{format}'):
+            if format == OutputFormat.ndjson.value:
+                self.write_to_ndjson(columns, filename)
+            else:
+                table = self.arrow_table(columns)
+                if format == OutputFormat.feather.value:
+                    pyarrow.feather.write_feather(table, filename)
+                else:
+                    pyarrow.parquet.write_table(table, filename)
+        if METRICS.enabled:
+            METRICS.count('writer.bytes', os.path.getsize(filename))
+
+        self.nice_print()
+        print(f"Results can be found at {filename} file.")
+        self.nice_print()
         return True
 
-    @classmethod
-    def display(self, data):
-        if(len(data) == 0):
+    def write_aggregates(self, format, groups, filename=None):
+        """
+        Writes the periods of an aggregate query, see NEOSearcher.aggregate: a table on the terminal, or one
+        row per period in the output file.
+
+        :param format: str representing the OutputFormat
+        :param groups: list of dicts with the 'period' start date and the value of each aggregate
+        :param filename: str output file name, defaults to ./aggregates.<extension>
+        :return: bool representing if write successful or not
+        """
+        if not groups:
             print("No results found, try different search.")
-        else:
-            self.nice_print()
-            print(f'Found {len(data)} results for the given search criteria')
-            self.nice_print()
-            for i in range(len(data)):
-                print(f'The NEO number #{i}')
-                self.nice_print()
-                print(data[i])
-                self.nice_print()
-
-    @classmethod
-    def nice_print(self):
+            return True
+
+        names = list(groups[0])
+        if format == OutputFormat.display.value:
+            stream = self.stream or sys.stdout
+            widths = [max(len(name), 14) for name in names]
+            lines = [' '.join(f'{name:>{width}}' for name, width in zip(names, widths))]
+            for group in groups:
+                lines.append(' '.join(
+                    f'{value:>{width}.3f}' if isinstance(value, float) else f'{value:>{width}}'
+                    for value, width in zip(group.values(), widths)
+                ))
+            stream.write('\n'.join(lines) + '\n')
+            stream.flush()
+            return True
+
+        filename = filename or f'./aggregates.{NEOWriter.Extensions[format]}'
+        with METRICS.timer(f'writer.{format}'):
+            if format == OutputFormat.csv_file.value:
+                with open(filename, 'w', newline='', buffering=self.buffer_size) as file:
+                    writer = csv.writer(file)
+                    writer.writerow(names)
+                    writer.writerows(group.values() for group in groups)
+            elif format == OutputFormat.ndjson.value:
+                encode = json.JSONEncoder().encode
+                with open(filename, 'w', buffering=self.buffer_size) as file:
+                    file.writelines(encode(group) + '\n' for group in groups)
+            else:
+                if pyarrow is None:
+                    raise UnsupportedFeature('The feather and parquet output formats require pyarrow to be installed')
+                table = pyarrow.table({name: [group[name] for group in groups] for name in names})
+                if format == OutputFormat.feather.value:
+                    pyarrow.feather.write_feather(table, filename)
+                else:
+                    pyarrow.parquet.write_table(table, filename)
+
+        self.nice_print()
+        print(f"Results can be found at {filename} file.")
+        self.nice_print()
+        return True
+
+    @METRICS.timed('writer.display')
+    def display(self, data):
+        stream = self.stream or sys.stdout
+        results = iter(data)
+        first = next(results, None)
+        if first is None:
+            print("No results found, try different search.", file=stream)
+            return
+
+        line = '=' * 50
+        try:
+            if hasattr(data, '__len__'):
+                stream.write(f'{line}\nFound {len(data)} results for the given search criteria\n{line}\n')
+
+            count = 0
+            results = chain([first], results)
+            while True:
+                batch = [f'The {"orbit" if isinstance(result, OrbitPath) else "NEO"} number #{count + i}\n'
+                         f'{line}\n{result!r}\n{line}\n'
+                         for i, result in enumerate(islice(results, self.flush_size))]
+                if not batch:
+                    break
+                count += len(batch)
+                text = ''.join(batch)
+                stream.write(text)
+                METRICS.count('writer.rows', len(batch))
+                METRICS.count('writer.bytes', len(text))
+
+            if not hasattr(data, '__len__'):
+                stream.write(f'{line}\nFound {count} results for the given search criteria\n{line}\n')
+            stream.flush()
+        except BrokenPipeError:
+            # The reader of a pipe went away (e.g. | head), silence the remaining output
+            os.dup2(os.open(os.devnull, os.O_WRONLY), stream.fileno())
+
+    @staticmethod
+    def nice_print():
         print('='*50)
 
-    @classmethod
-    def write_to_csv(self, data):
-        if(len(data) == 0):
+    @METRICS.timed('writer.csv_file')
+    def write_to_csv(self, data, filename='./results.csv'):
+        results = iter(data)
+        first = next(results, None)
+        if first is None:
             print("No results found, try different search.")
-        else:
-            self.nice_print()
-            print("Results can be found at results.csv file.")
-            self.nice_print()
-            with open('./results.csv', 'w', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow(["NEO_id", "NEO_name",
-                                 "miss_distance", "orbit_date"])
-                for i in range(len(data)):
-                    for j in range(len(data[i].orbits)):
-                        writer.writerow([data[i].id, data[i].name,
-                                         data[i].orbits[j].miss_distance_kilometers,
-                                         data[i].orbits[j].close_approach_date])
-
-            file.close()
+            return
+
+        self.nice_print()
+        print(f"Results can be found at {filename} file.")
+        self.nice_print()
+        with open(filename, 'w', newline='', buffering=self.buffer_size) as file:
+            writer = csv.writer(file)
+            writer.writerow(["NEO_id", "NEO_name",
+                             "miss_distance", "orbit_date"])
+            writer.writerows(
+                (orbit.neo_id, orbit.neo_name, orbit.miss_distance_kilometers, orbit.close_approach_date)
+                for orbit in METRICS.counting(self.orbits(chain([first], results)), 'writer.rows')
+            )
+        if METRICS.enabled:
+            METRICS.count('writer.bytes', os.path.getsize(filename))
+
+    @staticmethod
+    def orbits(data):
+        """
+        :param data: iterable of NearEarthObject or OrbitPath results
+        :return: generator of the OrbitPaths of the results, all orbits of each NearEarthObject
+        """
+        for result in data:
+            if isinstance(result, OrbitPath):
+                yield result
+            else:
+                yield from result.orbits
+
+    @staticmethod
+    def orbit_columns(data):
+        """
+        Gathers the per-orbit columns of results that are only available as objects, e.g. results of a query
+        server.
+
+        :param data: iterable of NearEarthObject or OrbitPath results
+        :return: OrbitColumns
+        """
+        columns = {name: array(typecode) for name, typecode in NEODatabase.Columns.items()}
+        neo_ids = []
+        neo_names = []
+        local = {}
+        for orbit in NEOWriter.orbits(data):
+            neo = local.get(orbit.neo_name)
+            if neo is None:
+                neo = local[orbit.neo_name] = len(neo_names)
+                neo_ids.append(orbit.neo_id)
+                neo_names.append(orbit.neo_name)
+            columns['neo'].append(neo)
+            columns['close_approach_date'].append(date_to_ordinal(orbit.close_approach_date))
+            columns['miss_distance_kilometers'].append(orbit.miss_distance_kilometers)
+            columns['diameter_min_km'].append(orbit.diameter_min_km)
+            columns['is_potentially_hazardous_asteroid'].append(orbit.is_potentially_hazardous_asteroid)
+        return OrbitColumns(columns, neo_ids, neo_names)
+
+    def write_to_ndjson(self, columns, filename):
+        """
+        Writes one JSON object per orbit and line.
+
+        :param columns: OrbitColumns of the results
+        :param filename: str output file name
+        :return: None
+        """
+        neo_ids, neo_names, columns = columns.neo_ids, columns.neo_names, columns.columns
+        encode = json.JSONEncoder().encode
+        lines = (
+            encode({
+                'neo_id': neo_ids[neo],
+                'neo_name': neo_names[neo],
+                'close_approach_date': ordinal_to_date(date),
+                'miss_distance_kilometers': distance,
+                'diameter_min_km': diameter,
+                'is_potentially_hazardous_asteroid': bool(hazardous),
+            }) + '\n'
+            for neo, date, distance, diameter, hazardous in zip(
+                columns['neo'], columns['close_approach_date'], columns['miss_distance_kilometers'],
+                columns['diameter_min_km'], columns['is_potentially_hazardous_asteroid'])
+        )
+        with open(filename, 'w', buffering=self.buffer_size) as file:
+            file.writelines(lines)
+
+    @staticmethod
+    def arrow_table(columns):
+        """
+        Creates an Arrow table of the results. The numeric columns are wrapped without copying, names and ids
+        are dictionary encoded on the 'neo' column, so the dictionaries hold the Near Earth Objects of the
+        OrbitColumns tables only.
+
+        :param columns: OrbitColumns of the results
+        :return: pyarrow.Table
+        """
+        if pyarrow is None:
+            raise UnsupportedFeature('The feather and parquet output formats require pyarrow to be installed')
+
+        neo_ids, neo_names, columns = columns.neo_ids, columns.neo_names, columns.columns
+        length = len(columns['neo'])
+
+        def wrap(type, values):
+            return pyarrow.Array.from_buffers(type, length, [None, pyarrow.py_buffer(values)])
+
+        neo = wrap(pyarrow.int32(), columns['neo'])
+        days = array('i', [date - NEOWriter.UnixEpoch for date in columns['close_approach_date']])
+        return pyarrow.table({
+            'neo_id': pyarrow.DictionaryArray.from_arrays(neo, pyarrow.array(neo_ids, pyarrow.string())),
+            'neo_name': pyarrow.DictionaryArray.from_arrays(neo, pyarrow.array(neo_names, pyarrow.string())),
+            'close_approach_date': wrap(pyarrow.date32(), days),
+            'miss_distance_kilometers': wrap(pyarrow.float64(), columns['miss_distance_kilometers']),
+            'diameter_min_km': wrap(pyarrow.float64(), columns['diameter_min_km']),
+            'is_potentially_hazardous_asteroid':
+                wrap(pyarrow.int8(), columns['is_potentially_hazardous_asteroid']).cast(pyarrow.bool_()),
+        })